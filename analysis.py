@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from json_index import build_index, index_from_dict
+from parser import LazyBody
+
+# Worker processes that index captured responses; 0 indexes them inline,
+# the default on a single core.
+_CPUS = os.cpu_count() or 1
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(4, _CPUS) if _CPUS > 1 else 0)))
+# Bodies smaller than this are indexed inline, where a round trip to a
+# worker would cost more than the walk.
+ANALYSIS_MIN_BYTES = int(os.getenv("ANALYSIS_MIN_BYTES", str(64 * 1024)))
+ANALYSIS_TIMEOUT_S = float(os.getenv("ANALYSIS_TIMEOUT_S", "30"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if ANALYSIS_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawned, not forked: the app process runs browser and store threads
+            _pool = ProcessPoolExecutor(ANALYSIS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def analyze_body(raw: bytes) -> Optional[Dict[str, Any]]:
+    """Index one JSON body; runs in a worker process, so it takes and
+    returns plain data."""
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    return build_index(data).to_dict()
+
+
+def _body(api: Dict[str, Any]) -> Optional[bytes]:
+    data = api.get("data")
+    if isinstance(data, LazyBody):
+        return data.raw
+    if not data:
+        return None
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def precompute_indexes(apis: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the structural index of every captured response that has none
+    yet and store it on the record as ``index``, large bodies in parallel
+    on the worker pool.
+
+    Whatever is not done within ``ANALYSIS_TIMEOUT_S`` is left to be
+    indexed on first use. Returns counts and timings for the capture stats.
+    """
+    start = time.perf_counter()
+    pending = [a for a in apis if a.get("index") is None and a.get("data")]
+    pool = _get_pool()
+    futures = []
+    inline = 0
+    for api in pending:
+        raw = _body(api)
+        if pool is not None and len(raw) >= ANALYSIS_MIN_BYTES:
+            try:
+                futures.append((api, pool.submit(analyze_body, raw)))
+                continue
+            except (BrokenProcessPool, RuntimeError):
+                _discard_pool()
+                pool = None
+        if isinstance(api["data"], LazyBody):
+            state = analyze_body(raw)
+            api["index"] = index_from_dict(state) if state else None
+        else:
+            api["index"] = build_index(api["data"])
+        inline += 1
+
+    deadline = time.monotonic() + ANALYSIS_TIMEOUT_S
+    skipped = 0
+    for api, future in futures:
+        try:
+            state = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            skipped += 1
+            continue
+        except BrokenProcessPool:
+            _discard_pool()
+            skipped += 1
+            continue
+        if state is not None:
+            api["index"] = index_from_dict(state)
+
+    return {
+        "indexed": len(pending) - skipped,
+        "in_workers": len(futures) - skipped,
+        "inline": inline,
+        "skipped": skipped,
+        "workers": ANALYSIS_WORKERS,
+        "ms": round((time.perf_counter() - start) * 1000, 1),
+    }
@@ -1,56 +1,171 @@
 
+import io
 import os
 import re
 import json
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+import math
+import time
+from itertools import islice
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, flash, session, g
 from flask_wtf.csrf import CSRFProtect
 
 
-from scraper import fetch_webpage
-from parser import (
-    extract_json_response,
-    find_arrays,
-    extract_id_objects,
-    extract_objects_model3,
-    find_numeric_object_path,
-    get_by_dotpath
-)
-
-from database import Base, engine, SessionLocal, API, Data, Mapper, Tag, api_tags, db_session
+import click
+from scraper import (capture_webpage, fetch_webpages, site_url, BATCH_CONCURRENCY, BATCH_MAX_URLS,
+                     BATCH_TIMEOUT_S, BATCH_TIMEOUT_S_MAX)
+from browser_pool import get_pool
+from capture_cache import get_capture_cache
+from capture_store import capture_store
+from parser import get_by_dotpath, resolve_data
+from sampling import sample
+from schema import infer_columns
+from json_index import build_index
+from json_stream import ingest
+from analysis import precompute_indexes
+from mapping import compiled_mapping
+from jsonpath import compile_query, format_path
+from tree import TREE_PAGE_SIZE, node_page, parse_stored
+from columnar import FORMATS, columnar_batches, csv_chunks, ndjson_chunks, export
+from materialize import MATERIALIZE_BATCH_ROWS, materialize, sql_identifier, table_name_for
+
+from database import Base, engine, SessionLocal, API, Data, Mapper, Tag, KeyPath, api_tags, db_session, insert_api, upsert_api, load_response, ResponseBlob
+from migrations import ensure_schema
 from sqlalchemy import create_engine, Column, Integer, Text, String, ForeignKey, Table, func
-from tags import add_tags_to_api, remove_tag_from_api, get_apis_by_tag, get_all_tags
+from sqlalchemy.orm import load_only, selectinload
+from counts import count_cache
+from search import SEARCH_TYPEAHEAD_LIMIT, filter_by_url, search_urls
+from key_paths import KEY_PATHS_PAGE_SIZE, backfill_key_paths, find_apis, store_key_paths
+from tags import add_tags_to_api, remove_tag_from_api, get_apis_by_tag, get_all_tags, tag_counts, invalidate_tag_counts
 #from flask_wtf.csrf import CSRFProtect
 
-Base.metadata.create_all(bind=engine)
+ensure_schema(engine)
 
 app = Flask(__name__)
 app.secret_key = "secret"
 app.config['MAX_CONTENT_LENGTH'] = 1 * 1024 * 1024
+# /upload-response parses as it reads, so it gets its own, much larger cap
+STREAM_UPLOAD_MAX_MB = int(os.getenv("STREAM_UPLOAD_MAX_MB", "512"))
+# rows /run-mapping returns unless ?limit= asks for another page size
+MAPPING_RUN_LIMIT = int(os.getenv("MAPPING_RUN_LIMIT", "1000"))
+MAPPING_RUN_MAX = int(os.getenv("MAPPING_RUN_MAX", "100000"))
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "100"))
+SAVED_APIS_PAGE_SIZE = int(os.getenv("SAVED_APIS_PAGE_SIZE", "50"))
+SAVED_APIS_MAX_PAGE_SIZE = int(os.getenv("SAVED_APIS_MAX_PAGE_SIZE", "500"))
+QUERY_MAX_PAGE_SIZE = int(os.getenv("QUERY_MAX_PAGE_SIZE", "10000"))
 app.config['WTF_CSRF_ENABLED'] = True
 app.config['WTF_CSRF_SECRET_KEY'] = 'a-secure-secret-key'  # Change this to a secure secret key
 
+
+@app.before_request
+def _upload_limit():
+    # registered ahead of CSRFProtect, which parses the form to find its token
+    if request.endpoint == "upload_response":
+        request.max_content_length = STREAM_UPLOAD_MAX_MB * 1024 * 1024
+
+
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
-_cached_apis = []
 
 
 @app.template_test('in')
 def is_in(collection, value):
     return value in collection
 
-def get_or_create_api(api_url_str, response_obj):
-    
+
+def _capture_id():
+    return getattr(g, "capture_id", None) or request.values.get("capture_id") or session.get("capture_id")
+
+
+def _current_capture():
+    return capture_store.get(_capture_id())
+
+
+def _capture_data(api_url):
+    capture = _current_capture()
+    return capture.data(api_url) if capture else None
+
+
+def _capture_index(api_url):
+    """Response data and its memoized structural index."""
+    capture = _current_capture()
+    if capture is None:
+        return None, build_index(None)
+    return capture.data(api_url), capture.index(api_url)
+
+
+def _start_capture(site, apis, stats=None):
+    # index every response now, so results can list what each one holds
+    analysis = precompute_indexes(apis)
+    if stats is not None:
+        stats["analysis"] = analysis
+    capture = capture_store.put(site, apis, stats)
+    session["capture_id"] = capture.id
+    g.capture_id = capture.id
+    return capture
+
+
+@app.context_processor
+def inject_capture_id():
+    return {"capture_id": _capture_id() or ""}
+
+def _capture_shape(api_url):
+    """Shape fingerprint of a captured response, from its memoized index."""
+    capture = _current_capture()
+    if capture is None or capture.get(api_url) is None:
+        return None
+    return capture.index(api_url).shape_hash()
+
+
+def _truncated_save_error(api_url):
+    """A 400 if the current capture holds only a preview of this response,
+    as it does for streamed uploads: stored as the API's response, it would
+    be all that later stored runs and key-path lookups see."""
+    capture = _current_capture()
+    record = capture.get(api_url) if capture is not None else None
+    if record and record.get("truncated"):
+        return jsonify({"error": "only a preview of this streamed upload is kept, so it cannot be saved; "
+                                 "paste or fetch the full response to save a mapping for it"}), 400
+    return None
+
+
+def _capture_paths(api_url):
+    """Key paths of a captured response and the JSON types at each."""
+    capture = _current_capture()
+    if capture is None or capture.get(api_url) is None:
+        return None
+    return capture.index(api_url).paths
+
+
+def _shape_matches(shape_hash):
+    """Saved mappings of APIs whose responses have this shape."""
+    if not shape_hash:
+        return []
     with db_session() as session:
-        existing = session.query(API).filter(API.api == api_url_str).first()
-        if existing:
-            return existing.id 
+        rows = (
+            session.query(Data, API.api)
+            .join(Mapper, Mapper.data_id == Data.id)
+            .join(API, API.id == Mapper.api_id)
+            .filter(API.shape_hash == shape_hash)
+            .order_by(Data.id)
+            .all()
+        )
+    matches = {}
+    for d, api_url in rows:
+        matches.setdefault(d.id, {"data_id": d.id, "mode": d.mode, "keys": d.keys, "api_url": api_url})
+    return list(matches.values())
 
-       
-        api = API(api=api_url_str, response=json.dumps(response_obj))
-        session.add(api)
-        session.commit()
-        session.refresh(api)
-        return api.id
+
+def get_or_create_api(api_url_str, response_obj, shape_hash=None, paths=None):
+    
+    with db_session() as session:
+        api_id, created = insert_api(session, api_url_str, json.dumps(response_obj), shape_hash)
+        if created:
+            count_cache.invalidate("apis")
+            if paths is not None:
+                # the response was stored just now; index the key paths it has
+                store_key_paths(session, api_id, paths)
+                session.commit()
+        return api_id
 
 
 def save_data_and_get_id(mode, keys_list, mapping_json):
@@ -68,10 +183,29 @@ def save_data_and_get_id(mode, keys_list, mapping_json):
 
 def create_mapper(api_id, data_id):
     with db_session() as session:
+        if session.get(Mapper, (api_id, data_id)) is not None:
+            return
         m = Mapper(api_id=api_id, data_id=data_id)
         session.add(m)
         session.commit()
 
+
+def find_shared_data(shape_hash, mode, keys_list, mapping_json):
+    """A saved ``Data`` row identical to this mapping on an API of the same shape."""
+    if not shape_hash:
+        return None
+    keys_text, mapping_text = json.dumps(keys_list), json.dumps(mapping_json)
+    with db_session() as session:
+        d = (
+            session.query(Data)
+            .join(Mapper, Mapper.data_id == Data.id)
+            .join(API, API.id == Mapper.api_id)
+            .filter(API.shape_hash == shape_hash, Data.mode == str(mode),
+                    Data.keys == keys_text, Data.mapping == mapping_text)
+            .first()
+        )
+        return d.id if d else None
+
 @app.route("/")
 def home():
     return render_template("home.html")
@@ -89,13 +223,11 @@ def header_mode():
 
 @app.route("/submit-header", methods=["POST"])
 def submit_header():
-    global _cached_apis
-
     headers = request.form.get("headers", "").strip()
     response_text = request.form.get("response", "")
 
     if response_text and len(response_text.encode("utf-8")) > 1 * 1024 * 1024:
-        return "❌ Error: Response too large."
+        return "❌ Error: Response too large. Upload it as a file instead."
 
     try:
         json_data = json.loads(response_text)
@@ -104,102 +236,233 @@ def submit_header():
 
     api_label = headers if headers else "pasted-input"
 
-    _cached_apis = [{
+    _start_capture(api_label, [{
         "url": api_label,
         "status": 200,
         "method": "PASTE",
-        "data": json_data
-    }]
+        "data": json_data,
+        "size": len(response_text)
+    }])
+
+    return render_template("choose_mode.html", api_url=api_label, shape_matches=_shape_matches(_capture_shape(api_label)))
+
+
+@app.route("/upload-response", methods=["POST"])
+def upload_response():
+    """Stream a large JSON response in, either as the ``response_file``
+    field of a multipart form or as the raw request body (label in ``?url=``,
+    CSRF token in ``X-CSRFToken``). Only a preview and the structural index
+    are kept."""
+    upload = request.files.get("response_file")
+    if upload is not None and upload.filename:
+        stream = upload.stream
+        headers = request.form.get("headers", "").strip()
+    else:
+        stream = request.stream
+        headers = request.args.get("url", "").strip()
+
+    try:
+        preview, index, size = ingest(stream)
+    except ValueError:
+        return "Invalid JSON"
+
+    api_label = headers if headers else "pasted-input"
+
+    _start_capture(api_label, [{
+        "url": api_label,
+        "status": 200,
+        "method": "UPLOAD",
+        "data": preview,
+        "size": size,
+        "index": index,
+        "truncated": True
+    }])
 
-    return render_template("choose_mode.html", api_url=api_label)
+    return render_template("choose_mode.html", api_url=api_label, shape_matches=_shape_matches(index.shape_hash()))
 
 
 @app.route("/fetch", methods=["POST"])
 def fetch():
-    global _cached_apis
-
-    url = request.form.get("url", "").strip()
+    url = site_url(request.form.get("url", ""))
     if not url:
         return redirect(url_for("url_mode"))
 
-    if not url.startswith("http"):
-        url = "https://" + url
+    wait_mode = request.form.get("wait_mode") or None
+    refresh = request.form.get("refresh") in ("1", "on", "true")
+    capture = capture_webpage(url, wait_mode=wait_mode, refresh=refresh)
+    apis = _start_capture(url, capture["apis"], capture["stats"]).listing()
+
+    return render_template("results.html", apis=apis, site=url, stats=capture["stats"])
+
+
+@app.route("/fetch-batch", methods=["POST"])
+@csrf.exempt
+def fetch_batch():
+    """Capture up to ``BATCH_MAX_URLS`` sites. Concurrency is capped at the
+    shared browser pool's capacity (``BROWSER_POOL_SIZE`` x
+    ``BROWSER_POOL_CONTEXTS``) and the per-site timeout at
+    ``BATCH_TIMEOUT_S_MAX``; the ``X-Batch-Concurrency`` and
+    ``X-Batch-Timeout`` headers have the values used."""
+    payload = request.get_json(silent=True) or {}
+    urls = payload.get("urls")
+    if urls is None:
+        urls = request.form.get("urls", "").split()
+    if not urls:
+        return jsonify({"error": "urls is required"}), 400
+    if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+        return jsonify({"error": "urls must be a list of strings"}), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({"error": f"at most {BATCH_MAX_URLS} urls per batch"}), 400
+
+    try:
+        concurrency = int(payload.get("concurrency") or request.form.get("concurrency") or BATCH_CONCURRENCY)
+        timeout_s = float(payload.get("timeout") or request.form.get("timeout") or BATCH_TIMEOUT_S)
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency and timeout must be numbers"}), 400
+    if not math.isfinite(timeout_s) or timeout_s <= 0:
+        return jsonify({"error": "timeout must be a positive number of seconds"}), 400
+
+    pool = get_pool()
+    concurrency = min(max(concurrency, 1), pool.capacity)
+    timeout_s = min(timeout_s, BATCH_TIMEOUT_S_MAX)
+    wait_mode = payload.get("wait_mode") or request.form.get("wait_mode") or None
+    refresh = bool(payload.get("refresh")) or request.form.get("refresh") in ("1", "on", "true")
+    results = fetch_webpages(urls, concurrency=concurrency, timeout_s=timeout_s,
+                             wait_mode=wait_mode, refresh=refresh, pool=pool)
+    response = jsonify(results)
+    response.headers["X-Batch-Concurrency"] = str(concurrency)
+    response.headers["X-Batch-Timeout"] = f"{timeout_s:g}"
+    return response
+
+
+@app.cli.command("fetch-batch")
+@click.argument("url_file", type=click.File("r"))
+@click.option("--out", type=click.File("w"), default="-", help="NDJSON output, one line per site.")
+@click.option("--concurrency", default=BATCH_CONCURRENCY, show_default=True)
+@click.option("--timeout", "timeout_s", default=BATCH_TIMEOUT_S, show_default=True, help="Seconds per site.")
+@click.option("--browsers", default=1, show_default=True)
+@click.option("--wait-ms", default=5000, show_default=True)
+@click.option("--wait-mode", type=click.Choice(["fixed", "adaptive"]), default=None)
+@click.option("--quiet-ms", type=int, default=None, help="Adaptive mode quiet window.")
+@click.option("--refresh", is_flag=True, help="Ignore the capture cache.")
+def fetch_batch_command(url_file, out, concurrency, timeout_s, browsers, wait_ms, wait_mode, quiet_ms, refresh):
+    """Capture every URL in URL_FILE (one per line) and write the records."""
+    from browser_pool import BrowserPool
+
+    urls = [line.strip() for line in url_file if line.strip() and not line.startswith("#")]
+    contexts = -(-concurrency // browsers)
+
+    def write(result):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    with BrowserPool(browsers=browsers, contexts_per_browser=contexts) as pool:
+        results = fetch_webpages(
+            urls, concurrency=concurrency, timeout_s=timeout_s,
+            wait_ms=wait_ms, pool=pool, on_result=write,
+            wait_mode=wait_mode, quiet_ms=quiet_ms, refresh=refresh
+        )
+
+    failed = sum(1 for r in results if r["error"])
+    click.echo(f"captured {len(results) - failed}/{len(results)} sites", err=True)
+
+
+@app.route("/cache-stats")
+def cache_stats():
+    cache = get_capture_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(cache.stats(), enabled=True))
 
-    _cached_apis = fetch_webpage(url)
-    apis = [a for a in _cached_apis if a.get("data")]
 
-    return render_template("results.html", apis=apis, site=url)
+@app.route("/browser-pool")
+def browser_pool_health():
+    return jsonify(get_pool().check_health())
 
 
 @app.route("/response", methods=["POST"])
 def response():
     url = request.form.get("api_url")
-    data = extract_json_response(_cached_apis, url)
-    pretty = json.dumps(data, indent=2)
-    return render_template("response.html", api_url=url, data=pretty)
+    capture = _current_capture()
+    record = (capture.get(url) if capture else None) or {}
+    truncated = bool(record.get("truncated"))
+    # the page only loads the tree a node at a time from /tree
+    return render_template("response.html", api_url=url, truncated=truncated, size=record.get("size"))
+
+
+def _stored_document(api_id):
+    """URL and parsed stored response of an API, ``(None, None)`` if there
+    is none; ``ValueError`` if the body is not JSON."""
+    with db_session() as session:
+        api = session.get(API, api_id)
+        if api is None:
+            return None, None
+        # a memoized parse skips reading and decompressing the blob
+        return api.api, parse_stored(api.response_hash, lambda: load_response(session, api))
+
+
+@app.route("/tree")
+def response_tree():
+    """Children of one node of a captured (``api_url``) or stored
+    (``api_id``) response; ``path`` is a JSON list of keys and positions."""
+    try:
+        path = json.loads(request.args.get("path") or "[]")
+        offset = max(0, int(request.args.get("offset", 0)))
+        limit = min(max(1, int(request.args.get("limit", TREE_PAGE_SIZE))), QUERY_MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not isinstance(path, list):
+        return jsonify({"error": "path must be a JSON list"}), 400
+
+    api_id = request.args.get("api_id", type=int)
+    key = None
+    if api_id is not None:
+        try:
+            api_url, data = _stored_document(api_id)
+        except ValueError:
+            return jsonify({"error": "stored response is not JSON"}), 400
+        if api_url is None:
+            return jsonify({"error": "Not found"}), 404
+    else:
+        api_url = request.args.get("api_url")
+        capture = _current_capture()
+        if capture is None or capture.get(api_url) is None:
+            return jsonify({"error": f"No captured response for {api_url}"}), 404
+        data = capture.data(api_url)
+        key = f"capture:{capture.id}:{api_url}"
+
+    try:
+        return jsonify(node_page(data, path, offset, limit, key=key))
+    except KeyError as e:
+        return jsonify({"error": f"no node at {path} ({e})"}), 404
 
 
 @app.route("/choose-extract-mode", methods=["POST"])
 def choose_extract_mode():
     api_url = request.form.get("api_url")
-    return render_template("choose_mode.html", api_url=api_url)
+    return render_template("choose_mode.html", api_url=api_url, shape_matches=_shape_matches(_capture_shape(api_url)))
 
 
 @app.route("/extract", methods=["POST"])
 def extract():
     url = request.form.get("api_url")
-    data = extract_json_response(_cached_apis, url)
-    arrays = find_arrays(data)
-    return render_template("extract.html", api_url=url, arrays=arrays)
+    data, index = _capture_index(url)
+    arrays = index.arrays
+    return render_template("extract.html", api_url=url, arrays=arrays,
+                           shape_matches=_shape_matches(_capture_shape(url)))
 
 
 @app.route("/generate-mapping", methods=["POST"])
 def generate_mapping():
-    global _cached_apis
-
     api_url = request.form.get("api_url")
     selected_array = request.form.get("selected_array")
 
-    data = extract_json_response(_cached_apis, api_url)
-
-    def find_array(obj, target):
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                if k == target and isinstance(v, list):
-                    return v
-                sub = find_array(v, target)
-                if sub:
-                    return sub
-        if isinstance(obj, list):
-            for item in obj:
-                sub = find_array(item, target)
-                if sub:
-                    return sub
-        return None
-
-    array_data = find_array(data, selected_array)
+    data, index = _capture_index(api_url)
+    array_data = index.find_array(data, selected_array)
     if not array_data:
         return "Array not found"
 
-    first_obj = array_data[0]
-    columns = []
-
-    def walk(o, prefix=""):
-        for k, v in o.items():
-            path = f"{prefix}/{k}" if prefix else k
-            if isinstance(v, dict):
-                walk(v, path)
-            elif isinstance(v, list):
-                if len(v) > 0 and isinstance(v[0], dict):
-                    walk(v[0], path)
-            else:
-                columns.append({
-                    "path": f"./{path}",
-                    "dataType": "string",
-                    "columnName": k
-                })
-
-    walk(first_obj)
+    columns = infer_columns(sample(array_data))
 
     mapping = {
         "table": {
@@ -218,48 +481,29 @@ def generate_mapping():
 
 @app.route("/generate-mapping-model2", methods=["POST"])
 def generate_mapping_model2():
-    global _cached_apis
-
     api_url = request.form.get("api_url")
     selected = request.form.get("selected_object")
 
-    data = extract_json_response(_cached_apis, api_url)
-    dot = find_numeric_object_path(data, selected)
+    data, index = _capture_index(api_url)
+    dot = index.numeric_object_path(selected)
     obj = get_by_dotpath(data, dot)
 
-    numeric_key = None
-    sample = None
+    numeric_keys = []
     if isinstance(obj, dict):
-        for k in obj:
-            if re.fullmatch(r"\d+", str(k)):
-                numeric_key = k
-                sample = obj[k]
-                break
+        numeric_keys = [k for k in obj if re.fullmatch(r"\d+", str(k))]
 
-    if sample is None:
+    if not numeric_keys or obj[numeric_keys[0]] is None:
         return f"No numeric-key object for {selected}"
 
     columns = [{
         "path": f"${selected}_id",
         "dataType": "string",
-        "columnName": f"{selected}_id"
+        "columnName": f"{selected}_id",
+        "nullable": False,
+        "presence": 1.0
     }]
 
-    def add(o, prefix):
-        for k, v in o.items():
-            if isinstance(v, dict):
-                add(v, f"{prefix}/{k}")
-            elif isinstance(v, list):
-                if len(v) > 0 and isinstance(v[0], dict):
-                    add(v[0], f"{prefix}/{k}")
-            else:
-                columns.append({
-                    "path": f"./{prefix}/{k}",
-                    "dataType": "string",
-                    "columnName": k
-                })
-
-    add(sample, f"${selected}_id")
+    columns += infer_columns((obj[k] for k in sample(numeric_keys)), f"${selected}_id")
 
     mapping = {
         "table": {
@@ -279,52 +523,17 @@ def generate_mapping_model2():
 
 @app.route("/generate-mapping-model3", methods=["POST"])
 def generate_mapping_model3():
-    global _cached_apis
-
     api_url = request.form.get("api_url")
     selected = request.form.get("selected_object")
 
-    data = extract_json_response(_cached_apis, api_url)
-
-    def find_obj(o, target):
-        if isinstance(o, dict):
-            for k, v in o.items():
-                if k == target and isinstance(v, dict):
-                    return v, [k]
-                sub, path = find_obj(v, target)
-                if sub:
-                    return sub, [k] + path
-        if isinstance(o, list):
-            for item in o:
-                sub, path = find_obj(item, target)
-                if sub:
-                    return sub, path
-        return None, None
-
-    obj, path_segments = find_obj(data, selected)
+    data, index = _capture_index(api_url)
+    obj, path_segments = index.find_object(data, selected)
     if obj is None:
         return f"Object {selected} not found"
 
     primary = ".".join(path_segments)
 
-    columns = []
-
-    def add(o, prefix):
-        for k, v in o.items():
-            full = f"{prefix}/{k}" if prefix else k
-            if isinstance(v, dict):
-                add(v, full)
-            elif isinstance(v, list):
-                if len(v) > 0 and isinstance(v[0], dict):
-                    add(v[0], full)
-            else:
-                columns.append({
-                    "path": f"./{full}",
-                    "dataType": "string",
-                    "columnName": k
-                })
-
-    add(obj, "")
+    columns = infer_columns([obj])
 
     mapping = {
         "table": {
@@ -344,8 +553,6 @@ def generate_mapping_model3():
 
 @app.route("/save-mapping", methods=["POST"])
 def save_mapping():
-    global _cached_apis
-
     api_url = request.form.get("api_url")
     mode = request.form.get("mode")
     keys_raw = request.form.get("keys")
@@ -353,6 +560,9 @@ def save_mapping():
 
     if not api_url or not mapping_raw:
         return jsonify({"error": "api_url and mapping are required"}), 400
+    truncated = _truncated_save_error(api_url)
+    if truncated:
+        return truncated
 
    
     try:
@@ -368,27 +578,51 @@ def save_mapping():
 
    
     response_obj = {}
-    for a in _cached_apis:
-        if a.get("url") == api_url:
-            response_obj = a.get("data")
-            break
+    capture = _current_capture()
+    if capture and capture.get(api_url) is not None:
+        response_obj = capture.data(api_url)
+    shape_hash = _capture_shape(api_url)
 
    
-    api_id = get_or_create_api(api_url, response_obj)
+    api_id = get_or_create_api(api_url, response_obj, shape_hash, _capture_paths(api_url))
 
-   
-    data_id = save_data_and_get_id(mode, keys, mapping_obj)
+    # an API of the same shape may already have this exact mapping
+    data_id = find_shared_data(shape_hash, mode, keys, mapping_obj)
+    reused = data_id is not None
+    if not reused:
+        data_id = save_data_and_get_id(mode, keys, mapping_obj)
 
    
     create_mapper(api_id, data_id)
 
-    return jsonify({"ok": True, "api_id": api_id, "data_id": data_id})
+    return jsonify({"ok": True, "api_id": api_id, "data_id": data_id, "reused": reused})
+
+
+@app.route("/attach-mapping", methods=["POST"])
+def attach_mapping():
+    """Attach a mapping saved for another API of the same shape."""
+    api_url = request.form.get("api_url")
+    data_id = request.form.get("data_id", type=int)
+    capture = _current_capture()
+    if not api_url or data_id is None or capture is None or capture.get(api_url) is None:
+        return jsonify({"error": "api_url of the current capture and data_id are required"}), 400
+    truncated = _truncated_save_error(api_url)
+    if truncated:
+        return truncated
+
+    shape_hash = _capture_shape(api_url)
+    if data_id not in {m["data_id"] for m in _shape_matches(shape_hash)}:
+        return jsonify({"error": "mapping was not saved for an API of this shape"}), 400
+
+    api_id = get_or_create_api(api_url, capture.data(api_url), shape_hash, _capture_paths(api_url))
+    create_mapper(api_id, data_id)
+    return jsonify({"ok": True, "api_id": api_id, "data_id": data_id, "reused": True})
 
 
 # @app.route("/extract-model2", methods=["POST"])
 # def extract_model2():
 #     url = request.form.get("api_url")
-#     data = extract_json_response(_cached_apis, url)
+#     data = _capture_data(url)
 #     results = extract_id_objects(data) if data else []
 #     max_keys = max((len(r["keys_list"]) for r in results), default=0)
 #     return render_template("extract_model2.html", api_url=url, results=results, max_keys=max_keys, arrays=find_arrays(data))
@@ -397,7 +631,7 @@ def save_mapping():
 # @app.route("/extract-model3", methods=["POST"])
 # def extract_model3():
 #     url = request.form.get("api_url")
-#     data = extract_json_response(_cached_apis, url)
+#     data = _capture_data(url)
 #     results = extract_objects_model3(data) if data else []
 #     return render_template("extract_model3.html", api_url=url, results=results, arrays=find_arrays(data))
 
@@ -405,18 +639,20 @@ def save_mapping():
 @app.route("/extract-model2", methods=["POST"])
 def extract_model2():
     url = request.form.get("api_url")
-    data = extract_json_response(_cached_apis, url)
-    results = extract_id_objects(data) if data else []
+    data, index = _capture_index(url)
+    results = index.id_objects if data else []
     max_keys = max((len(r["keys_list"]) for r in results), default=0)
-    return render_template("extract_model2.html", api_url=url, results=results, max_keys=max_keys, arrays=find_arrays(data))
+    return render_template("extract_model2.html", api_url=url, results=results, max_keys=max_keys, arrays=index.arrays,
+                           shape_matches=_shape_matches(_capture_shape(url)))
 
 
 @app.route("/extract-model3", methods=["POST"])
 def extract_model3():
     url = request.form.get("api_url")
-    data = extract_json_response(_cached_apis, url)
-    results = extract_objects_model3(data) if data else []
-    return render_template("extract_model3.html", api_url=url, results=results, arrays=find_arrays(data))
+    data, index = _capture_index(url)
+    results = index.model3 if data else []
+    return render_template("extract_model3.html", api_url=url, results=results, arrays=index.arrays,
+                           shape_matches=_shape_matches(_capture_shape(url)))
 
 
 
@@ -424,41 +660,45 @@ def extract_model3():
 def saved_apis():
     tag_filter = request.args.get('tag')
     url_filter = request.args.get('url', '').strip()
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    per_page = request.args.get('per_page', SAVED_APIS_PAGE_SIZE, type=int)
+    per_page = min(max(per_page, 1), SAVED_APIS_MAX_PAGE_SIZE)
     
     with db_session() as session:
-        # Get all tags with counts for the filter
-        all_tags_with_counts = session.query(
-            Tag,
-            func.count(API.id).label('count')
-        ).outerjoin(
-            API.tags
-        ).group_by(Tag.id).order_by(Tag.name).all()
+        # Tags with counts for the filter; the dropdowns list the same tags
+        all_tags_with_counts = tag_counts(session)
+        all_tags = [tag for tag, _ in all_tags_with_counts]
         
-        # Get all tags for the dropdown (simple list of tag objects)
-        all_tags = session.query(Tag).order_by(Tag.name).all()
-        
-        # Debug: Print number of tags
-        print(f"DEBUG: Found {len(all_tags)} total tags")
-        for tag in all_tags:
-            print(f"- {tag.id}: {tag.name}")
-            
-        # Ensure we have all tags for the dropdown
-        all_tags = session.query(Tag).order_by(Tag.name).all()
-        
-        # Start with base query
-        query = session.query(API)
+        # Start with base query; the listing never needs response bodies
+        query = session.query(API).options(load_only(API.id, API.api), selectinload(API.tags))
         
         # Apply tag filter if specified
         if tag_filter:
             query = query.join(API.tags).filter(Tag.name == tag_filter)
         
-        # Apply URL filter if specified
+        # Apply URL filter if specified, through the search index; key is
+        # API.id or the search table's copy of it
+        key = API.id
         if url_filter:
-            query = query.filter(API.api.ilike(f'%{url_filter}%'))
+            query, key = filter_by_url(session, query, url_filter)
+        
+        # Keyset pagination on id: ?after=<last id> pages forward,
+        # ?before=<first id> back, so a page costs the same at any depth
+        if before is not None:
+            rows = query.filter(key < before).order_by(key.desc()).limit(per_page + 1).all()
+            has_prev, has_next = len(rows) > per_page, True
+            rows = rows[:per_page][::-1]
+        else:
+            if after is not None:
+                query = query.filter(key > after)
+            rows = query.order_by(key).limit(per_page + 1).all()
+            has_prev, has_next = after is not None, len(rows) > per_page
+            rows = rows[:per_page]
         
         # Get filtered APIs with their tags
         apis = []
-        for api in query.all():
+        for api in rows:
             api_dict = {
                 'id': api.id,
                 'api': api.api,
@@ -467,12 +707,15 @@ def saved_apis():
             }
             apis.append(api_dict)
         
-        # Get total count of all APIs
-        total_apis = session.query(API).count()
+        # Total count of all APIs, cached between writes
+        total_apis = count_cache.get("apis", lambda: session.query(func.count(API.id)).scalar())
         
         return render_template(
             'saved_apis.html', 
             apis=apis,
+            per_page=per_page,
+            next_after=rows[-1].id if rows and has_next else None,
+            prev_before=rows[0].id if rows and has_prev else None,
             all_tags=all_tags,  # Pass all tags for dropdowns
             all_tags_with_counts=all_tags_with_counts,
             total_apis=total_apis,
@@ -513,6 +756,235 @@ def get_mapping(data_id):
             "mapping": json.loads(d.mapping)
         })
 
+
+def _load_mapping(data_id):
+    """Compiled mapping of a ``Data`` row, with the URL and id of the API
+    it was saved for; ``(None, None, None)`` if there is no row."""
+    with db_session() as session:
+        d = session.query(Data).filter(Data.id == data_id).first()
+        if not d:
+            return None, None, None
+        api = session.query(API).join(Mapper, Mapper.api_id == API.id).filter(Mapper.data_id == data_id).first()
+        compiled = compiled_mapping(d.id, d.mode, d.mapping)
+        if api is None:
+            return compiled, None, None
+        return compiled, api.api, api.id
+
+
+@app.route("/run-mapping/<int:data_id>", methods=["GET", "POST"])
+@csrf.exempt
+def run_mapping(data_id):
+    """Rows of a saved mapping over its API's stored response, or over the
+    current capture's response with ``source=capture``. ``format`` other
+    than json streams every row (or ``limit`` rows) as a file."""
+    source = request.values.get("source", "stored")
+    file_format = request.values.get("format", "json")
+    if file_format != "json" and file_format not in FORMATS:
+        return jsonify({"error": f"format must be json or one of {', '.join(FORMATS)}"}), 400
+    try:
+        limit = min(max(1, int(request.values.get("limit", MAPPING_RUN_LIMIT))), MAPPING_RUN_MAX)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        compiled, api_url, api_id = _load_mapping(data_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if compiled is None:
+        return jsonify({"error": "Not found"}), 404
+
+    truncated = False
+    if source == "capture":
+        api_url = request.values.get("api_url") or api_url
+        capture = _current_capture()
+        record = capture.get(api_url) if capture else None
+        if record is None:
+            return jsonify({"error": f"No captured response for {api_url}"}), 404
+        data = capture.data(api_url)
+        truncated = bool(record.get("truncated"))
+    else:
+        try:
+            data = _stored_document(api_id)[1] if api_id is not None else None
+        except ValueError:
+            data = None
+
+    if file_format != "json":
+        # files hold every row unless a limit is asked for
+        limit = limit if "limit" in request.values else None
+        filename = f"mapping-{data_id}.{file_format}"
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
+        if file_format == "csv":
+            return Response(csv_chunks(columnar_batches(compiled, data, limit)), mimetype="text/csv", headers=headers)
+        if file_format == "ndjson":
+            return Response(ndjson_chunks(columnar_batches(compiled, data, limit)),
+                            mimetype="application/x-ndjson", headers=headers)
+        buf = io.BytesIO()
+        try:
+            export(compiled, data, file_format, buf, limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(buf.getvalue(), mimetype="application/octet-stream", headers=headers)
+
+    rows = list(islice(compiled.rows(data), limit + 1))
+    return jsonify({
+        "data_id": data_id,
+        "mode": compiled.mode,
+        "primary_path": compiled.primary_path,
+        "source": source,
+        "api_url": api_url,
+        "columns": compiled.columns,
+        "rows": rows[:limit],
+        "more": len(rows) > limit,
+        # streamed uploads only keep a preview of the response
+        "truncated_source": truncated
+    })
+
+
+def _summarize(value):
+    # containers are described, not dumped, when only the shape is wanted
+    if isinstance(value, dict):
+        return {"type": "object", "size": len(value)}
+    if isinstance(value, list):
+        return {"type": "array", "size": len(value)}
+    return value
+
+
+@app.route("/query", methods=["GET", "POST"])
+@csrf.exempt
+def query_response():
+    """Matches of a JSONPath-like ``q`` in a captured response (``api_url``)
+    or a stored one (``api_id``), streamed a page at a time from ``offset``.
+    ``summary=1`` replaces matched objects and arrays with their size."""
+    try:
+        query = compile_query(request.values.get("q", ""))
+        offset = max(0, int(request.values.get("offset", 0)))
+        limit = min(max(1, int(request.values.get("limit", QUERY_PAGE_SIZE))), QUERY_MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    api_id = request.values.get("api_id", type=int)
+    api_url = request.values.get("api_url")
+    if api_id is not None:
+        source = "stored"
+        try:
+            api_url, data = _stored_document(api_id)
+        except ValueError:
+            return jsonify({"error": "stored response is not JSON"}), 400
+        if api_url is None:
+            return jsonify({"error": "Not found"}), 404
+    else:
+        source = "capture"
+        capture = _current_capture()
+        if capture is None or capture.get(api_url) is None:
+            return jsonify({"error": f"No captured response for {api_url}"}), 404
+        data = capture.data(api_url)
+
+    summary = request.values.get("summary") in ("1", "true", "on")
+    matches = islice(query.find(data), offset, offset + limit + 1)
+    head = json.dumps({"query": query.expression, "source": source, "api_url": api_url, "offset": offset})
+
+    def stream():
+        yield head[:-1] + ', "matches": ['
+        count, more = 0, False
+        for path, value in matches:
+            if count == limit:
+                more = True
+                break
+            value = _summarize(value) if summary else value
+            yield ("," if count else "") + json.dumps({"path": format_path(path), "value": value})
+            count += 1
+        yield f'], "count": {count}, "next_offset": {json.dumps(offset + count if more else None)}}}'
+
+    return Response(stream(), mimetype="application/json")
+
+
+def _mapping_input(data_id, site, api_url, refresh):
+    """Compiled mapping and the response the CLI commands run it over: the
+    stored one, or the matching call from a fresh capture of ``site``."""
+    try:
+        compiled, saved_url, api_id = _load_mapping(data_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if compiled is None:
+        raise click.ClickException(f"no mapping {data_id}")
+
+    api_url = api_url or saved_url
+    if site:
+        apis = capture_webpage(site_url(site), refresh=refresh)["apis"]
+        record = next((api for api in apis if api.get("url") == api_url), None)
+        if record is None:
+            raise click.ClickException(f"{site} made no call to {api_url}")
+        return compiled, resolve_data(record)
+    if api_id is None:
+        return compiled, None
+    try:
+        return compiled, _stored_document(api_id)[1]
+    except ValueError:
+        raise click.ClickException(f"the stored response of {saved_url} is not JSON")
+
+
+@app.cli.command("run-mapping")
+@click.argument("data_id", type=int)
+@click.option("--site", default=None, help="Capture this page now instead of using the stored response.")
+@click.option("--api-url", default=None, help="Captured response to map (default: the mapping's API).")
+@click.option("--out", type=click.File("wb"), default="-")
+@click.option("--format", "file_format", type=click.Choice(FORMATS), default="ndjson", show_default=True)
+@click.option("--limit", type=click.IntRange(min=1), default=None)
+@click.option("--refresh", is_flag=True, help="Ignore the capture cache.")
+def run_mapping_command(data_id, site, api_url, out, file_format, limit, refresh):
+    """Run saved mapping DATA_ID and write its rows."""
+    compiled, data = _mapping_input(data_id, site, api_url, refresh)
+    start = time.perf_counter()
+    try:
+        count = export(compiled, data, file_format, out, limit)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - start
+    click.echo(f"mapped {count} rows in {elapsed * 1000:.1f} ms "
+               f"({count / elapsed if elapsed else 0:,.0f} rows/s)", err=True)
+
+
+@app.cli.command("materialize")
+@click.argument("data_id", type=int)
+@click.option("--table", "table_name", default=None, help="Target table (default: mapping_<DATA_ID>).")
+@click.option("--site", default=None, help="Capture this page now instead of using the stored response.")
+@click.option("--api-url", default=None, help="Captured response to map (default: the mapping's API).")
+@click.option("--append", is_flag=True, help="Keep existing rows of tables without an $x_id key.")
+@click.option("--batch-rows", type=int, default=MATERIALIZE_BATCH_ROWS, show_default=True,
+              help="Rows per transaction.")
+@click.option("--refresh", is_flag=True, help="Ignore the capture cache.")
+def materialize_command(data_id, table_name, site, api_url, append, batch_rows, refresh):
+    """Load the rows of saved mapping DATA_ID into a table in DATABASE_URL."""
+    compiled, data = _mapping_input(data_id, site, api_url, refresh)
+    table_name = sql_identifier(table_name) if table_name else table_name_for(data_id)
+    if table_name in Base.metadata.tables:
+        raise click.ClickException(f"{table_name} is one of the app's own tables")
+    result = materialize(engine, compiled, data, table_name, append=append, batch_rows=batch_rows)
+    click.echo(json.dumps(result))
+
+
+@app.cli.command("backfill-shapes")
+def backfill_shapes_command():
+    """Fingerprint stored responses saved before shapes were recorded."""
+    with db_session() as session:
+        apis = session.query(API).filter(API.shape_hash.is_(None)).all()
+        for api in apis:
+            try:
+                data = json.loads(load_response(session, api))
+            except ValueError:
+                continue
+            api.shape_hash = build_index(data).shape_hash()
+        session.commit()
+    click.echo(f"fingerprinted {len(apis)} APIs")
+
+
+@app.cli.command("backfill-key-paths")
+def backfill_key_paths_command():
+    """Index the key paths of stored responses saved before they were recorded."""
+    with db_session() as session:
+        done = backfill_key_paths(session)
+    click.echo(f"indexed key paths of {done} APIs")
+
+
 @app.route("/delete-api/<int:api_id>", methods=["GET"])
 def delete_api(api_id):
     with db_session() as session:
@@ -529,31 +1001,39 @@ def delete_api(api_id):
        
         session.query(Mapper).filter(Mapper.api_id == api_id).delete()
 
+        # mappings shared with APIs of the same shape stay
+        shared = {d for (d,) in session.query(Mapper.data_id).filter(Mapper.data_id.in_(data_ids))} if data_ids else set()
+        data_ids = [d for d in data_ids if d not in shared]
         if data_ids:
             session.query(Data).filter(Data.id.in_(data_ids)).delete(synchronize_session=False)
        
+        session.query(KeyPath).filter(KeyPath.api_id == api_id).delete()
+        response_hash = api.response_hash
         session.delete(api)
+        session.flush()
+        # blobs are shared by content; drop this one if nothing else uses it
+        if response_hash and not session.query(API.id).filter(API.response_hash == response_hash).first():
+            session.query(ResponseBlob).filter(ResponseBlob.hash == response_hash).delete()
 
         session.commit()
+    count_cache.invalidate("apis")
+    invalidate_tag_counts()
 
     return redirect(url_for("saved_apis"))
 
 @app.route("/results")
 def results_page():
-    apis = [a for a in _cached_apis if a.get("data")]
-    return render_template("results.html", apis=apis)
+    capture = _current_capture()
+    if capture is None:
+        return render_template("results.html", apis=[])
+    return render_template("results.html", apis=capture.listing(), site=capture.site, stats=capture.stats)
 
 
 @app.route('/add-tags', methods=['GET', 'POST'])
 def add_tags():
     with db_session() as session:
         # Get all tags with counts for the dropdown
-        all_tags = session.query(
-            Tag,
-            func.count(API.id).label('count')
-        ).join(
-            API.tags
-        ).group_by(Tag.id).all()
+        all_tags = tag_counts(session, used_only=True)
         if request.method == 'POST':
             api_url = request.form.get('api_url')
             tag_name = request.form.get('tag_name')
@@ -563,15 +1043,9 @@ def add_tags():
                 return render_template('add_tags.html', all_tags=all_tags)
                 
             try:
-                # Check if API already exists
-                api = session.query(API).filter(API.api == api_url).first()
-                
-                if not api:
-                    # Create new API if it doesn't exist
-                    api = API(api=api_url, response='{}')
-                    session.add(api)
-                    session.commit()
-                    session.refresh(api)
+                # Find the API, or create it with an empty response
+                api = session.get(API, upsert_api(session, api_url, '{}'))
+                count_cache.invalidate("apis")
                 
                 # Check if tag exists
                 tag = session.query(Tag).filter(Tag.name == tag_name).first()
@@ -584,6 +1058,7 @@ def add_tags():
                 # Clear existing tags and add the new one
                 api.tags = [tag]
                 session.commit()
+                invalidate_tag_counts()
                 
                 flash(f'Successfully added tag "{tag_name}" to API', 'success')
                 return redirect(url_for('add_tags'))
@@ -615,6 +1090,34 @@ def get_tagged_apis(tag_name):
         apis = get_apis_by_tag(session, tag_name)
         return jsonify([{'id': api.id, 'api': api.api} for api in apis])
 
+@app.route('/api/search')
+def search_apis():
+    """Typeahead over saved API URLs: ?q=<substring>&limit=<n>."""
+    term = request.args.get('q', '').strip()
+    if not term:
+        return jsonify([])
+    limit = request.args.get('limit', SEARCH_TYPEAHEAD_LIMIT, type=int)
+    with db_session() as session:
+        return jsonify(search_urls(session, term, limit))
+
+@app.route('/api/key-paths')
+def key_path_apis():
+    """Saved APIs whose stored response has a key path:
+    ?path=odds/home (that path or its tail at any depth; $.odds.home only
+    from the root), ?prefix=data.events (at or below, from the root),
+    ?key=price (at any depth), ?type=number, ?tag=<name>, paged with
+    ?after=&limit=."""
+    filters = {name: request.args.get(name, '').strip() or None for name in ('path', 'prefix', 'key', 'type', 'tag')}
+    if not any(filters[name] for name in ('path', 'prefix', 'key', 'type')):
+        return jsonify({'error': 'one of path, prefix, key or type is required'}), 400
+    with db_session() as session:
+        apis, next_after = find_apis(
+            session, path=filters['path'], prefix=filters['prefix'], key=filters['key'],
+            type_=filters['type'], tag=filters['tag'], after=request.args.get('after', type=int),
+            limit=request.args.get('limit', KEY_PATHS_PAGE_SIZE, type=int),
+        )
+    return jsonify({'apis': apis, 'next_after': next_after})
+
 @app.route('/update-api-tag/<int:api_id>', methods=['POST'])
 def update_api_tag(api_id):
     with db_session() as session:
@@ -652,6 +1155,7 @@ def update_api_tag(api_id):
             # Clear existing tags and add the new one
             api.tags = [tag]
             session.commit()
+            invalidate_tag_counts()
             
             if is_ajax:
                 return jsonify({
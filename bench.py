@@ -0,0 +1,869 @@
+"""Micro-benchmarks against local fixtures.
+
+Usage: python bench.py <name> [options]
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+FIXTURE_PAGE = """<!DOCTYPE html>
+<html><head><title>fixture</title></head>
+<body>
+<h1>fixture</h1>
+<script>
+  fetch("/api/items.json").then(r => r.json());
+  fetch("/api/odds").then(r => r.json());
+</script>
+</body></html>
+"""
+
+
+HEAVY_PAGE = """<!DOCTYPE html>
+<html><head><title>heavy fixture</title>
+<link rel="stylesheet" href="/css/site.css">
+<script src="/ads/tracker.js"></script>
+</head>
+<body>
+%s
+<video src="/media/clip.mp4" autoplay muted></video>
+<script>
+  fetch("/api/items.json").then(r => r.json());
+  fetch("/api/odds").then(r => r.json());
+</script>
+</body></html>
+""" % "\n".join(f'<img src="/img/{i}.png">' for i in range(40))
+
+HEAVY_ASSET_BYTES = 256 * 1024
+HEAVY_ASSET_DELAY_S = 0.05
+
+
+def _fixture_json(path):
+    if path.startswith("/api/items"):
+        return {"items": [{"id": i, "name": f"item {i}", "price": i * 1.5} for i in range(50)]}
+    return {"events": {str(1000 + i): {"home": 1.9, "away": 2.1} for i in range(20)}}
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.startswith("/api/"):
+            body = json.dumps(_fixture_json(self.path)).encode()
+            ctype = "application/json"
+        elif self.path.startswith("/heavy"):
+            body = HEAVY_PAGE.encode()
+            ctype = "text/html"
+        elif self.path.startswith(("/img/", "/css/", "/media/", "/ads/")):
+            time.sleep(HEAVY_ASSET_DELAY_S)
+            body = b"\0" * HEAVY_ASSET_BYTES
+            ctype = "application/octet-stream"
+        else:
+            body = FIXTURE_PAGE.encode()
+            ctype = "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.bytes_sent += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FixtureServer:
+    """Serves ``FIXTURE_PAGE`` and its JSON endpoints on an ephemeral port."""
+
+    def __init__(self, handler=_FixtureHandler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.bytes_sent = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def synthetic_payload(items):
+    """A nested response with an array, a numeric-keyed object and plain
+    objects, roughly 250 bytes of JSON per item."""
+    return {
+        "meta": {"source": "bench", "count": items},
+        "data": {
+            "events": [
+                {
+                    "id": i,
+                    "name": f"event {i}",
+                    "start": "2024-01-01T00:00:00Z",
+                    "live": i % 2 == 0,
+                    "score": {"home": i % 5, "away": (i + 2) % 5},
+                    "markets": [{"id": i * 10 + m, "price": 1.5 + m / 10} for m in range(2)],
+                }
+                for i in range(items)
+            ],
+            "odds": {
+                str(100000 + i): {"home": 1.9, "draw": 3.2, "away": 4.1, "book": {"name": "b", "id": i}}
+                for i in range(items)
+            },
+        },
+    }
+
+
+def _timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label, samples):
+    print(
+        f"{label:<28} n={len(samples):<4} "
+        f"mean={statistics.mean(samples):8.1f} ms  "
+        f"median={statistics.median(samples):8.1f} ms  "
+        f"min={min(samples):8.1f} ms"
+    )
+
+
+def bench_pool(args):
+    """Cold browser launch per capture vs. captures from a warm pool."""
+    from browser_pool import BrowserPool
+    from scraper import fetch_webpage
+
+    with FixtureServer() as server:
+
+        def cold():
+            with BrowserPool(browsers=1, contexts_per_browser=1) as pool:
+                assert fetch_webpage(server.url, wait_ms=0, pool=pool)
+
+        with BrowserPool(browsers=1, contexts_per_browser=1) as warm_pool:
+            fetch_webpage(server.url, wait_ms=0, pool=warm_pool)
+
+            def warm():
+                assert fetch_webpage(server.url, wait_ms=0, pool=warm_pool)
+
+            _report("cold (launch per capture)", _timed(cold, args.rounds))
+            _report("warm (pooled browser)", _timed(warm, args.rounds))
+
+
+def bench_batch(args):
+    """Batch capture throughput as the concurrency limit grows."""
+    from browser_pool import BrowserPool
+    from scraper import fetch_webpages
+
+    with FixtureServer() as server:
+        urls = [f"{server.url}?site={i}" for i in range(args.sites)]
+        for concurrency in (1, 2, 4, 8):
+            with BrowserPool(browsers=1, contexts_per_browser=concurrency) as pool:
+                fetch_webpages(urls[:1], concurrency=1, wait_ms=0, pool=pool)
+                start = time.perf_counter()
+                results = fetch_webpages(urls, concurrency=concurrency, wait_ms=args.wait_ms, pool=pool)
+                elapsed = time.perf_counter() - start
+            ok = sum(1 for r in results if not r["error"])
+            print(f"concurrency={concurrency:<3} sites={ok}/{len(urls)}  {len(urls) / elapsed:6.2f} sites/s")
+
+
+def bench_blocking(args):
+    """Capture a heavy page with and without request interception."""
+    from browser_pool import BrowserPool
+    from scraper import capture_webpage, DEFAULT_BLOCK_URL_PATTERNS
+
+    # the fixture's "third-party" tracker is local, so add its path
+    os.environ["CAPTURE_BLOCK_URL_PATTERNS"] = ",".join(DEFAULT_BLOCK_URL_PATTERNS + ("*/ads/*",))
+
+    with FixtureServer() as server, BrowserPool(browsers=1, contexts_per_browser=1) as pool:
+        page = server.url + "heavy"
+        for block in (False, True):
+            capture_webpage(page, wait_ms=0, block=block, pool=pool)
+            server.httpd.bytes_sent = 0
+            captures = []
+
+            def run():
+                captures.append(capture_webpage(page, wait_ms=0, block=block, pool=pool))
+
+            samples = _timed(run, args.rounds)
+            label = "blocking on" if block else "blocking off"
+            _report(label, samples)
+            blocked = captures[-1]["stats"]["blocking"]
+            print(
+                f"{'':<28} served={server.httpd.bytes_sent / args.rounds / 1024:8.0f} KiB/capture"
+                + (f"  blocked={blocked['blocked']} {blocked['blocked_by']}" if blocked else "")
+            )
+
+
+def bench_cache(args):
+    """Fresh capture vs. a capture cache hit for the same page."""
+    import tempfile
+    import capture_cache
+    from browser_pool import BrowserPool
+    from scraper import capture_webpage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        capture_cache._cache = capture_cache.CaptureCache(path=os.path.join(tmp, "cache.db"))
+        with FixtureServer() as server, BrowserPool(browsers=1, contexts_per_browser=1) as pool:
+            capture_webpage(server.url, wait_ms=0, pool=pool, refresh=True)
+            _report("capture (refresh)", _timed(
+                lambda: capture_webpage(server.url, wait_ms=0, pool=pool, refresh=True), args.rounds))
+            _report("capture cache hit", _timed(
+                lambda: capture_webpage(server.url, wait_ms=0, pool=pool), args.rounds))
+            print(capture_cache._cache.stats())
+
+
+def _app_worker(conn, env):
+    """Child process hosting its own copy of the Flask app."""
+    import re
+    os.environ.update(env)
+    import app as app_module
+
+    app_module.app.config["WTF_CSRF_ENABLED"] = False
+    client = app_module.app.test_client()
+    conn.send("ready")
+    for method, path, data in iter(conn.recv, None):
+        start = time.perf_counter()
+        resp = client.open(path, method=method, data=data)
+        elapsed = (time.perf_counter() - start) * 1000
+        body = resp.get_data(as_text=True)
+        found = re.search(r'name="capture_id" value="([0-9a-f]+)"', body)
+        conn.send((resp.status_code, elapsed, found.group(1) if found else None, body))
+
+
+def bench_shared_store(args):
+    """Capture on one worker process, extract on another through the shared store."""
+    import tempfile
+    import multiprocessing
+
+    payload = {"data": {"items": [{"id": i, "name": f"item {i}", "tags": ["a", "b"]}
+                                  for i in range(args.items)]}}
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "DATABASE_URL": f"sqlite:///{tmp}/app.db",
+            "CAPTURE_STORE_PATH": f"{tmp}/captures.db",
+            "CAPTURE_CACHE_PATH": f"{tmp}/cache.db",
+        }
+        workers = []
+        for _ in range(2):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_app_worker, args=(child, env), daemon=True)
+            proc.start()
+            assert parent.recv() == "ready"
+            workers.append((proc, parent))
+        (_, worker_a), (_, worker_b) = workers
+
+        try:
+            worker_a.send(("POST", "/submit-header", {"headers": "pasted", "response": json.dumps(payload)}))
+            status, elapsed, capture_id, _ = worker_a.recv()
+            assert status == 200 and capture_id, f"capture failed on worker A ({status})"
+            print(f"worker A  capture            {elapsed:8.1f} ms  capture_id={capture_id}")
+
+            form = {"api_url": "pasted", "capture_id": capture_id}
+            for label in ("extract (shared load)", "extract (warm)"):
+                worker_b.send(("POST", "/extract", form))
+                status, elapsed, _, body = worker_b.recv()
+                assert status == 200 and "<td>items</td>" in body, "worker B could not see the capture"
+                print(f"worker B  {label:<22} {elapsed:8.1f} ms")
+        finally:
+            for proc, conn in workers:
+                conn.send(None)
+                proc.join(timeout=10)
+
+
+def bench_index(args):
+    """Per-click document walks vs. one structural index per response."""
+    from parser import find_arrays, extract_id_objects, extract_objects_model3, find_numeric_object_path
+    from json_index import build_index
+
+    data = synthetic_payload(args.items)
+    print(f"payload: {len(json.dumps(data)) / 1024 / 1024:.1f} MiB")
+
+    def clicks_walking():
+        find_arrays(data)
+        extract_id_objects(data)
+        find_arrays(data)
+        extract_objects_model3(data)
+        find_arrays(data)
+        find_numeric_object_path(data, "odds")
+
+    def clicks_indexed():
+        index = build_index(data)
+        index.arrays
+        index.id_objects
+        index.model3
+        index.numeric_object_path("odds")
+        index.find_array(data, "events")
+
+    index = build_index(data)
+    _report("walk per click (6 walks)", _timed(clicks_walking, args.rounds))
+    _report("build index once", _timed(lambda: build_index(data), args.rounds))
+    _report("answer from built index", _timed(lambda: (
+        index.arrays, index.id_objects, index.model3,
+        index.numeric_object_path("odds"), index.find_array(data, "events"),
+    ), args.rounds))
+
+
+def bench_analysis(args):
+    """Indexing a capture's responses inline vs. on the analysis worker pool."""
+    import analysis
+    from json_index import build_index
+
+    apis = [{"url": f"/api/{i}", "data": synthetic_payload(args.items // 4 + i * 50)} for i in range(args.sites)]
+    size = sum(len(json.dumps(a["data"])) for a in apis)
+    print(f"{len(apis)} responses, {size / 1024 / 1024:.1f} MiB, {analysis.ANALYSIS_WORKERS} workers")
+
+    def inline():
+        for api in apis:
+            build_index(api["data"])
+
+    def pooled():
+        records = [{"url": a["url"], "data": a["data"]} for a in apis]
+        stats = analysis.precompute_indexes(records)
+        assert stats["indexed"] == len(records), stats
+
+    pooled()  # start the workers
+    _report("inline, request thread", _timed(inline, args.rounds))
+    _report("worker pool", _timed(pooled, args.rounds))
+
+
+def _baseline_module(name, path):
+    """Load ``path`` as it was in the repository's first commit."""
+    import subprocess
+    import importlib.util
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    rev = subprocess.check_output(
+        ["git", "rev-list", "--max-parents=0", "HEAD"], cwd=root, text=True
+    ).split()[0]
+    source = subprocess.check_output(["git", "show", f"{rev}:{path}"], cwd=root, text=True)
+    spec = importlib.util.spec_from_loader(name, loader=None)
+    module = importlib.util.module_from_spec(spec)
+    exec(compile(source, f"{rev[:7]}:{path}", "exec"), module.__dict__)
+    return module
+
+
+def _peak_kib(fn):
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_walkers(args):
+    """Recursive parser walkers from the first commit vs. the explicit-stack ones."""
+    import parser as current
+
+    baseline = _baseline_module("parser_baseline", "parser.py")
+    data = synthetic_payload(args.items)
+    sample = data["data"]["events"][0]
+
+    def run(module):
+        def walks():
+            module.find_arrays(data)
+            module.extract_id_objects(data)
+            module.extract_objects_model3(data)
+            module.find_path_of_key(data, "odds")
+            module.find_numeric_object_path(data, "odds")
+            module.build_columns_for_object(sample)
+        return walks
+
+    for label, module in (("recursive (baseline)", baseline), ("explicit stack", current)):
+        assert module.find_arrays(data) == current.find_arrays(data)
+        _report(label, _timed(run(module), args.rounds))
+        print(f"{'':<28} peak={_peak_kib(run(module)):8.0f} KiB")
+
+    deep = {}
+    cur = deep
+    for _ in range(sys.getrecursionlimit() * 2):
+        cur["next"] = {"1": {"v": 1}}
+        cur = cur["next"]
+    for label, module in (("recursive (baseline)", baseline), ("explicit stack", current)):
+        try:
+            found = len(module.extract_id_objects(deep))
+            print(f"{label:<28} nesting={sys.getrecursionlimit() * 2}: ok ({found} id objects)")
+        except RecursionError:
+            print(f"{label:<28} nesting={sys.getrecursionlimit() * 2}: RecursionError")
+
+
+def bench_stream(args):
+    """Whole-document json.loads + index vs. streaming ingestion of the same bytes."""
+    import io
+    from json_index import build_index
+    import ijson
+    from json_stream import ingest
+
+    raw = json.dumps(synthetic_payload(args.items)).encode()
+    print(f"payload: {len(raw) / 1024 / 1024:.1f} MiB  ijson backend: {ijson.backend}")
+
+    def loaded():
+        return build_index(json.loads(raw))
+
+    def streamed():
+        return ingest(io.BytesIO(raw))[1]
+
+    assert streamed().arrays == loaded().arrays
+    for label, fn in (("json.loads + build_index", loaded), ("streaming ingest", streamed)):
+        samples = _timed(fn, args.rounds)
+        _report(label, samples)
+        print(f"{'':<28} {len(raw) / 1024 / 1024 / (min(samples) / 1000):6.1f} MiB/s"
+              f"  peak={_peak_kib(fn) / 1024:8.1f} MiB")
+
+
+def bench_schema(args):
+    """Column inference over every array element vs. over the sampling budget."""
+    from sampling import sample
+    from schema import infer_columns
+
+    for items in (args.items, args.items * 10, args.items * 100):
+        events = [dict(e, extra=None) if e["id"] % 7 == 0 else e
+                  for e in synthetic_payload(items)["data"]["events"]]
+        full = _timed(lambda: infer_columns(events), 1)
+        sampled = _timed(lambda: infer_columns(sample(events)), args.rounds)
+        columns = infer_columns(sample(events))
+        print(f"items={items:<8} full={min(full):8.1f} ms  sampled={min(sampled):6.1f} ms  "
+              f"columns={len(columns)}  "
+              + " ".join(f"{c['columnName']}:{c['dataType']}{'?' if c['nullable'] else ''}" for c in columns))
+
+
+def _interpreted_rows(mapping, data):
+    """Rows the straightforward way: parse every column path for every row."""
+    from parser import get_by_dotpath
+
+    table = mapping["table"]
+    found = get_by_dotpath(data, table["primaryPath"][:-2])
+    items = found if isinstance(found, list) else [
+        dict(v, **{"$id": k}) for k, v in found.items()] if isinstance(found, dict) else []
+    rows = []
+    for item in items:
+        row = []
+        for column in table["columns"]:
+            cur = item
+            for key in column["path"].lstrip("./").split("/"):
+                if key.startswith("$"):
+                    key = "$id" if key == column["path"] else None
+                    if key is None:
+                        continue
+                if isinstance(cur, list):
+                    cur = cur[0] if cur else None
+                cur = cur.get(key) if isinstance(cur, dict) else None
+            row.append(cur)
+        rows.append(tuple(row))
+    return rows
+
+
+def bench_mapping(args):
+    """Saved mappings run by re-reading column paths per row vs. compiled once."""
+    from sampling import sample
+    from schema import infer_columns
+    from mapping import compile_mapping
+
+    data = synthetic_payload(args.items)
+    events, odds = data["data"]["events"], data["data"]["odds"]
+    mappings = {
+        "array []": ("1", {"table": {
+            "primaryPath": "data.events[]",
+            "columns": infer_columns(sample(events)),
+        }}),
+        "numeric-key {}": ("2", {"table": {
+            "primaryPath": "data.odds{}",
+            "columns": [{"path": "$odds_id", "dataType": "string", "columnName": "odds_id"}]
+            + infer_columns((odds[k] for k in sample(list(odds))), "$odds_id"),
+        }}),
+    }
+
+    for label, (mode, mapping) in mappings.items():
+        compiled = compile_mapping(mode, mapping)
+        rows = compiled.run(data)
+        assert rows == _interpreted_rows(mapping, data), label
+        for how, fn in (("interpreted", lambda: _interpreted_rows(mapping, data)),
+                        ("compiled", lambda: compiled.run(data))):
+            samples = _timed(fn, args.rounds)
+            _report(f"{label} {how}", samples)
+            print(f"{'':<28} {len(rows) / (min(samples) / 1000):12,.0f} rows/s")
+    _report("compile", _timed(lambda: compile_mapping(*mappings["array []"]), args.rounds))
+
+
+class _NullSink(io.RawIOBase):
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return len(b)
+
+
+def bench_columnar(args):
+    """Mapped rows held as per-row dicts vs. typed columns, and their serialization."""
+    import csv
+    from sampling import sample
+    from schema import infer_columns
+    from mapping import compile_mapping
+    from columnar import columnar, csv_chunks, ndjson_chunks, export, pyarrow
+
+    width = 40
+    kinds = (
+        lambda i: i,
+        lambda i: i / 7,
+        lambda i: i % 3 == 0,
+        lambda i: f"value {i}",
+        lambda i: None if i % 5 == 0 else i * 3,
+    )
+    records = [{f"c{j}": kinds[j % len(kinds)](i + j) for j in range(width)} for i in range(args.items * 20)]
+    data = {"data": {"rows": records}}
+    compiled = compile_mapping("1", {"table": {
+        "primaryPath": "data.rows[]",
+        "columns": infer_columns(sample(records)),
+    }})
+    names = compiled.field_names
+    print(f"rows={len(records)} columns={len(names)}")
+
+    def dicts():
+        return [dict(zip(names, row)) for row in compiled.rows(data)]
+
+    def table():
+        return columnar(compiled, data)
+
+    built_dicts, built_table = dicts(), table()
+    assert list(built_table.rows()) == [tuple(d.values()) for d in built_dicts]
+
+    def dicts_ndjson():
+        return "".join([json.dumps(d) + "\n" for d in built_dicts])
+
+    def dicts_csv():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, names)
+        writer.writeheader()
+        writer.writerows(built_dicts)
+        return buf.getvalue()
+
+    assert dicts_ndjson() == "".join(ndjson_chunks([built_table]))
+    assert dicts_csv() == "".join(csv_chunks([built_table]))
+
+    print(f"{'per-row dicts':<28} peak={_peak_kib(dicts) / 1024:8.1f} MiB")
+    print(f"{'typed columns':<28} peak={_peak_kib(table) / 1024:8.1f} MiB")
+    print(f"{'streamed to ndjson':<28} peak="
+          f"{_peak_kib(lambda: export(compiled, data, 'ndjson', _NullSink())) / 1024:8.1f} MiB")
+    print(f"{'streamed to csv':<28} peak="
+          f"{_peak_kib(lambda: export(compiled, data, 'csv', _NullSink())) / 1024:8.1f} MiB")
+    _report("rows to dicts", _timed(dicts, args.rounds))
+    _report("rows to columns", _timed(table, args.rounds))
+    _report("ndjson from dicts", _timed(dicts_ndjson, args.rounds))
+    _report("ndjson from columns", _timed(lambda: "".join(ndjson_chunks([built_table])), args.rounds))
+    _report("csv from dicts", _timed(dicts_csv, args.rounds))
+    _report("csv from columns", _timed(lambda: "".join(csv_chunks([built_table])), args.rounds))
+    if pyarrow is not None:
+        _report("parquet from columns", _timed(
+            lambda: export(compiled, data, "parquet", _NullSink()), args.rounds))
+
+
+def bench_materialize(args):
+    """Row-at-a-time INSERTs vs. bulk loads (executemany on SQLite, COPY on
+    Postgres) of a numeric-key mapping, then an incremental upsert. Pass
+    ``--database-url`` to run it on Postgres, where the bulk path pays off."""
+    import tempfile
+    from sqlalchemy import create_engine
+    from sampling import sample
+    from schema import infer_columns
+    from mapping import compile_mapping
+    from materialize import materialize
+
+    url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/materialize.db"
+    engine = create_engine(url)
+    data = synthetic_payload(args.items * 20)
+    odds = data["data"]["odds"]
+    compiled = compile_mapping("2", {"table": {
+        "primaryPath": "data.odds{}",
+        "columns": [{"path": "$odds_id", "dataType": "string", "columnName": "odds_id"}]
+        + infer_columns((odds[k] for k in sample(list(odds))), "$odds_id"),
+    }})
+    print(f"{engine.dialect.name}: {len(odds)} rows x {len(compiled.columns)} columns")
+    with engine.begin() as conn:
+        for table in ("bench_rows", "bench_bulk"):
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table}")
+
+    materialize(engine, compiled, {"data": {"odds": {}}}, "bench_rows")
+    marker = "%s" if engine.dialect.name == "postgresql" else "?"
+
+    def row_at_a_time():
+        conn = engine.raw_connection()
+        cursor = conn.cursor()
+        for row in compiled.rows(data):
+            cursor.execute(f"INSERT INTO bench_rows VALUES ({', '.join([marker] * len(row))})", row)
+        conn.commit()
+        conn.close()
+
+    for label, fn in (
+        ("row-at-a-time INSERT", row_at_a_time),
+        ("bulk load", lambda: materialize(engine, compiled, data, "bench_bulk")),
+        ("upsert, 10% changed", lambda: materialize(engine, compiled, changed, "bench_bulk")),
+    ):
+        changed = {"data": {"odds": {k: dict(v, home=2.0) for i, (k, v) in enumerate(odds.items()) if i % 10 == 0}}}
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        rows = len(changed["data"]["odds"]) if label.startswith("upsert") else len(odds)
+        print(f"{label:<28} {elapsed * 1000:8.1f} ms  {rows / elapsed:12,.0f} rows/s")
+
+
+def bench_blobs(args):
+    """Inline ``API.response`` text vs. compressed, content-addressed blobs:
+    file size, listing APIs, and reading one response back."""
+    import random
+    import tempfile
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from database import API, Base, load_response, upsert_api
+
+    rng = random.Random(7)
+    # paginated and re-captured endpoints make a share of bodies identical
+    distinct = [json.dumps(synthetic_payload(rng.randint(20, args.items))) for _ in range(args.sites)]
+    corpus = [(f"https://api.example/{i}", rng.choice(distinct) if i % 3 == 0 else distinct[i % len(distinct)])
+              for i in range(args.sites * 3)]
+    raw_bytes = sum(len(body) for _, body in corpus)
+    print(f"{len(corpus)} responses, {len(set(b for _, b in corpus))} distinct, {raw_bytes / 1024 / 1024:.1f} MiB")
+
+    tmp = tempfile.mkdtemp()
+    inline = create_engine(f"sqlite:///{tmp}/inline.db")
+    with inline.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE api (id INTEGER PRIMARY KEY, api TEXT NOT NULL, response TEXT NOT NULL)")
+        conn.exec_driver_sql("INSERT INTO api (api, response) VALUES (?, ?)", corpus)
+    blobs = create_engine(f"sqlite:///{tmp}/blobs.db")
+    Base.metadata.create_all(blobs)
+    with Session(blobs) as session:
+        for url, body in corpus:
+            upsert_api(session, url, body)
+    for label, engine in (("inline", inline), ("blobs", blobs)):
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        print(f"{label:<7} file {os.path.getsize(engine.url.database) / 1024 / 1024:8.1f} MiB")
+
+    ids = list(range(1, len(corpus) + 1))
+    rng.shuffle(ids)
+
+    def read_inline():
+        with inline.connect() as conn:
+            for api_id in ids[:50]:
+                json.loads(conn.exec_driver_sql("SELECT response FROM api WHERE id = ?", (api_id,)).scalar())
+
+    def read_blobs():
+        with Session(blobs) as session:
+            for api_id in ids[:50]:
+                json.loads(load_response(session, session.get(API, api_id)))
+
+    def list_inline():
+        with inline.connect() as conn:
+            conn.exec_driver_sql("SELECT * FROM api").all()
+
+    def list_blobs():
+        with Session(blobs) as session:
+            session.execute(select(API)).scalars().all()
+
+    _report("list rows, inline", _timed(list_inline, args.rounds))
+    _report("list rows, blobs", _timed(list_blobs, args.rounds))
+    _report("read 50 responses, inline", _timed(read_inline, args.rounds))
+    _report("read 50 responses, blobs", _timed(read_blobs, args.rounds))
+
+
+def bench_saved_apis(args):
+    """/saved-apis page time as the catalog grows, vs. listing every row."""
+    import tempfile
+    import multiprocessing
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from database import API, url_hash
+    from migrations import ensure_schema
+
+    ctx = multiprocessing.get_context("spawn")
+    for size in (1000, 10000, 100000):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{tmp}/app.db"
+            engine = create_engine(url)
+            ensure_schema(engine)
+            with engine.begin() as conn:
+                conn.exec_driver_sql("INSERT INTO response_blobs VALUES ('h', 'none', 2, x'7b7d')")
+                conn.exec_driver_sql(
+                    "INSERT INTO api (api, response, response_hash, url_hash) VALUES (?, '', 'h', ?)",
+                    [(f"https://api.example/items?page={i}", url_hash(f"https://api.example/items?page={i}"))
+                     for i in range(size)],
+                )
+
+            def list_all():
+                with Session(engine) as session:
+                    session.query(API).all()
+                    session.query(API).count()
+
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_app_worker, args=(child, {"DATABASE_URL": url, "CAPTURE_STORE_PATH": ""}),
+                               daemon=True)
+            proc.start()
+            assert parent.recv() == "ready"
+            try:
+                for label, path in (("first page", "/saved-apis"),
+                                    ("deep page", f"/saved-apis?after={size - 100}")):
+                    samples = []
+                    for _ in range(args.rounds):
+                        parent.send(("GET", path, None))
+                        status, elapsed, _, _ = parent.recv()
+                        assert status == 200, status
+                        samples.append(elapsed)
+                    _report(f"{size:>6} APIs, {label}", samples)
+            finally:
+                parent.send(None)
+                proc.join(timeout=10)
+            _report(f"{size:>6} APIs, every row", _timed(list_all, args.rounds))
+
+
+def bench_search(args):
+    """URL search over a large catalog: the trigram index vs. ``ILIKE``
+    for typeahead lookups and a filtered /saved-apis page."""
+    import random
+    import tempfile
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from database import API, url_hash
+    from migrations import ensure_schema
+    from search import _like, filter_by_url, search_urls
+
+    rng = random.Random(11)
+    hosts = [f"api{i}.{rng.choice(['example', 'sports', 'shop', 'data'])}.{rng.choice(['com', 'io', 'net'])}"
+             for i in range(2000)]
+    words = ["users", "orders", "events", "markets", "odds", "items", "search", "v1", "v2", "feed"]
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/app.db")
+        ensure_schema(engine)
+        urls = {f"https://{rng.choice(hosts)}/{rng.choice(words)}/{rng.choice(words)}?page={i}&id={rng.randrange(10**6)}"
+                for i in range(args.items * 20)}
+        with engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO response_blobs VALUES ('h', 'none', 2, x'7b7d')")
+            conn.exec_driver_sql(
+                "INSERT INTO api (api, response, response_hash, url_hash) VALUES (?, '', 'h', ?)",
+                [(u, url_hash(u)) for u in urls],
+            )
+        print(f"{len(urls)} URLs")
+
+        # rare, common and absent terms
+        terms = [hosts[7], "orders/odds", "https", "nothing-here"]
+        for term in terms:
+            with Session(engine) as session:
+                def indexed():
+                    search_urls(session, term)
+
+                def scanned():
+                    session.execute(select(API.id, API.api).where(_like(term)).order_by(API.id).limit(10)).all()
+
+                def page_indexed():
+                    query, key = filter_by_url(session, session.query(API.id, API.api), term)
+                    query.order_by(key).limit(51).all()
+
+                def page_scanned():
+                    session.query(API.id, API.api).filter(_like(term)).order_by(API.id).limit(51).all()
+
+                _report(f"{term[:14]:<14} typeahead idx", _timed(indexed, args.rounds))
+                _report(f"{term[:14]:<14} typeahead like", _timed(scanned, args.rounds))
+                _report(f"{term[:14]:<14} page idx", _timed(page_indexed, args.rounds))
+                _report(f"{term[:14]:<14} page like", _timed(page_scanned, args.rounds))
+
+
+def bench_key_paths(args):
+    """Which saved APIs have a field: the key-path index vs. parsing
+    every stored response, and the one-off backfill."""
+    import random
+    import tempfile
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from database import API, load_response, upsert_api
+    from json_index import build_index
+    from key_paths import backfill_key_paths, find_apis
+    from migrations import ensure_schema
+
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/app.db")
+        ensure_schema(engine)
+        with Session(engine) as session:
+            for i in range(args.sites * 30):
+                body = synthetic_payload(rng.randint(1, 50))
+                if i % 4:
+                    # a spread of shapes: rename one key
+                    body["data"][f"extra_{i % 97}"] = body["data"].pop("odds")
+                upsert_api(session, f"https://api.example/{i}", json.dumps(body))
+            count = session.query(API).count()
+            start = time.perf_counter()
+            backfill_key_paths(session)
+            print(f"{count} APIs, backfill {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        def parse_all():
+            with Session(engine) as session:
+                return [api.id for api in session.query(API).all()
+                        if "data.extra_5.{}" in build_index(json.loads(load_response(session, api))).paths]
+
+        def indexed():
+            with Session(engine) as session:
+                apis, after = find_apis(session, path="data.extra_5.{}", limit=500)
+                return [a["id"] for a in apis]
+
+        assert parse_all() == indexed()
+        _report("path, parse every response", _timed(parse_all, args.rounds))
+        _report("path, key-path index", _timed(indexed, args.rounds))
+        for label, kwargs in (("key price, first page", {"key": "price"}),
+                              ("prefix data.events", {"prefix": "data.events", "type_": "number"})):
+            def query():
+                with Session(engine) as session:
+                    find_apis(session, **kwargs)
+            _report(label, _timed(query, args.rounds))
+
+
+BENCHMARKS = {
+    "pool": bench_pool,
+    "batch": bench_batch,
+    "blocking": bench_blocking,
+    "cache": bench_cache,
+    "shared-store": bench_shared_store,
+    "index": bench_index,
+    "analysis": bench_analysis,
+    "walkers": bench_walkers,
+    "stream": bench_stream,
+    "schema": bench_schema,
+    "mapping": bench_mapping,
+    "columnar": bench_columnar,
+    "materialize": bench_materialize,
+    "blobs": bench_blobs,
+    "saved-apis": bench_saved_apis,
+    "search": bench_search,
+    "key-paths": bench_key_paths,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--sites", type=int, default=32)
+    parser.add_argument("--wait-ms", type=int, default=250)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--database-url", default=None, help="materialize target (default: a temporary SQLite file)")
+    args = parser.parse_args(argv)
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+import os
+import uuid
+import atexit
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+from playwright.async_api import async_playwright
+
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+BROWSER_POOL_CONTEXTS = int(os.getenv("BROWSER_POOL_CONTEXTS", "4"))
+BROWSER_POOL_MAX_PAGES = int(os.getenv("BROWSER_POOL_MAX_PAGES", "200"))
+BROWSER_POOL_MAX_RSS_MB = int(os.getenv("BROWSER_POOL_MAX_RSS_MB", "1024"))
+
+
+def _process_tree_rss(marker: str) -> Optional[int]:
+    """Resident memory in bytes of the Chromium launched with ``marker``
+    on its command line, plus all of its child processes (Linux only)."""
+    if not os.path.isdir("/proc"):
+        return None
+
+    parents = {}
+    root = None
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                stat = f.read().decode(errors="replace")
+            if root is None:
+                with open(f"/proc/{name}/cmdline", "rb") as f:
+                    if marker.encode() in f.read():
+                        root = int(name)
+        except OSError:
+            continue
+        # comm may contain spaces, so split after the closing paren
+        fields = stat[stat.rfind(")") + 2:].split()
+        parents[int(name)] = (int(fields[1]), int(fields[21]))
+
+    if root is None:
+        return None
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    tree = {root}
+    changed = True
+    while changed:
+        changed = False
+        for pid, (ppid, _) in parents.items():
+            if ppid in tree and pid not in tree:
+                tree.add(pid)
+                changed = True
+    return sum(parents[pid][1] for pid in tree if pid in parents) * page_size
+
+
+class _BrowserSlot:
+
+    def __init__(self, index: int):
+        self.index = index
+        self.marker = f"--api-inspector-slot={uuid.uuid4().hex}"
+        self.browser = None
+        self.active = 0
+        self.pages = 0
+        self.launches = 0
+        self.baseline_rss: Optional[int] = None
+        self.draining = False
+        self.lock = asyncio.Lock()
+
+    def healthy(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    """A set of warm headless Chromium browsers driven from one background
+    event loop.
+
+    Every job gets its own fresh ``BrowserContext``; browsers are relaunched
+    when they disconnect, after ``max_pages`` contexts, or once their process
+    tree has grown by more than ``max_rss_mb`` since launch.
+    """
+
+    def __init__(
+        self,
+        browsers: int = BROWSER_POOL_SIZE,
+        contexts_per_browser: int = BROWSER_POOL_CONTEXTS,
+        max_pages: int = BROWSER_POOL_MAX_PAGES,
+        max_rss_mb: int = BROWSER_POOL_MAX_RSS_MB,
+        headless: bool = True,
+    ):
+        self.browsers = max(1, browsers)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.headless = headless
+
+        self._slots: List[_BrowserSlot] = []
+        self._playwright = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._cond: Optional[asyncio.Condition] = None
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self) -> "BrowserPool":
+        if self._loop is not None:
+            return self
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="browser-pool", daemon=True
+        )
+        self._thread.start()
+        self._call(self._start())
+        return self
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        try:
+            self._call(self._stop(), timeout=30)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+    def __enter__(self) -> "BrowserPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    async def _start(self):
+        self._cond = asyncio.Condition()
+        self._playwright = await async_playwright().start()
+        self._slots = [_BrowserSlot(i) for i in range(self.browsers)]
+        await asyncio.gather(*(self._launch(slot) for slot in self._slots))
+
+    async def _stop(self):
+        for slot in self._slots:
+            if slot.browser is not None:
+                try:
+                    await slot.browser.close()
+                except Exception:
+                    pass
+                slot.browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _launch(self, slot: _BrowserSlot):
+        if slot.browser is not None:
+            try:
+                await slot.browser.close()
+            except Exception:
+                pass
+        slot.browser = await self._playwright.chromium.launch(
+            headless=self.headless, args=[slot.marker]
+        )
+        slot.pages = 0
+        slot.launches += 1
+        slot.draining = False
+        slot.baseline_rss = _process_tree_rss(slot.marker)
+
+    # -- checkout ------------------------------------------------------------
+
+    def _pick(self) -> Optional[_BrowserSlot]:
+        free = [
+            s for s in self._slots
+            if not s.draining and s.active < self.contexts_per_browser
+        ]
+        if not free:
+            return None
+        return min(free, key=lambda s: s.active)
+
+    async def _checkout(self) -> _BrowserSlot:
+        async with self._cond:
+            slot = self._pick()
+            while slot is None:
+                await self._cond.wait()
+                slot = self._pick()
+            slot.active += 1
+
+        try:
+            async with slot.lock:
+                if not slot.healthy():
+                    await self._launch(slot)
+        except Exception:
+            await self._checkin(slot)
+            raise
+        return slot
+
+    def _over_memory(self, slot: _BrowserSlot) -> bool:
+        if not self.max_rss_mb or slot.baseline_rss is None:
+            return False
+        rss = _process_tree_rss(slot.marker)
+        if rss is None:
+            return False
+        return rss - slot.baseline_rss > self.max_rss_mb * 1024 * 1024
+
+    async def _checkin(self, slot: _BrowserSlot):
+        slot.pages += 1
+        if not slot.healthy():
+            slot.draining = True
+        elif self.max_pages and slot.pages >= self.max_pages:
+            slot.draining = True
+        elif self._over_memory(slot):
+            slot.draining = True
+
+        async with self._cond:
+            slot.active -= 1
+            relaunch = slot.draining and slot.active == 0
+
+        if relaunch:
+            async with slot.lock:
+                try:
+                    await self._launch(slot)
+                except Exception:
+                    # leave it unhealthy; the next checkout retries the launch
+                    slot.browser = None
+                    slot.draining = False
+
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def run_async(self, job: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run ``job(context, *args, **kwargs)`` inside a fresh browser context.
+        Must be awaited on the pool's own event loop."""
+        slot = await self._checkout()
+        try:
+            context = await slot.browser.new_context()
+            try:
+                return await job(context, *args, **kwargs)
+            finally:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+        finally:
+            await self._checkin(slot)
+
+    # -- thread-safe entry points ----------------------------------------------
+
+    def _call(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def submit(self, job: Callable[..., Awaitable[Any]], *args, **kwargs):
+        """Schedule a job from any thread and return a ``concurrent.futures.Future``."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(
+            self.run_async(job, *args, **kwargs), self._loop
+        )
+
+    def run(self, job: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Blocking variant of :meth:`submit`."""
+        return self.submit(job, *args, **kwargs).result()
+
+    def run_coroutine(self, coro, timeout: Optional[float] = None) -> Any:
+        """Run an arbitrary coroutine on the pool's loop, e.g. one that fans
+        out over :meth:`run_async`, and block until it finishes."""
+        self.start()
+        return self._call(coro, timeout)
+
+    @property
+    def capacity(self) -> int:
+        return self.browsers * self.contexts_per_browser
+
+    def check_health(self) -> List[dict]:
+        """Relaunch idle browsers that have crashed and report every slot."""
+        async def check():
+            for slot in self._slots:
+                async with slot.lock:
+                    if slot.active == 0 and not slot.healthy():
+                        await self._launch(slot)
+            return self.stats()
+
+        self.start()
+        return self._call(check())
+
+    def stats(self) -> List[dict]:
+        return [
+            {
+                "index": s.index,
+                "connected": s.healthy(),
+                "active": s.active,
+                "pages": s.pages,
+                "launches": s.launches,
+                "rss": _process_tree_rss(s.marker),
+            }
+            for s in self._slots
+        ]
+
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> BrowserPool:
+    """Process-wide pool, started on first use and closed at exit."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool().start()
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from compression import compress, decompress
+from parser import LazyBody
+from urlnorm import normalize_url
+
+CAPTURE_CACHE_ENABLED = os.getenv("CAPTURE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CAPTURE_CACHE_PATH = os.getenv("CAPTURE_CACHE_PATH", "./capture_cache.db")
+CAPTURE_CACHE_TTL_S = int(os.getenv("CAPTURE_CACHE_TTL_S", "900"))
+CAPTURE_CACHE_MAX_MB = int(os.getenv("CAPTURE_CACHE_MAX_MB", "256"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_captures_accessed_at ON captures (accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+"""
+
+
+def serialize_apis(apis: List[Dict[str, Any]]) -> bytes:
+    """Encode capture records with each body kept as its JSON text."""
+    wire = []
+    for api in apis:
+        data = api.get("data")
+        if isinstance(data, LazyBody):
+            body = data.raw.decode("utf-8", "replace")
+        elif data is None:
+            body = None
+        else:
+            body = json.dumps(data)
+        rec = {k: v for k, v in api.items() if k != "data"}
+        rec["body"] = body
+        wire.append(rec)
+    return json.dumps(wire).encode()
+
+
+def deserialize_apis(payload: bytes, lazy: bool = False) -> List[Dict[str, Any]]:
+    apis = []
+    for rec in json.loads(payload):
+        body = rec.pop("body", None)
+        if body is None:
+            rec["data"] = None
+        elif lazy:
+            rec["data"] = LazyBody(body.encode())
+        else:
+            rec["data"] = json.loads(body)
+        apis.append(rec)
+    return apis
+
+
+def _key(url: str, variant: str) -> str:
+    # normalized URLs carry no fragment, so "#" cannot clash with one
+    key = normalize_url(url)
+    return f"{key}#{variant}" if variant else key
+
+
+class CaptureCache:
+    """SQLite-backed cache of captured API lists keyed by normalized page URL
+    and a ``variant`` naming how it was captured (wait mode, blocking), with
+    a TTL and least-recently-used eviction by total compressed size."""
+
+    def __init__(self, path: str = CAPTURE_CACHE_PATH, ttl_s: int = CAPTURE_CACHE_TTL_S,
+                 max_bytes: int = CAPTURE_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _bump(self, conn, name, by=1):
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (by, name))
+
+    def get(self, url: str, lazy: bool = False, variant: str = "") -> Optional[Dict[str, Any]]:
+        """Return ``{"apis", "age_s"}`` for a fresh entry, else None."""
+        key = _key(url, variant)
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT created_at, codec, payload FROM captures WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or now - row[0] > self.ttl_s:
+            if row is not None:
+                conn.execute("DELETE FROM captures WHERE key = ?", (key,))
+            self._bump(conn, "misses")
+            return None
+
+        conn.execute("UPDATE captures SET accessed_at = ? WHERE key = ?", (now, key))
+        self._bump(conn, "hits")
+        apis = deserialize_apis(decompress(row[1], row[2]), lazy=lazy)
+        return {"apis": apis, "age_s": round(now - row[0], 1)}
+
+    def put(self, url: str, apis: List[Dict[str, Any]], variant: str = "") -> None:
+        codec, payload = compress(serialize_apis(apis))
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO captures (key, url, created_at, accessed_at, size, codec, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (_key(url, variant), url, now, now, len(payload), codec, payload),
+        )
+        self.evict()
+
+    def invalidate(self, url: str) -> None:
+        """Drop every variant of ``url``."""
+        key = normalize_url(url)
+        # "#" sorts just before "$", so the range holds exactly "key#..."
+        self._conn().execute(
+            "DELETE FROM captures WHERE key = ? OR (key > ? AND key < ?)", (key, key + "#", key + "$")
+        )
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until the
+        cache fits in ``max_bytes``. Returns the number of entries removed."""
+        conn = self._conn()
+        removed = conn.execute(
+            "DELETE FROM captures WHERE created_at < ?", (time.time() - self.ttl_s,)
+        ).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM captures").fetchone()[0]
+        if total > self.max_bytes:
+            victims = []
+            for key, size in conn.execute("SELECT key, size FROM captures ORDER BY accessed_at"):
+                if total <= self.max_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM captures WHERE key = ?", victims)
+            removed += len(victims)
+
+        if removed:
+            self._bump(conn, "evictions", removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM counters"))
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM captures"
+        ).fetchone()
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "evictions": counters["evictions"],
+            "hit_ratio": round(counters["hits"] / lookups, 3) if lookups else None,
+            "entries": entries,
+            "bytes": size,
+            "ttl_s": self.ttl_s,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_cache: Optional[CaptureCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_capture_cache() -> Optional[CaptureCache]:
+    """Process-wide cache, or None when CAPTURE_CACHE_ENABLED is off."""
+    global _cache
+    if not CAPTURE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = CaptureCache()
+        return _cache
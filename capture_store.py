@@ -0,0 +1,344 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from compression import compress, decompress
+from json_index import StructuralIndex, build_index, index_from_dict
+from parser import LazyBody, resolve_data
+
+CAPTURE_STORE_TTL_S = int(os.getenv("CAPTURE_STORE_TTL_S", "3600"))
+CAPTURE_STORE_MAX_MB = int(os.getenv("CAPTURE_STORE_MAX_MB", "512"))
+CAPTURE_STORE_MAX_CAPTURES = int(os.getenv("CAPTURE_STORE_MAX_CAPTURES", "256"))
+# Shared SQLite file every worker process reads captures from; set it empty
+# to keep captures in process memory only (single-worker deployments).
+CAPTURE_STORE_PATH = os.getenv("CAPTURE_STORE_PATH", "./capture_store.db")
+CAPTURE_STORE_SHARED_MAX_MB = int(os.getenv("CAPTURE_STORE_SHARED_MAX_MB", "2048"))
+
+
+def _record_size(api: Dict[str, Any]) -> int:
+    if api.get("size") is not None:
+        return api["size"]
+    data = api.get("data")
+    if isinstance(data, LazyBody):
+        return len(data)
+    if data is None:
+        return 0
+    return len(json.dumps(data, separators=(",", ":")))
+
+
+class StoredBody(LazyBody):
+    """A body still sitting compressed in the shared store; it is fetched
+    and decompressed the first time its bytes are needed."""
+
+    __slots__ = ("_loader", "_nonempty", "_size", "_raw")
+
+    def __init__(self, loader, nonempty: bool, size: int):
+        self._loader = loader
+        self._nonempty = nonempty
+        self._size = size
+        self._raw = None
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = self._loader()
+        return self._raw
+
+    def __bool__(self) -> bool:
+        return self._nonempty
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def _body_bytes(api: Dict[str, Any]) -> Optional[bytes]:
+    data = api.get("data")
+    if isinstance(data, LazyBody):
+        return data.raw
+    if data is None:
+        return None
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+class Capture:
+    """One capture's API records, indexed by API URL."""
+
+    def __init__(self, capture_id: str, site: Optional[str], apis: List[Dict[str, Any]],
+                 stats: Optional[Dict[str, Any]] = None, created_at: Optional[float] = None):
+        self.id = capture_id
+        self.site = site
+        self.stats = stats
+        self.created_at = created_at or time.time()
+        self.accessed_at = time.time()
+        self.synced_at = self.accessed_at
+
+        # first record wins, as with the old linear scan
+        self.apis: Dict[str, Dict[str, Any]] = {}
+        for api in apis:
+            self.apis.setdefault(api.get("url"), api)
+        self.size = sum(_record_size(a) for a in self.apis.values())
+        self._indexes: Dict[str, StructuralIndex] = {}
+        # streamed uploads arrive with the index built while parsing
+        for url, api in self.apis.items():
+            index = api.get("index")
+            if isinstance(index, dict):
+                index = api["index"] = index_from_dict(index)
+            if index is not None:
+                self._indexes[url] = index
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        return self.apis.get(url)
+
+    def data(self, url: str) -> Any:
+        api = self.apis.get(url)
+        return resolve_data(api) if api is not None else None
+
+    def index(self, url: str) -> StructuralIndex:
+        """Structural index of one response, built on first use."""
+        index = self._indexes.get(url)
+        if index is None:
+            index = build_index(self.data(url))
+            self._indexes[url] = index
+        return index
+
+    def listing(self) -> List[Dict[str, Any]]:
+        return [a for a in self.apis.values() if a.get("data")]
+
+
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id TEXT PRIMARY KEY,
+    site TEXT,
+    stats TEXT,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_captures_accessed_at ON captures (accessed_at);
+CREATE TABLE IF NOT EXISTS capture_apis (
+    capture_id TEXT NOT NULL REFERENCES captures (id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    meta TEXT NOT NULL,
+    nonempty INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    codec TEXT,
+    body BLOB,
+    PRIMARY KEY (capture_id, url)
+);
+"""
+
+
+class SharedCaptureBackend:
+    """Captures in a SQLite file (WAL mode) shared by all worker processes.
+
+    Record metadata is loaded with the capture; each body is stored
+    compressed and only read back when a route asks for that API's data.
+    """
+
+    def __init__(self, path: str = CAPTURE_STORE_PATH, ttl_s: int = CAPTURE_STORE_TTL_S,
+                 max_bytes: int = CAPTURE_STORE_SHARED_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(_SHARED_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def save(self, capture: Capture) -> None:
+        rows = []
+        for position, (url, api) in enumerate(capture.apis.items()):
+            raw = _body_bytes(api)
+            codec, blob = compress(raw) if raw is not None else (None, None)
+            meta = {k: v for k, v in api.items() if k != "data"}
+            if isinstance(meta.get("index"), StructuralIndex):
+                meta["index"] = meta["index"].to_dict()
+            rows.append((capture.id, url, position, json.dumps(meta),
+                         int(bool(api.get("data"))), len(raw or b""), codec, blob))
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO captures (id, site, stats, created_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (capture.id, capture.site, json.dumps(capture.stats), capture.created_at,
+                 capture.accessed_at, capture.size),
+            )
+            conn.executemany(
+                "INSERT INTO capture_apis (capture_id, url, position, meta, nonempty, size, codec, body) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.evict(keep=capture.id)
+
+    def _load_body(self, capture_id: str, url: str) -> bytes:
+        row = self._conn().execute(
+            "SELECT codec, body FROM capture_apis WHERE capture_id = ? AND url = ?",
+            (capture_id, url),
+        ).fetchone()
+        if row is None or row[1] is None:
+            return b""
+        return decompress(row[0], row[1])
+
+    def load(self, capture_id: str) -> Optional[Capture]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT site, stats, created_at, accessed_at FROM captures WHERE id = ?", (capture_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[3] > self.ttl_s:
+            conn.execute("DELETE FROM captures WHERE id = ?", (capture_id,))
+            return None
+        conn.execute("UPDATE captures SET accessed_at = ? WHERE id = ?", (now, capture_id))
+
+        apis = []
+        for url, meta, nonempty, size, has_body in conn.execute(
+            "SELECT url, meta, nonempty, size, codec IS NOT NULL FROM capture_apis "
+            "WHERE capture_id = ? ORDER BY position",
+            (capture_id,),
+        ):
+            api = json.loads(meta)
+            if has_body:
+                loader = (lambda u=url: self._load_body(capture_id, u))
+                api["data"] = StoredBody(loader, bool(nonempty), size)
+            else:
+                api["data"] = None
+            apis.append(api)
+
+        stats = json.loads(row[1]) if row[1] else None
+        return Capture(capture_id, row[0], apis, stats, created_at=row[2])
+
+    def touch(self, capture_id: str) -> None:
+        self._conn().execute("UPDATE captures SET accessed_at = ? WHERE id = ?", (time.time(), capture_id))
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM captures WHERE accessed_at < ?", (time.time() - self.ttl_s,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM captures").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for capture_id, size in conn.execute("SELECT id, size FROM captures ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            if capture_id == keep:
+                continue
+            victims.append((capture_id,))
+            total -= size
+        conn.executemany("DELETE FROM captures WHERE id = ?", victims)
+
+
+class CaptureStore:
+    """Store of captures keyed by capture ID.
+
+    Captures live in an in-process LRU and, when a ``backend`` is given, in
+    storage shared with other worker processes, so a capture made on one
+    worker can be read on any other. Captures expire ``ttl_s`` after their
+    last access, and the least recently used ones are dropped from memory to
+    stay within ``max_captures`` and ``max_bytes``.
+    """
+
+    def __init__(self, ttl_s: int = CAPTURE_STORE_TTL_S,
+                 max_bytes: int = CAPTURE_STORE_MAX_MB * 1024 * 1024,
+                 max_captures: int = CAPTURE_STORE_MAX_CAPTURES,
+                 backend: Optional[SharedCaptureBackend] = None):
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.max_captures = max_captures
+        self.backend = backend
+        self._captures: "OrderedDict[str, Capture]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, site: Optional[str], apis: List[Dict[str, Any]],
+            stats: Optional[Dict[str, Any]] = None) -> Capture:
+        capture = Capture(uuid.uuid4().hex, site, apis, stats)
+        if self.backend is not None:
+            self.backend.save(capture)
+        with self._lock:
+            self._remember(capture)
+        return capture
+
+    def _remember(self, capture: Capture) -> None:
+        self._captures[capture.id] = capture
+        self._size += capture.size
+        self._evict()
+
+    def get(self, capture_id: Optional[str]) -> Optional[Capture]:
+        if not capture_id:
+            return None
+        with self._lock:
+            capture = self._captures.get(capture_id)
+            now = time.time()
+            if capture is not None and now - capture.accessed_at > self.ttl_s:
+                self._remove(capture_id)
+                capture = None
+            if capture is not None:
+                capture.accessed_at = now
+                self._captures.move_to_end(capture_id)
+
+        if capture is None:
+            if self.backend is None:
+                return None
+            capture = self.backend.load(capture_id)
+            if capture is None:
+                return None
+            with self._lock:
+                existing = self._captures.get(capture_id)
+                if existing is not None:
+                    return existing
+                self._remember(capture)
+        elif self.backend is not None and now - capture.synced_at > self.ttl_s / 10:
+            # keep the shared copy from expiring while this worker uses it
+            capture.synced_at = now
+            self.backend.touch(capture_id)
+        return capture
+
+    def _remove(self, capture_id: str) -> None:
+        capture = self._captures.pop(capture_id)
+        self._size -= capture.size
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl_s
+        for capture_id in [c.id for c in self._captures.values() if c.accessed_at < cutoff]:
+            self._remove(capture_id)
+        # never evict the newest capture, even if it alone exceeds the budget
+        while len(self._captures) > 1 and (
+            len(self._captures) > self.max_captures or self._size > self.max_bytes
+        ):
+            self._remove(next(iter(self._captures)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "captures": len(self._captures),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "max_captures": self.max_captures,
+                "ttl_s": self.ttl_s,
+            }
+
+
+capture_store = CaptureStore(
+    backend=SharedCaptureBackend() if CAPTURE_STORE_PATH else None
+)
@@ -0,0 +1,285 @@
+import io
+import os
+import csv
+import json
+from array import array
+from json.encoder import encode_basestring_ascii
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional, Sequence
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet and Arrow output are unavailable
+    pyarrow = None
+
+COLUMNAR_BATCH_ROWS = int(os.getenv("COLUMNAR_BATCH_ROWS", "8192"))
+# rows transposed into columns at a time; small enough to stay in cache
+_TRANSPOSE_ROWS = 1024
+# rows per chunk of CSV or NDJSON text, so a chunk's cell strings stay small
+_TEXT_CHUNK_ROWS = 1024
+
+FORMATS = ("ndjson", "csv", "parquet", "arrow")
+
+_TYPECODES = {"int": "q", "float": "d", "bool": "b"}
+_FILL = {"int": 0, "float": 0.0, "bool": False, "string": ""}
+_NON_FINITE = {"nan": "NaN", "inf": "Infinity", "-inf": "-Infinity"}
+
+
+def _text(value: Any) -> str:
+    # nested objects and arrays keep their JSON form in a string column
+    return value if value.__class__ is str else json.dumps(value)
+
+
+class Column:
+    """One mapped column: its values in a typed ``array`` (a list of str for
+    ``string`` columns) and a byte mask that is 1 where the row is null.
+
+    Values that do not fit the mapping's ``dataType`` widen the column the
+    way ``schema.merge_types`` does: int to float, anything else to string.
+    """
+
+    __slots__ = ("name", "data_type", "values", "nulls", "null_count")
+
+    def __init__(self, name: str, data_type: str = "string"):
+        self.name = name
+        self.data_type = data_type if data_type in _FILL else "string"
+        code = _TYPECODES.get(self.data_type)
+        self.values = array(code) if code else []
+        self.nulls = bytearray()
+        self.null_count = 0
+
+    def __len__(self) -> int:
+        return len(self.nulls)
+
+    def extend(self, values: Sequence[Any]) -> None:
+        if None in values:
+            mask = bytes([v is None for v in values])
+            fill = _FILL[self.data_type]
+            values = [fill if v is None else v for v in values]
+            self.null_count += mask.count(1)
+        else:
+            mask = bytes(len(values))
+        self._extend(values)
+        self.nulls += mask
+
+    def _extend(self, values: Sequence[Any]) -> None:
+        if self.data_type == "string":
+            if set(map(type, values)) == {str}:
+                self.values.extend(values)
+            else:
+                self.values.extend([_text(v) for v in values])
+            return
+        if self.data_type == "bool" and not set(map(type, values)) <= {bool}:
+            self._widen("string")
+            return self._extend(values)
+
+        try:
+            # fromlist leaves the array as it was when a value does not fit
+            self.values.fromlist(values if values.__class__ is list else list(values))
+        except (TypeError, OverflowError) as e:
+            numeric = isinstance(e, TypeError) and all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) for v in values
+            )
+            self._widen("float" if numeric and self.data_type == "int" else "string")
+            self._extend(values)
+
+    def _widen(self, data_type: str) -> None:
+        old = self.values
+        if data_type == "float":
+            self.values = array("d", old)
+        else:
+            if self.data_type == "bool":
+                old = map(bool, old)
+            self.values = ["" if null else _text(v) for v, null in zip(old, self.nulls)]
+        self.data_type = data_type
+
+    def to_pylist(self, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+        values = self.values[start:stop]
+        if self.data_type == "bool":
+            values = list(map(bool, values))
+        elif self.data_type != "string":
+            values = values.tolist()
+        if self.null_count:
+            values = [None if null else v for v, null in zip(values, self.nulls[start:stop])]
+        return values
+
+    def to_json(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """Every cell from ``start`` to ``stop`` as JSON text, with ``null``
+        for nulls."""
+        values = self.values[start:stop]
+        if self.data_type == "string":
+            texts = list(map(encode_basestring_ascii, values))
+        elif self.data_type == "bool":
+            texts = ["true" if v else "false" for v in values]
+        elif self.data_type == "int":
+            texts = list(map(str, values))
+        else:
+            texts = list(map(repr, values))
+            for raw, literal in _NON_FINITE.items():
+                if raw in texts:
+                    texts = [literal if t == raw else t for t in texts]
+        if self.null_count:
+            texts = ["null" if null else t for t, null in zip(texts, self.nulls[start:stop])]
+        return texts
+
+    def to_arrow(self):
+        pa = pyarrow
+        n = len(self)
+        if self.data_type == "string":
+            arr = pa.array(self.values, pa.string())
+        elif self.data_type == "bool":
+            arr = pa.Array.from_buffers(pa.int8(), n, [None, pa.py_buffer(self.values)]).cast(pa.bool_())
+        else:
+            arrow_type = pa.int64() if self.data_type == "int" else pa.float64()
+            arr = pa.Array.from_buffers(arrow_type, n, [None, pa.py_buffer(self.values)])
+        if not self.null_count:
+            return arr
+        nulls = pa.Array.from_buffers(pa.uint8(), n, [None, pa.py_buffer(self.nulls)])
+        validity = pa.compute.equal(nulls, 0).buffers()[1]
+        return pa.Array.from_buffers(arr.type, n, [validity] + arr.buffers()[1:], null_count=self.null_count)
+
+
+class ColumnarTable:
+    """Rows of a mapping held column by column."""
+
+    __slots__ = ("columns", "num_rows")
+
+    def __init__(self, names: Sequence[str], data_types: Sequence[str]):
+        self.columns = [Column(name, data_type) for name, data_type in zip(names, data_types)]
+        self.num_rows = 0
+
+    @property
+    def names(self) -> List[str]:
+        return [c.name for c in self.columns]
+
+    @property
+    def data_types(self) -> List[str]:
+        return [c.data_type for c in self.columns]
+
+    def extend(self, num_rows: int, columns: Sequence[Sequence[Any]]) -> None:
+        for column, values in zip(self.columns, columns):
+            column.extend(values)
+        self.num_rows += num_rows
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[tuple]:
+        return zip(*[c.to_pylist(start, stop) for c in self.columns])
+
+    def to_arrow(self):
+        if pyarrow is None:
+            raise ValueError("Parquet and Arrow output need pyarrow installed")
+        return pyarrow.table([c.to_arrow() for c in self.columns], names=self.names)
+
+
+def columnar(compiled, data: Any, limit: Optional[int] = None) -> ColumnarTable:
+    """One table for every row a compiled mapping reads from ``data``."""
+    table = ColumnarTable(compiled.field_names, compiled.data_types)
+    for num_rows, columns in compiled.column_batches(data, _TRANSPOSE_ROWS, limit):
+        table.extend(num_rows, columns)
+    return table
+
+
+def columnar_batches(compiled, data: Any, limit: Optional[int] = None,
+                     batch_rows: Optional[int] = None) -> Iterator[ColumnarTable]:
+    """Tables of about ``batch_rows`` rows each, so output can be written
+    while the mapping runs; there is always at least one, maybe empty.
+    Columns widened in one batch start the next one widened."""
+    batch_rows = batch_rows or COLUMNAR_BATCH_ROWS
+    table = ColumnarTable(compiled.field_names, compiled.data_types)
+    yielded = False
+    for num_rows, columns in compiled.column_batches(data, min(batch_rows, _TRANSPOSE_ROWS), limit):
+        table.extend(num_rows, columns)
+        if table.num_rows >= batch_rows:
+            yield table
+            yielded = True
+            table = ColumnarTable(compiled.field_names, table.data_types)
+    if table.num_rows or not yielded:
+        yield table
+
+
+def csv_chunks(tables: Iterable[ColumnarTable]) -> Iterator[str]:
+    """CSV text, a header and then one chunk per ``_TEXT_CHUNK_ROWS`` rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for i, table in enumerate(tables):
+        if i == 0:
+            writer.writerow(table.names)
+        for start in range(0, table.num_rows, _TEXT_CHUNK_ROWS):
+            writer.writerows(table.rows(start, start + _TEXT_CHUNK_ROWS))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        # the header of a mapping with no rows
+        yield buf.getvalue()
+
+
+def ndjson_chunks(tables: Iterable[ColumnarTable]) -> Iterator[str]:
+    """One JSON object per row, as ``json.dumps`` writes it, one chunk per
+    ``_TEXT_CHUNK_ROWS`` rows.
+
+    Cells are encoded a column at a time and spliced into a per-table line
+    template, so no row dict is built.
+    """
+    for table in tables:
+        if not table.num_rows:
+            continue
+        if not table.columns:
+            yield "{}\n" * table.num_rows
+            continue
+        line = "{" + ", ".join(f"{encode_basestring_ascii(name)}: %s" for name in table.names) + "}\n"
+        for start in range(0, table.num_rows, _TEXT_CHUNK_ROWS):
+            stop = start + _TEXT_CHUNK_ROWS
+            yield "".join([line % cells for cells in zip(*[c.to_json(start, stop) for c in table.columns])])
+
+
+def write_arrow(tables: Iterable[ColumnarTable], sink: BinaryIO, file_format: str = "parquet") -> None:
+    """Write tables to ``sink`` as one Parquet file or Arrow IPC stream.
+
+    The first table fixes the schema; later tables are cast to it, and a
+    column that had to widen past it afterwards raises ``ValueError``.
+    """
+    if pyarrow is None:
+        raise ValueError("Parquet and Arrow output need pyarrow installed")
+    writer = None
+    try:
+        for table in tables:
+            arrow_table = table.to_arrow()
+            if writer is None:
+                schema = arrow_table.schema
+                if file_format == "parquet":
+                    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+                else:
+                    writer = pyarrow.ipc.new_stream(sink, schema)
+            elif arrow_table.schema != schema:
+                try:
+                    arrow_table = arrow_table.cast(schema)
+                except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError) as e:
+                    raise ValueError(f"column types changed after the first batch: {e}") from e
+            writer.write_table(arrow_table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export(compiled, data: Any, file_format: str, out: BinaryIO, limit: Optional[int] = None,
+           batch_rows: Optional[int] = None) -> int:
+    """Stream the rows a compiled mapping reads from ``data`` to ``out`` in
+    one of ``FORMATS``; returns the row count."""
+    count = 0
+
+    def counted(tables):
+        nonlocal count
+        for table in tables:
+            count += table.num_rows
+            yield table
+
+    tables = counted(columnar_batches(compiled, data, limit, batch_rows))
+    if file_format in ("parquet", "arrow"):
+        write_arrow(tables, out, file_format)
+        return count
+    chunks = csv_chunks(tables) if file_format == "csv" else ndjson_chunks(tables)
+    for chunk in chunks:
+        out.write(chunk.encode())
+    return count
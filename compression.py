@@ -0,0 +1,31 @@
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zlib only
+    zstandard = None
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+# "zstd" when zstandard is installed, else "zlib"; "zlib" forces zlib
+COMPRESSION_CODEC = os.getenv("COMPRESSION_CODEC", "zstd" if zstandard is not None else "zlib")
+
+
+def compress(raw: bytes):
+    """Return ``(codec, blob)`` for ``raw``."""
+    if COMPRESSION_CODEC == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd blob but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "none":
+        return bytes(blob)
+    raise ValueError(f"unknown codec {codec!r}")
@@ -0,0 +1,42 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# how stale another worker's counts can be; 0 recomputes on every request
+COUNT_CACHE_TTL_S = float(os.getenv("COUNT_CACHE_TTL_S", "60"))
+
+
+class CountCache:
+    """Aggregate counts for listing pages, recomputed at most once per
+    ``ttl_s`` unless a write invalidates them first.
+
+    The cache is per process and only the worker that made a write
+    invalidates it, so with several workers the others keep serving their
+    counts for up to ``COUNT_CACHE_TTL_S``.
+    """
+
+    def __init__(self, ttl_s: float = COUNT_CACHE_TTL_S):
+        self.ttl_s = ttl_s
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            hit = self._values.get(key)
+        if hit is not None and time.monotonic() - hit[0] < self.ttl_s:
+            return hit[1]
+        value = compute()
+        with self._lock:
+            self._values[key] = (time.monotonic(), value)
+        return value
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+
+count_cache = CountCache()
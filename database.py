@@ -1,9 +1,19 @@
 
 import os
 import json
+import hashlib
 from contextlib import contextmanager
-from sqlalchemy import create_engine, Column, Integer, Text, String, ForeignKey, Table
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from typing import Tuple
+from sqlalchemy import (
+    create_engine, Column, Integer, Text, String, LargeBinary, ForeignKey, Table, Index, select, update
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, deferred
+
+from compression import compress, decompress
+from urlnorm import normalize_url
 
 # Use SQLite database by default if DATABASE_URL is not set
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./api_inspector.db")
@@ -25,11 +35,29 @@ api_tags = Table('api_tags', Base.metadata,
     Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True)
 )
 
+class ResponseBlob(Base):
+    """A response body stored once per content, compressed."""
+    __tablename__ = "response_blobs"
+    # sha256 of the uncompressed body
+    hash = Column(String(64), primary_key=True)
+    codec = Column(String(16), nullable=False)
+    size = Column(Integer, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+
+
 class API(Base):
     __tablename__ = "api"
     id = Column(Integer, primary_key=True, autoincrement=True)
     api = Column(Text, nullable=False)
-    response = Column(Text, nullable=False)
+    # bodies saved before response_blobs existed; empty once moved there
+    response = deferred(Column(Text, nullable=False, default=""))
+    response_hash = Column(String(64), ForeignKey("response_blobs.hash"), index=True)
+    # json_index shape fingerprint of the response
+    shape_hash = Column(String(40), index=True)
+    # url_hash() of api; one row per normalized URL
+    url_hash = Column(String(40))
+
+    __table_args__ = (Index("ux_api_url_hash", "url_hash", unique=True),)
 
     mappings = relationship("Mapper", back_populates="api")
     tags = relationship("Tag", secondary=api_tags, backref="apis")
@@ -59,6 +87,111 @@ class Mapper(Base):
     api = relationship("API", back_populates="mappings")
     data = relationship("Data", back_populates="mappings")
 
+
+class KeyPath(Base):
+    """A key path in an API's stored response, once per JSON type seen there."""
+    __tablename__ = "key_paths"
+    api_id = Column(Integer, ForeignKey("api.id"), primary_key=True)
+    # json_index path: dotted keys, "{}" for numeric ids; list items share
+    # their list's path
+    path = Column(Text, primary_key=True)
+    type = Column(String(16), primary_key=True)
+    # last segment of path, to find a field at any depth
+    key = Column(Text, nullable=False)
+
+    __table_args__ = (
+        # api_id next: matches of one path come out in id order, for paging;
+        # text_pattern_ops lets Postgres serve prefix LIKEs from the index
+        Index("ix_key_paths_path", "path", "api_id", "type", postgresql_ops={"path": "text_pattern_ops"}),
+        Index("ix_key_paths_key", "key", "api_id"),
+    )
+
+def store_response(session, response: str) -> str:
+    """Hash of ``response``, adding its compressed blob if the content is new."""
+    raw = response.encode()
+    h = hashlib.sha256(raw).hexdigest()
+    if session.get(ResponseBlob, h) is not None:
+        return h
+    codec, blob = compress(raw)
+    values = dict(hash=h, codec=codec, size=len(raw), body=blob)
+    insert = _UPSERT_INSERTS.get(session.get_bind().dialect.name)
+    if insert is not None:
+        session.execute(insert(ResponseBlob).values(**values).on_conflict_do_nothing(index_elements=[ResponseBlob.hash]))
+        return h
+    try:
+        with session.begin_nested():
+            session.add(ResponseBlob(**values))
+    except IntegrityError:
+        pass
+    return h
+
+
+def load_response(session, api) -> str:
+    """The response body saved for ``api``, read and decompressed now."""
+    if api.response_hash is None:
+        return api.response
+    codec, blob = session.execute(
+        select(ResponseBlob.codec, ResponseBlob.body).where(ResponseBlob.hash == api.response_hash)
+    ).one()
+    return decompress(codec, blob).decode()
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha1(normalize_url(url).encode()).hexdigest()
+
+
+_UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def insert_api(session, api_url: str, response: str, shape_hash: str = None) -> Tuple[int, bool]:
+    """Id of the ``API`` row for ``api_url`` and whether this call inserted it.
+
+    An existing row is returned untouched: it keeps its response and its
+    shape. The row is claimed with one ``INSERT ... ON CONFLICT (url_hash)
+    DO NOTHING RETURNING``, so concurrent saves of a URL agree on a single
+    row and a known URL costs that one statement plus reading its id; only
+    the save that inserted it writes the body to ``response_blobs``, in the
+    same transaction.
+    """
+    h = url_hash(api_url)
+    insert = _UPSERT_INSERTS.get(session.get_bind().dialect.name)
+    if insert is None:
+        # without ON CONFLICT a known URL would write its blob only to roll
+        # it back, so look first
+        existing = session.execute(select(API.id).where(API.url_hash == h)).scalar()
+        if existing is not None:
+            return existing, False
+        try:
+            response_hash = store_response(session, response)
+            api = API(api=api_url, url_hash=h, response="", response_hash=response_hash, shape_hash=shape_hash)
+            session.add(api)
+            session.commit()
+            return api.id, True
+        except IntegrityError:
+            # the rollback drops the blob written for it too
+            session.rollback()
+            return session.execute(select(API.id).where(API.url_hash == h)).scalar_one(), False
+
+    stmt = insert(API).values(api=api_url, url_hash=h, response="", shape_hash=shape_hash)
+    api_id = session.execute(
+        stmt.on_conflict_do_nothing(index_elements=[API.url_hash]).returning(API.id)
+    ).scalar()
+    if api_id is None:
+        # already saved, possibly by a concurrent request
+        session.rollback()
+        return session.execute(select(API.id).where(API.url_hash == h)).scalar_one(), False
+    response_hash = store_response(session, response)
+    session.execute(update(API).where(API.id == api_id).values(response_hash=response_hash))
+    session.commit()
+    return api_id, True
+
+
+def upsert_api(session, api_url: str, response: str, shape_hash: str = None) -> int:
+    """Id of the ``API`` row for ``api_url``, inserted with ``response`` if
+    the URL is new; see ``insert_api``."""
+    return insert_api(session, api_url, response, shape_hash)[0]
+
+
 @contextmanager
 def db_session():
     """Create a new database session with proper cleanup."""
@@ -0,0 +1,261 @@
+import re
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sampling import sample
+
+_NUMERIC_KEY = re.compile(r"\d+")
+
+# A location inside a document: dict keys and list positions from the root.
+Steps = Tuple[Any, ...]
+
+
+def json_type(value: Any) -> str:
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return "null"
+
+
+def resolve_steps(data: Any, steps: Optional[Steps]) -> Any:
+    if steps is None:
+        return None
+    cur = data
+    for step in steps:
+        cur = cur[step]
+    return cur
+
+
+class StructuralIndex:
+    """Everything the extract and generate-mapping routes need to know about
+    one response, gathered in a single traversal.
+
+    ``arrays``, ``id_objects`` and ``model3`` hold exactly what
+    ``find_arrays``, ``extract_id_objects`` and ``extract_objects_model3``
+    return; the ``*_steps`` maps locate the first non-empty array or object
+    stored under each key so mappings can be generated without another walk.
+    """
+
+    def __init__(self):
+        self.arrays: Dict[str, List[str]] = {}
+        self.id_objects: List[Dict[str, Any]] = []
+        self.model3: List[Dict[str, Any]] = []
+        # dotted key path -> JSON types seen there; list elements share their
+        # list's path and numeric ids collapse to "{}"
+        self.paths: Dict[str, List[str]] = {}
+        # (path, candidate_name, visible, first_node, end_node) in preorder
+        self.numeric_paths: List[Tuple[str, str, bool, int, int]] = []
+        self.array_steps: Dict[str, Steps] = {}
+        self.object_steps: Dict[str, Tuple[Steps, Tuple[str, ...]]] = {}
+        self.root_type: Optional[str] = None
+
+    def find_array(self, data: Any, name: str) -> Optional[list]:
+        return resolve_steps(data, self.array_steps.get(name))
+
+    def find_object(self, data: Any, name: str):
+        """Return ``(object, key_segments)`` like the model-3 lookup, or ``(None, None)``."""
+        if name not in self.object_steps:
+            return None, None
+        steps, segments = self.object_steps[name]
+        return resolve_steps(data, steps), list(segments)
+
+    def numeric_object_path(self, object_name: str) -> Optional[str]:
+        """Same answer as ``parser.find_numeric_object_path``.
+
+        A match at an empty path below the root is swallowed by that search
+        along with the rest of its subtree, so it is skipped the same way here.
+        """
+        skip_until = -1
+        for path, candidate_name, visible, first, end in self.numeric_paths:
+            if first < skip_until:
+                continue
+            if not object_name or candidate_name == object_name:
+                if visible:
+                    return path
+                skip_until = end
+        return None
+
+    def shape_hash(self) -> str:
+        """Fingerprint of the document's shape: its key paths and the JSON
+        types found at each, ignoring values, array lengths and ids."""
+        canonical = json.dumps([self.root_type, sorted(self.paths.items())], separators=(",", ":"))
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-safe form, for storing an index alongside its capture."""
+        return {
+            "arrays": self.arrays,
+            "id_objects": self.id_objects,
+            "model3": self.model3,
+            "paths": self.paths,
+            "numeric_paths": self.numeric_paths,
+            "array_steps": self.array_steps,
+            "object_steps": self.object_steps,
+            "root_type": self.root_type,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "StructuralIndex":
+        index = cls()
+        index.arrays = state["arrays"]
+        index.id_objects = state["id_objects"]
+        index.model3 = state["model3"]
+        index.paths = state["paths"]
+        index.numeric_paths = [tuple(entry) for entry in state["numeric_paths"]]
+        index.array_steps = {k: tuple(v) for k, v in state["array_steps"].items()}
+        index.object_steps = {k: (tuple(v[0]), tuple(v[1])) for k, v in state["object_steps"].items()}
+        index.root_type = state.get("root_type")
+        return index
+
+
+class StreamedIndex(StructuralIndex):
+    """Index of a document that was parsed as a stream and never held in
+    memory whole.
+
+    The data stored next to it is only a preview, so the first non-empty
+    array and object under each key are kept here as samples (lists cut to
+    their first item, numeric-keyed objects to their first entry), which is
+    all mapping generation reads from them.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.array_samples: Dict[str, list] = {}
+        self.object_samples: Dict[str, dict] = {}
+
+    def find_array(self, data: Any, name: str) -> Optional[list]:
+        return self.array_samples.get(name)
+
+    def find_object(self, data: Any, name: str):
+        if name not in self.object_steps:
+            return None, None
+        return self.object_samples[name], list(self.object_steps[name][1])
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = super().to_dict()
+        state["streamed"] = True
+        state["array_samples"] = self.array_samples
+        state["object_samples"] = self.object_samples
+        return state
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "StreamedIndex":
+        index = super().from_dict(state)
+        index.array_samples = state["array_samples"]
+        index.object_samples = state["object_samples"]
+        return index
+
+
+def index_from_dict(state: Dict[str, Any]) -> StructuralIndex:
+    cls = StreamedIndex if state.get("streamed") else StructuralIndex
+    return cls.from_dict(state)
+
+
+def build_index(data: Any) -> StructuralIndex:
+
+    index = StructuralIndex()
+    index.root_type = json_type(data)
+    arrays_full: Dict[str, List[str]] = {}
+    id_keys: Dict[str, Set[str]] = {}
+    model3_seen = set()
+    path_types: Dict[str, Set[str]] = {}
+    node = 0
+    # keys and list positions from the root to the current node
+    steps: List[Any] = []
+    # one frame per open container: (children, in_list, path, shape_path,
+    # model3_path, numeric_keys, numeric_entry); children are (key, value)
+    # pairs for dicts and (position, item) pairs for lists
+    stack: List[Tuple[Any, bool, str, str, Optional[str], bool, Optional[int]]] = []
+    end = object()
+
+    def enter(obj: Any, path: str, shape_path: str, model3_path: Optional[str]):
+        nonlocal node
+        current = node
+        node += 1
+        if isinstance(obj, dict):
+            numeric_entry = None
+            numeric_keys = [k for k in obj.keys() if isinstance(k, str) and _NUMERIC_KEY.fullmatch(k)]
+            if numeric_keys:
+                object_name = path.split(".")[-1] if path else "root"
+                object_name = object_name.strip() or "root"
+                keys = id_keys.setdefault(object_name, set())
+                # a budgeted sample of the entries, not all of them
+                for nk in sample(numeric_keys):
+                    val = obj.get(nk)
+                    if isinstance(val, dict):
+                        keys.update(val.keys())
+                # find_numeric_object_path only surfaces an empty path for the root itself
+                numeric_entry = len(index.numeric_paths)
+                index.numeric_paths.append(
+                    (path, path.split(".")[-1] if path else "", bool(path or not steps), current, current)
+                )
+
+            if model3_path is not None:
+                object_name = model3_path.split(".")[-1]
+                keys_list = list(obj.keys())
+                signature = (object_name, tuple(keys_list))
+                if signature not in model3_seen:
+                    model3_seen.add(signature)
+                    index.model3.append({"object_name": object_name, "keys_list": keys_list})
+
+            stack.append((iter(obj.items()), False, path, shape_path, model3_path, bool(numeric_keys), numeric_entry))
+
+        elif isinstance(obj, list):
+            if len(obj) > 0 and isinstance(obj[0], dict):
+                arrays_full[path] = list(obj[0].keys())
+            stack.append((enumerate(obj), True, path, shape_path, None, False, None))
+
+    enter(data, "", "", "root" if isinstance(data, dict) else None)
+    while stack:
+        children, in_list, path, shape_path, model3_path, numeric, numeric_entry = stack[-1]
+        child = next(children, end)
+        if child is end:
+            stack.pop()
+            if numeric_entry is not None:
+                index.numeric_paths[numeric_entry] = index.numeric_paths[numeric_entry][:4] + (node,)
+            # the root container has no step of its own
+            if stack:
+                steps.pop()
+            continue
+
+        k, v = child
+        if in_list:
+            steps.append(k)
+            enter(v, path, shape_path, None)
+        else:
+            new_path = f"{path}.{k}" if path else k
+            # ids of numeric-keyed objects collapse to one "{}" segment
+            seg = "{}" if numeric and _NUMERIC_KEY.fullmatch(k) else k
+            new_shape_path = f"{shape_path}.{seg}" if shape_path else seg
+            types = path_types.get(new_shape_path)
+            if types is None:
+                types = path_types[new_shape_path] = set()
+            types.add(json_type(v))
+            steps.append(k)
+            if v and k not in index.array_steps and isinstance(v, list):
+                index.array_steps[k] = tuple(steps)
+            if v and k not in index.object_steps and isinstance(v, dict):
+                index.object_steps[k] = (tuple(steps), tuple(s for s in steps if isinstance(s, str)))
+            enter(v, new_path, new_shape_path, f"{model3_path}.{k}" if model3_path is not None else None)
+
+        if not isinstance(v, (dict, list)):
+            steps.pop()
+
+    for full_path, keys in arrays_full.items():
+        name = full_path.split(".")[-1] if full_path else "root"
+        index.arrays[name] = keys
+
+    index.id_objects = [
+        {"object_name": name, "key_id": f"{name}_id", "keys_list": sorted(keys)}
+        for name, keys in id_keys.items()
+    ]
+    index.paths = {p: sorted(types) for p, types in path_types.items()}
+    return index
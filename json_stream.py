@@ -0,0 +1,363 @@
+import os
+import re
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+import ijson
+
+from json_index import StreamedIndex, json_type
+from sampling import Sampler
+
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", str(64 * 1024)))
+
+_NUMERIC_KEY = re.compile(r"\d+")
+
+Event = Tuple[str, Any]
+
+
+def basic_parse(stream: BinaryIO, chunk_size: int = STREAM_CHUNK_BYTES) -> Iterator[Event]:
+    """Yield ijson ``basic_parse`` events for the JSON document in ``stream``,
+    reading it ``chunk_size`` bytes at a time."""
+    return ijson.basic_parse(stream, buf_size=chunk_size, use_float=True)
+
+
+class _Frame:
+    """An open container while its events are being read."""
+
+    __slots__ = (
+        "is_list", "node", "thin", "path", "shape_path", "model3_path", "preorder",
+        "keys", "count", "key", "claim", "sampler", "slots", "positions", "reordered",
+        "numeric_name", "numeric_count", "id_slots", "numeric_entry", "empty_path",
+        "array_head", "id_parent",
+    )
+
+    def __init__(self, is_list, node, thin, path, shape_path, model3_path, preorder):
+        self.is_list = is_list
+        self.node = node
+        # thin previews keep one item per array and one entry per
+        # numeric-keyed object; the others keep a budgeted sample
+        self.thin = thin
+        self.path = path
+        self.shape_path = shape_path
+        self.model3_path = model3_path
+        self.preorder = preorder
+        self.keys: Optional[Dict[str, None]] = None if is_list else {}
+        self.count = 0
+        self.key = None
+        # key this container is a candidate sample for, as ("array"|"object", key)
+        self.claim = None
+        # sampling of list items or numeric-keyed entries: the sampler, the
+        # key (dicts) and position of what each slot of the preview holds
+        self.sampler: Optional[Sampler] = Sampler() if is_list and node is not None and not thin else None
+        self.slots: List[Any] = []
+        self.positions: List[int] = []
+        self.reordered = False
+        self.numeric_name = None
+        self.numeric_count = 0
+        self.id_slots: Optional[Dict[int, List[str]]] = None
+        self.numeric_entry = None
+        self.empty_path = False
+        # set on the first item of an array of objects and on sampled entries
+        # of a numeric-keyed object, whose keys are recorded when they close
+        self.array_head = None
+        self.id_parent = None
+
+
+def _place(frame: _Frame, slot: int, position: int, key: Any, value: Any) -> None:
+    """Put a sampled child into its slot of the frame's preview node."""
+    node = frame.node
+    if slot < len(frame.positions):
+        frame.reordered = True
+        frame.positions[slot] = position
+        if frame.is_list:
+            node[slot] = value
+            return
+        del node[frame.slots[slot]]
+        frame.slots[slot] = key
+    else:
+        frame.positions.append(position)
+        if frame.is_list:
+            node.append(value)
+            return
+        frame.slots.append(key)
+    node[key] = value
+
+
+def _restore_order(frame: _Frame) -> None:
+    """Put sampled children back in document order after replacements."""
+    node = frame.node
+    if frame.is_list:
+        node[:] = [v for _, v in sorted(zip(frame.positions, node), key=lambda pv: pv[0])]
+        return
+    order = {k: i for i, k in enumerate(frame.keys)}
+    items = sorted(node.items(), key=lambda kv: order[kv[0]])
+    node.clear()
+    node.update(items)
+
+
+def stream_index(events: Iterator[Event]) -> Tuple[Any, StreamedIndex]:
+    """Build the structural index of a document from its parse events.
+
+    Gives the same answers as ``json_index.build_index`` on the parsed
+    document while only holding the open containers, the key sets being
+    collected and a preview of the document. The preview keeps a budgeted
+    sample (see ``sampling``) of each array and numeric-keyed object along
+    the first items; everything below a later item is thin, with one item
+    per array and one entry per numeric-keyed object. Returns
+    ``(preview, index)``.
+    """
+    index = StreamedIndex()
+    # array path -> [preorder of its first item, that item's keys]
+    arrays_full: Dict[str, list] = {}
+    # object name -> [preorder of its first numeric-keyed object, key union]
+    id_keys: Dict[str, list] = {}
+    # model-3 signature -> preorder of its first object
+    model3_first: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+    path_types: Dict[str, Set[str]] = {}
+    numeric_entries: List[list] = []
+    numeric_first: Dict[str, list] = {}
+    empty_paths = 0
+    node = 0
+    steps: List[Any] = []
+    stack: List[_Frame] = []
+    root: List[Any] = []
+
+    def numeric_object(frame: _Frame):
+        path = frame.path
+        name = path.split(".")[-1] if path else "root"
+        name = name.strip() or "root"
+        frame.numeric_name = name
+        frame.id_slots = {}
+        if frame.sampler is None:
+            frame.sampler = Sampler()
+        entry = id_keys.get(name)
+        if entry is None:
+            id_keys[name] = [frame.preorder, set()]
+        elif frame.preorder < entry[0]:
+            entry[0] = frame.preorder
+
+        candidate = path.split(".")[-1] if path else ""
+        visible = bool(path or frame is stack[0])
+        # outside empty-path subtrees only the first object per name can
+        # ever be the answer, so later ones need not be kept
+        inside = empty_paths - frame.empty_path > 0
+        frame.numeric_entry = [path, candidate, visible, frame.preorder, frame.preorder]
+        if visible and not inside:
+            # objects are detected in the order their first id shows up,
+            # which is not preorder, so keep the earliest per name
+            first = numeric_first.get(candidate)
+            if first is None or frame.preorder < first[3]:
+                numeric_first[candidate] = frame.numeric_entry
+        else:
+            numeric_entries.append(frame.numeric_entry)
+
+    def value(kind: str, scalar: Any = None):
+        nonlocal node, empty_paths
+        preorder = node
+        node += 1
+        parent = key = sample = None
+        # where the value goes in the preview: ("root"|"key"|"slot", ...)
+        place = None
+        thin = False
+        id_slot = None
+
+        if not stack:
+            path = shape_path = ""
+            model3_path = "root" if kind == "start_map" else None
+            place = "root"
+        else:
+            parent = stack[-1]
+            position = parent.count
+            if position == 0 and parent.claim is not None:
+                # a non-empty container: it becomes the sample for its key
+                claim_kind, claim_key = parent.claim
+                if claim_kind == "array" and claim_key not in index.array_steps:
+                    index.array_steps[claim_key] = tuple(steps)
+                    index.array_samples[claim_key] = parent.node
+                elif claim_kind == "object" and claim_key not in index.object_steps:
+                    index.object_steps[claim_key] = (
+                        tuple(steps), tuple(s for s in steps if isinstance(s, str))
+                    )
+                    index.object_samples[claim_key] = parent.node
+
+            if parent.is_list:
+                steps.append(position)
+                path, shape_path, model3_path = parent.path, parent.shape_path, None
+                if parent.node is not None:
+                    if parent.thin:
+                        place = "append" if position == 0 else None
+                    else:
+                        slot = parent.sampler.offer()
+                        place = None if slot is None else ("slot", slot, position)
+                thin = parent.thin or position > 0
+                if position == 0 and kind == "start_map":
+                    # stamped with the item's preorder: keys recorded when
+                    # it closes only stand if no later array at the same
+                    # path has claimed the slot meanwhile
+                    arrays_full[path] = [preorder, None]
+            else:
+                key = parent.key
+                steps.append(key)
+                numeric = _NUMERIC_KEY.fullmatch(key) is not None
+                path = f"{parent.path}.{key}" if parent.path else key
+                # ids of numeric-keyed objects collapse to one "{}" segment
+                seg = "{}" if numeric else key
+                shape_path = f"{parent.shape_path}.{seg}" if parent.shape_path else seg
+                types = path_types.get(shape_path)
+                if types is None:
+                    types = path_types[shape_path] = set()
+                types.add(_EVENT_TYPES.get(kind) or json_type(scalar))
+                model3_path = f"{parent.model3_path}.{key}" if parent.model3_path is not None else None
+
+                if numeric:
+                    if parent.numeric_name is None:
+                        numeric_object(parent)
+                    numeric_position = parent.numeric_count
+                    parent.numeric_count += 1
+                    slot = id_slot = parent.sampler.offer()
+                    if slot is not None:
+                        # whatever held the slot before is out of the sample
+                        parent.id_slots.pop(slot, None)
+                    if parent.node is not None:
+                        if parent.thin:
+                            place = "key" if numeric_position == 0 else None
+                        elif slot is not None:
+                            place = ("slot", slot, position)
+                    thin = parent.thin or numeric_position > 0
+                else:
+                    place = "key" if parent.node is not None else None
+                    thin = parent.thin
+
+                if kind == "start_array" and key not in index.array_steps:
+                    sample = ("array", key)
+                elif kind == "start_map" and key not in index.object_steps:
+                    sample = ("object", key)
+            parent.count += 1
+
+        if kind not in _EVENT_TYPES:
+            if place is not None:
+                _attach(parent, place, key, scalar, root)
+            if parent is not None:
+                steps.pop()
+            return
+
+        container = None
+        if sample is not None:
+            # samples for mapping generation are never thin
+            thin = False
+        if place is not None or sample is not None:
+            container = {} if kind == "start_map" else []
+            if place is not None:
+                _attach(parent, place, key, container, root)
+
+        frame = _Frame(kind == "start_array", container, thin, path, shape_path, model3_path, preorder)
+        frame.claim = sample
+        if parent is not None and kind == "start_map":
+            if parent.is_list:
+                if position == 0:
+                    frame.array_head = path
+            elif id_slot is not None:
+                frame.id_parent = (parent, id_slot)
+            if not path:
+                # below the root, find_numeric_object_path swallows matches at
+                # an empty path together with everything under them
+                frame.empty_path = True
+                empty_paths += 1
+        stack.append(frame)
+
+    def close():
+        nonlocal empty_paths
+        frame = stack.pop()
+        if frame.numeric_entry is not None:
+            frame.numeric_entry[4] = node
+        if frame.empty_path:
+            empty_paths -= 1
+        if frame.reordered:
+            _restore_order(frame)
+        if not frame.is_list:
+            keys = list(frame.keys)
+            if frame.array_head is not None:
+                slot = arrays_full[frame.array_head]
+                if slot[0] == frame.preorder:
+                    slot[1] = keys
+            if frame.id_parent is not None:
+                parent, id_slot = frame.id_parent
+                parent.id_slots[id_slot] = keys
+            if frame.id_slots:
+                keys_set = id_keys[frame.numeric_name][1]
+                for sampled in frame.id_slots.values():
+                    keys_set.update(sampled)
+            if frame.model3_path is not None:
+                signature = (frame.model3_path.split(".")[-1], tuple(keys))
+                first = model3_first.get(signature)
+                if first is None or frame.preorder < first:
+                    model3_first[signature] = frame.preorder
+        if stack:
+            steps.pop()
+
+    for event, payload in events:
+        if event == "map_key":
+            frame = stack[-1]
+            frame.key = payload
+            frame.keys[payload] = None
+        elif event == "end_map" or event == "end_array":
+            close()
+        else:
+            value(event, payload)
+
+    for full_path, (_, keys) in arrays_full.items():
+        name = full_path.split(".")[-1] if full_path else "root"
+        index.arrays[name] = keys
+
+    index.id_objects = [
+        {"object_name": name, "key_id": f"{name}_id", "keys_list": sorted(keys)}
+        for name, (_, keys) in sorted(id_keys.items(), key=lambda item: item[1][0])
+    ]
+    index.model3 = [
+        {"object_name": name, "keys_list": list(keys)}
+        for (name, keys), _ in sorted(model3_first.items(), key=lambda item: item[1])
+    ]
+    index.paths = {p: sorted(types) for p, types in path_types.items()}
+    index.root_type = json_type(root[0] if root else None)
+    index.numeric_paths = sorted(
+        (tuple(e) for e in numeric_entries + list(numeric_first.values())), key=lambda e: e[3]
+    )
+    return (root[0] if root else None), index
+
+
+def _attach(parent: Optional[_Frame], place: Any, key: Any, value: Any, root: List[Any]) -> None:
+    if place == "root":
+        root.append(value)
+    elif place == "append":
+        parent.node.append(value)
+    elif place == "key":
+        parent.node[key] = value
+    else:
+        _, slot, position = place
+        _place(parent, slot, position, key, value)
+
+
+_EVENT_TYPES = {"start_map": "object", "start_array": "array"}
+
+
+def ingest(stream: BinaryIO, chunk_size: int = STREAM_CHUNK_BYTES) -> Tuple[Any, StreamedIndex, int]:
+    """Parse a JSON document from a binary stream in bounded memory.
+    Returns ``(preview, index, bytes_read)``."""
+    counted = _CountingReader(stream)
+    preview, index = stream_index(basic_parse(counted, chunk_size))
+    return preview, index, counted.bytes_read
+
+
+class _CountingReader:
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            # ijson probes with read(0); werkzeug's request stream takes an
+            # empty read for a client disconnect
+            return b""
+        chunk = self.stream.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
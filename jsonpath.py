@@ -0,0 +1,379 @@
+import os
+import re
+import ast
+import functools
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+
+# A match: the keys and list positions from the root, and the value there.
+Node = Tuple[Tuple[Any, ...], Any]
+Step = Callable[[Iterator[Node]], Iterator[Node]]
+
+_NAME = re.compile(r"[^.\[\]\s]+")
+_INT = re.compile(r"-?\d+")
+_SLICE = re.compile(r"(-?\d+)?:(-?\d+)?(?::(-?\d+)?)?")
+_FILTER_TOKEN = re.compile(r"""\s*(?:
+    (?P<num>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<str>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<op>==|!=|<=|>=|<|>|&&|\|\||!|\(|\))
+  | (?P<path>@(?:\.[^.\[\]\s()=!<>&|]+|\[(?:-?\d+|'[^']*'|"[^"]*")\])*)
+  | (?P<word>true|false|null)
+)""", re.X)
+_MISSING = object()
+
+
+def format_path(steps: Tuple[Any, ...]) -> str:
+    """Normalized JSONPath of a match, e.g. ``$['events'][0]['id']``."""
+    parts = ["$"]
+    for step in steps:
+        if isinstance(step, int):
+            parts.append(f"[{step}]")
+        else:
+            escaped = step.replace("\\", "\\\\").replace("'", "\\'")
+            parts.append(f"['{escaped}']")
+    return "".join(parts)
+
+
+def _children(value: Any) -> Iterator[Tuple[Any, Any]]:
+    if isinstance(value, dict):
+        return iter(value.items())
+    if isinstance(value, list):
+        return enumerate(value)
+    return iter(())
+
+
+def _child_nodes(path: Tuple[Any, ...], value: Any) -> Iterator[Node]:
+    for k, v in _children(value):
+        yield path + (k,), v
+
+
+def _descendants(nodes: Iterator[Node]) -> Iterator[Node]:
+    """Each node and everything below it, in document order."""
+    for node in nodes:
+        stack = [iter([node])]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                continue
+            yield child
+            path, value = child
+            if isinstance(value, (dict, list)):
+                stack.append(_child_nodes(path, value))
+
+
+def _select_name(name: str) -> Step:
+    def step(nodes):
+        for path, value in nodes:
+            if isinstance(value, dict) and name in value:
+                yield path + (name,), value[name]
+    return step
+
+
+def _select_all(nodes: Iterator[Node]) -> Iterator[Node]:
+    for path, value in nodes:
+        yield from _child_nodes(path, value)
+
+
+def _select_key(name: str) -> Step:
+    """A dotpath segment: a dict key, or a list position if it is a number."""
+    i = int(name)
+
+    def step(nodes):
+        for path, value in nodes:
+            if isinstance(value, dict):
+                if name in value:
+                    yield path + (name,), value[name]
+            elif isinstance(value, list) and -len(value) <= i < len(value):
+                yield path + (i % len(value),), value[i]
+    return step
+
+
+def _select_index(i: int) -> Step:
+    def step(nodes):
+        for path, value in nodes:
+            if isinstance(value, list) and -len(value) <= i < len(value):
+                yield path + (i % len(value),), value[i]
+    return step
+
+
+def _select_slice(bounds: slice) -> Step:
+    def step(nodes):
+        for path, value in nodes:
+            if isinstance(value, list):
+                for i in range(*bounds.indices(len(value))):
+                    yield path + (i,), value[i]
+    return step
+
+
+def _select_union(selectors: List[Step]) -> Step:
+    def step(nodes):
+        for node in nodes:
+            for select in selectors:
+                yield from select(iter([node]))
+    return step
+
+
+def _select_filter(test: Callable[[Any], bool]) -> Step:
+    def step(nodes):
+        for path, value in nodes:
+            for k, v in _children(value):
+                if test(v):
+                    yield path + (k,), v
+    return step
+
+
+def _recursive(select: Step) -> Step:
+    return lambda nodes: select(_descendants(nodes))
+
+
+def _string(literal: str) -> str:
+    return ast.literal_eval(literal)
+
+
+def _relative_getter(path: str) -> Callable[[Any], Any]:
+    """Getter for a filter's ``@.a[0]['b']`` path; ``_MISSING`` where it ends."""
+    keys = []
+    for match in re.finditer(r"\.([^.\[\]]+)|\[(-?\d+)\]|\[('[^']*'|\"[^\"]*\")\]", path[1:]):
+        name, index, quoted = match.groups()
+        keys.append(int(index) if index is not None else name if name is not None else _string(quoted))
+
+    def get(value):
+        for key in keys:
+            if isinstance(key, int):
+                if not isinstance(value, list) or not -len(value) <= key < len(value):
+                    return _MISSING
+            elif not isinstance(value, dict) or key not in value:
+                return _MISSING
+            value = value[key]
+        return value
+    return get
+
+
+_COMPARE = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+class _FilterParser:
+    """``||``, ``&&``, ``!``, parentheses and comparisons between ``@``
+    paths and JSON literals."""
+
+    def __init__(self, text: str):
+        self.tokens = []
+        pos = 0
+        while pos < len(text):
+            if text[pos:].strip() == "":
+                break
+            match = _FILTER_TOKEN.match(text, pos)
+            if match is None or match.end() == pos:
+                raise ValueError(f"bad filter near {text[pos:]!r}")
+            kind = match.lastgroup
+            self.tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        self.pos = 0
+
+    def parse(self) -> Callable[[Any], bool]:
+        test = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"unexpected {self.tokens[self.pos][1]!r} in filter")
+        return test
+
+    def _peek(self) -> Optional[str]:
+        if self.pos < len(self.tokens) and self.tokens[self.pos][0] == "op":
+            return self.tokens[self.pos][1]
+        return None
+
+    def _or(self):
+        tests = [self._and()]
+        while self._peek() == "||":
+            self.pos += 1
+            tests.append(self._and())
+        return tests[0] if len(tests) == 1 else (lambda v: any(t(v) for t in tests))
+
+    def _and(self):
+        tests = [self._unary()]
+        while self._peek() == "&&":
+            self.pos += 1
+            tests.append(self._unary())
+        return tests[0] if len(tests) == 1 else (lambda v: all(t(v) for t in tests))
+
+    def _unary(self):
+        op = self._peek()
+        if op == "!":
+            self.pos += 1
+            test = self._unary()
+            return lambda v: not test(v)
+        if op == "(":
+            self.pos += 1
+            test = self._or()
+            if self._peek() != ")":
+                raise ValueError("unbalanced parentheses in filter")
+            self.pos += 1
+            return test
+
+        left = self._operand()
+        op = self._peek()
+        if op not in _COMPARE:
+            return lambda v: left(v) is not _MISSING
+        self.pos += 1
+        right, compare = self._operand(), _COMPARE[op]
+
+        def test(v):
+            a, b = left(v), right(v)
+            if a is _MISSING or b is _MISSING:
+                return False
+            try:
+                return compare(a, b)
+            except TypeError:
+                return False
+        return test
+
+    def _operand(self) -> Callable[[Any], Any]:
+        if self.pos >= len(self.tokens):
+            raise ValueError("filter ends early")
+        kind, text = self.tokens[self.pos]
+        self.pos += 1
+        if kind == "path":
+            return _relative_getter(text)
+        if kind == "num":
+            value = float(text) if any(c in text for c in ".eE") else int(text)
+        elif kind == "str":
+            value = _string(text)
+        elif kind == "word":
+            value = {"true": True, "false": False, "null": None}[text]
+        else:
+            raise ValueError(f"unexpected {text!r} in filter")
+        return lambda v: value
+
+
+def _bracket_end(expr: str, pos: int) -> int:
+    """Position of the ``]`` closing the bracket opened at ``pos``."""
+    depth, quote = 0, None
+    for i in range(pos, len(expr)):
+        c = expr[i]
+        if quote:
+            if c == "\\":
+                continue
+            if c == quote and expr[i - 1] != "\\":
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c in "[(":
+            depth += 1
+        elif c in "])":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("unclosed [")
+
+
+def _split_union(inner: str) -> List[str]:
+    parts, start, quote = [], 0, None
+    for i, c in enumerate(inner):
+        if quote:
+            if c == quote and inner[i - 1] != "\\":
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == ",":
+            parts.append(inner[start:i].strip())
+            start = i + 1
+    parts.append(inner[start:].strip())
+    return parts
+
+
+def _bracket(inner: str) -> Step:
+    inner = inner.strip()
+    if inner == "*":
+        return _select_all
+    if inner.startswith("?"):
+        body = inner[1:].strip()
+        if body.startswith("(") and body.endswith(")"):
+            body = body[1:-1]
+        return _select_filter(_FilterParser(body).parse())
+
+    selectors = []
+    for part in _split_union(inner):
+        if _INT.fullmatch(part):
+            selectors.append(_select_index(int(part)))
+        elif _SLICE.fullmatch(part):
+            start, stop, stride = (int(g) if g else None for g in _SLICE.fullmatch(part).groups())
+            if stride == 0:
+                raise ValueError("slice step cannot be zero")
+            selectors.append(_select_slice(slice(start, stop, stride)))
+        elif len(part) >= 2 and part[0] == part[-1] and part[0] in "'\"":
+            selectors.append(_select_name(_string(part)))
+        else:
+            raise ValueError(f"bad selector [{part}]")
+    return selectors[0] if len(selectors) == 1 else _select_union(selectors)
+
+
+class Query:
+    """A compiled path expression; ``find(data)`` yields ``(path, value)``
+    matches lazily, in document order."""
+
+    __slots__ = ("expression", "_steps")
+
+    def __init__(self, expression: str, steps: List[Step]):
+        self.expression = expression
+        self._steps = steps
+
+    def find(self, data: Any) -> Iterator[Node]:
+        nodes = iter([((), data)])
+        for step in self._steps:
+            nodes = step(nodes)
+        return nodes
+
+
+def _parse(expr: str) -> List[Step]:
+    steps = []
+    pos = 1 if expr.startswith("$") else 0
+    while pos < len(expr):
+        recursive = expr.startswith("..", pos)
+        if recursive:
+            pos += 2
+        elif expr[pos] == ".":
+            pos += 1
+        elif expr[pos] != "[" and pos > 0:
+            raise ValueError(f"unexpected {expr[pos]!r} at {pos}")
+
+        if pos < len(expr) and expr[pos] == "[":
+            end = _bracket_end(expr, pos)
+            select = _bracket(expr[pos + 1:end])
+            pos = end + 1
+        elif expr.startswith("*", pos):
+            select = _select_all
+            pos += 1
+        else:
+            match = _NAME.match(expr, pos)
+            if match is None:
+                raise ValueError(f"expected a key at {pos}")
+            name = match.group()
+            # plain dotpaths step into lists by position too
+            select = _select_key(name) if _INT.fullmatch(name) else _select_name(name)
+            pos = match.end()
+        steps.append(_recursive(select) if recursive else select)
+    return steps
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def compile_query(expression: str) -> Query:
+    """Compile a JSONPath-like expression, cached by its text.
+
+    Supports ``$``, ``.key`` and ``['key']``, ``*``, ``..`` (recursive
+    descent), list indices and slices (``[0]``, ``[-1]``, ``[1:10:2]``),
+    unions (``[0,2]``, ``['a','b']``) and filters such as
+    ``[?(@.price > 10 && @.tags[0] == 'x')]``. Plain dotpaths like
+    ``events.0.id`` work as well. Raises ``ValueError`` on bad syntax.
+    """
+    expression = expression.strip()
+    if not expression:
+        raise ValueError("empty query")
+    return Query(expression, _parse(expression))
@@ -0,0 +1,142 @@
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, exists, or_, select
+from sqlalchemy.orm import Session
+
+from database import API, KeyPath, Tag, api_tags, load_response, _UPSERT_INSERTS
+from json_index import build_index
+
+KEY_PATHS_PAGE_SIZE = int(os.getenv("KEY_PATHS_PAGE_SIZE", "50"))
+KEY_PATHS_MAX_PAGE_SIZE = int(os.getenv("KEY_PATHS_MAX_PAGE_SIZE", "500"))
+KEY_PATHS_BACKFILL_BATCH = int(os.getenv("KEY_PATHS_BACKFILL_BATCH", "200"))
+
+
+def normalize_path(path: str) -> Tuple[str, bool]:
+    """``odds/home``, ``./odds/home`` or ``$.odds.home`` the way paths are
+    stored, ``odds.home``, and whether ``$`` anchored it at the root."""
+    path = path.strip()
+    rooted = path.startswith("$")
+    if rooted:
+        path = path[1:]
+    return path.replace("/", ".").strip("."), rooted
+
+
+def store_key_paths(db: Session, api_id: int, paths: Dict[str, List[str]]) -> None:
+    """Record ``paths`` (a ``StructuralIndex.paths``) as the key paths of
+    ``api_id``, replacing any it had; the caller commits."""
+    db.query(KeyPath).filter(KeyPath.api_id == api_id).delete(synchronize_session=False)
+    rows = [{"api_id": api_id, "path": path, "type": type_, "key": path.rsplit(".", 1)[-1]}
+            for path, types in paths.items() for type_ in types]
+    if rows:
+        insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        if insert is not None:
+            # a concurrent save of the same URL may have just written them
+            db.execute(insert(KeyPath).on_conflict_do_nothing(), rows)
+        else:
+            db.bulk_insert_mappings(KeyPath, rows)
+
+
+def has_key_paths(db: Session, api_id: int) -> bool:
+    return db.query(KeyPath.api_id).filter(KeyPath.api_id == api_id).first() is not None
+
+
+def backfill_key_paths(db: Session, batch: int = KEY_PATHS_BACKFILL_BATCH) -> int:
+    """Index the stored responses of APIs that have no key paths yet,
+    committing every ``batch`` APIs. Returns how many had any."""
+    ids = db.execute(
+        select(API.id).where(~exists().where(KeyPath.api_id == API.id)).order_by(API.id)
+    ).scalars().all()
+    # bodies are shared by content, so each is parsed once per batch
+    done = 0
+    for start in range(0, len(ids), batch):
+        parsed: Dict[Optional[str], Dict[str, List[str]]] = {}
+        for api in db.query(API).filter(API.id.in_(ids[start:start + batch])).all():
+            paths = parsed.get(api.response_hash) if api.response_hash else None
+            if paths is None:
+                try:
+                    paths = build_index(json.loads(load_response(db, api))).paths
+                except ValueError:
+                    continue
+                if api.response_hash:
+                    parsed[api.response_hash] = paths
+            store_key_paths(db, api.id, paths)
+            # an empty or scalar body has no paths and is tried again next time
+            done += bool(paths)
+        db.commit()
+        db.expunge_all()
+    return done
+
+
+def _path_under(db: Session, prefix: str):
+    """Paths strictly below ``prefix``, as a condition an index can serve."""
+    if db.get_bind().dialect.name == "sqlite":
+        # byte order: everything starting "prefix." sorts before "prefix/"
+        return and_(KeyPath.path > prefix + ".", KeyPath.path < prefix + "/")
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return KeyPath.path.like(escaped + ".%", escape="\\")
+
+
+def _path_ends_with(db: Session, suffix: str):
+    """Paths ending in ``.suffix``, compared case-sensitively."""
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite's LIKE ignores case; GLOB does not
+        escaped = "".join(f"[{c}]" if c in "*?[" else c for c in suffix)
+        return KeyPath.path.op("GLOB")("*." + escaped)
+    escaped = suffix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return KeyPath.path.like("%." + escaped, escape="\\")
+
+
+def find_apis(db: Session, path: Optional[str] = None, prefix: Optional[str] = None,
+              key: Optional[str] = None, type_: Optional[str] = None, tag: Optional[str] = None,
+              after: Optional[int] = None,
+              limit: int = KEY_PATHS_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Saved APIs, by id, with a key path matching every given filter:
+    ``path`` (``odds/home`` is the path or its tail at any depth,
+    ``$.odds.home`` only the path from the root), anything at or below
+    ``prefix`` (from the root), a last segment ``key`` (a field at any
+    depth) and a JSON ``type``, on APIs tagged ``tag``. Each comes with the
+    paths that matched.
+
+    Pages by keyset on the API id; returns ``(apis, next_after)``.
+    """
+    limit = min(max(limit, 1), KEY_PATHS_MAX_PAGE_SIZE)
+    conditions = []
+    if path:
+        path, rooted = normalize_path(path)
+        if rooted:
+            conditions.append(KeyPath.path == path)
+        else:
+            # the indexed last segment narrows the rows the suffix is tested on
+            conditions.append(KeyPath.key == path.rsplit(".", 1)[-1])
+            conditions.append(or_(KeyPath.path == path, _path_ends_with(db, path)))
+    if prefix:
+        prefix = normalize_path(prefix)[0]
+        conditions.append(or_(KeyPath.path == prefix, _path_under(db, prefix)))
+    if key:
+        conditions.append(KeyPath.key == key)
+    if type_:
+        conditions.append(KeyPath.type == type_)
+
+    ids_query = db.query(KeyPath.api_id).filter(*conditions)
+    if tag:
+        ids_query = ids_query.join(api_tags, api_tags.c.api_id == KeyPath.api_id).join(
+            Tag, Tag.id == api_tags.c.tag_id
+        ).filter(Tag.name == tag)
+    if after is not None:
+        ids_query = ids_query.filter(KeyPath.api_id > after)
+    ids = [api_id for (api_id,) in ids_query.distinct().order_by(KeyPath.api_id).limit(limit + 1)]
+    more = len(ids) > limit
+    ids = ids[:limit]
+    if not ids:
+        return [], None
+
+    apis = {api_id: {"id": api_id, "api": url, "paths": []}
+            for api_id, url in db.query(API.id, API.api).filter(API.id.in_(ids))}
+    matched = db.query(KeyPath.api_id, KeyPath.path, KeyPath.type).filter(
+        KeyPath.api_id.in_(ids), *conditions
+    ).order_by(KeyPath.api_id, KeyPath.path, KeyPath.type)
+    for api_id, found, type_found in matched:
+        apis[api_id]["paths"].append({"path": found, "type": type_found})
+    return [apis[api_id] for api_id in ids], ids[-1] if more else None
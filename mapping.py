@@ -0,0 +1,275 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from itertools import repeat
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from parser import walk
+
+MAPPING_CACHE_SIZE = int(os.getenv("MAPPING_CACHE_SIZE", "256"))
+
+_NUMERIC_KEY = re.compile(r"\d+")
+
+
+def _step(cur: Any, key: str) -> Any:
+    # columns under arrays of objects come from the first item, as generated
+    if isinstance(cur, list):
+        cur = cur[0] if cur else None
+    if isinstance(cur, dict):
+        return cur.get(key)
+    return None
+
+
+def _accessor(keys: Tuple[str, ...]) -> Callable[[dict], Any]:
+    """A getter for a column path, specialised on its length."""
+    if len(keys) == 1:
+        only, = keys
+        return lambda obj: obj.get(only)
+    if len(keys) == 2:
+        first, second = keys
+
+        def get_two(obj):
+            cur = obj.get(first)
+            if cur.__class__ is dict:
+                return cur.get(second)
+            return _step(cur, second)
+        return get_two
+
+    first, rest = keys[0], keys[1:]
+
+    def get(obj):
+        cur = obj.get(first)
+        for key in rest:
+            cur = _step(cur, key)
+            if cur is None:
+                return None
+        return cur
+    return get
+
+
+def _row_builder(paths: List[Optional[Tuple[str, ...]]]) -> Callable[[Any, Any], tuple]:
+    """``row(key, obj)`` for the columns; a ``None`` path is the ``$x_id`` key."""
+    value_paths = [p for p in paths if p is not None]
+    id_at = [i for i, p in enumerate(paths) if p is None]
+    empty = (None,) * len(value_paths)
+
+    if all(len(p) == 1 for p in value_paths):
+        flat = [p[0] for p in value_paths]
+
+        def values(obj):
+            return tuple(map(obj.get, flat)) if isinstance(obj, dict) else empty
+    else:
+        getters = [_accessor(p) for p in value_paths]
+
+        def values(obj):
+            return tuple([get(obj) for get in getters]) if isinstance(obj, dict) else empty
+
+    if not id_at:
+        return lambda key, obj: values(obj)
+    if id_at == [0]:
+        return lambda key, obj: (key,) + values(obj)
+
+    def row(key, obj):
+        out = list(values(obj))
+        for position in id_at:
+            out.insert(position, key)
+        return tuple(out)
+    return row
+
+
+def _first_under(data: Any, key: str, kind: type) -> Any:
+    """First non-empty ``kind`` stored under ``key``, in document order."""
+    for value, path, _, in_array in walk(data, containers_only=True):
+        if not in_array and path is not None and path[1] == key and value and isinstance(value, kind):
+            return value
+    return None
+
+
+def _resolve(data: Any, keys: List[str]) -> Any:
+    """Follow dotted keys, stepping into the first item of a list that has the next key."""
+    cur = data
+    for key in keys:
+        if isinstance(cur, list):
+            cur = next((item for item in cur if isinstance(item, dict) and key in item), None)
+        if not isinstance(cur, dict) or key not in cur:
+            return None
+        cur = cur[key]
+    return cur
+
+
+class CompiledMapping:
+    """A saved mapping turned into a locator for its rows and one row
+    builder, so running it costs no path parsing per row.
+
+    ``mode`` is ``"1"`` (rows are the items of the ``[]`` array), ``"2"``
+    (rows are the entries of a numeric-keyed ``{}`` object, keyed by the
+    ``$x_id`` column) or ``"3"`` (one row for the ``{}`` object).
+    """
+
+    __slots__ = ("mode", "primary_path", "columns", "field_names", "data_types", "key_column", "_keys", "_row")
+
+    def __init__(self, mode: str, primary_path: str, columns: List[str], field_names: List[str],
+                 data_types: List[str], key_column: Optional[int], keys: List[str],
+                 row: Callable[[Any, Any], tuple]):
+        self.mode = mode
+        self.primary_path = primary_path
+        self.columns = columns
+        # column names made unique for records and tables
+        self.field_names = field_names
+        self.data_types = data_types
+        # position of the "$x_id" column in numeric-key tables
+        self.key_column = key_column
+        self._keys = keys
+        self._row = row
+
+    def locate(self, data: Any) -> Any:
+        keys = self._keys
+        if self.mode == "1":
+            found = _resolve(data, keys)
+            if not isinstance(found, list) and keys:
+                # generated array mappings only name the array's own key
+                found = _first_under(data, keys[-1], list)
+            if not isinstance(found, list) and keys in ([], ["root"]):
+                found = data
+            return found if isinstance(found, list) else None
+
+        found = _resolve(data, keys)
+        if not isinstance(found, dict) and keys and self.mode == "3":
+            found = _first_under(data, keys[-1], dict)
+        return found if isinstance(found, dict) else None
+
+    def _records(self, data: Any) -> Tuple[Optional[List[str]], list]:
+        """The ``$x_id`` keys (mode 2 only) and the value each row is read from."""
+        found = self.locate(data)
+        if found is None:
+            return None, []
+        if self.mode == "1":
+            return None, found
+        if self.mode == "2":
+            ids = [k for k in found if isinstance(k, str) and _NUMERIC_KEY.fullmatch(k)]
+            return ids, [found[k] for k in ids]
+        return None, [found]
+
+    def rows(self, data: Any) -> Iterator[tuple]:
+        ids, records = self._records(data)
+        return map(self._row, repeat(None) if ids is None else ids, records)
+
+    def run(self, data: Any) -> List[tuple]:
+        return list(self.rows(data))
+
+    def column_batches(self, data: Any, batch_rows: int,
+                       limit: Optional[int] = None) -> Iterator[Tuple[int, List[tuple]]]:
+        """``(row_count, columns)`` for up to ``batch_rows`` rows at a time.
+
+        Rows are still built one record at a time, which keeps reads from
+        each record together, and transposed per batch.
+        """
+        ids, records = self._records(data)
+        if limit is not None:
+            records = records[:max(limit, 0)]
+        row = self._row
+        for start in range(0, len(records), batch_rows):
+            batch = records[start:start + batch_rows]
+            batch_ids = ids[start:start + batch_rows] if ids is not None else repeat(None)
+            yield len(batch), list(zip(*map(row, batch_ids, batch)))
+
+
+def _column_keys(path: str) -> Optional[Tuple[str, ...]]:
+    if path.startswith("./"):
+        path = path[2:]
+    keys = [k for k in path.split("/") if k]
+    # numeric-key columns are written below their "$x_id" column
+    if keys and keys[0].startswith("$"):
+        keys = keys[1:]
+        if not keys:
+            return None
+    return tuple(keys)
+
+
+def compile_mapping(mode: Any, mapping: Any) -> CompiledMapping:
+    """Compile a ``Data.mapping`` (dict or JSON text) for ``Data.mode``.
+
+    Raises ``ValueError`` when the mapping has no table to run.
+    """
+    if isinstance(mapping, (str, bytes)):
+        mapping = json.loads(mapping)
+    table = mapping.get("table") if isinstance(mapping, dict) else None
+    if not isinstance(table, dict) or not isinstance(table.get("primaryPath"), str):
+        raise ValueError("mapping has no table.primaryPath")
+
+    primary = table["primaryPath"]
+    columns, paths = [], []
+    for column in table.get("columns") or []:
+        if not isinstance(column, dict) or not isinstance(column.get("path"), str):
+            continue
+        keys = _column_keys(column["path"])
+        if keys != ():
+            columns.append(column)
+            paths.append(keys)
+
+    mode = str(mode)
+    if primary.endswith("[]"):
+        mode = "1"
+        target = primary[:-2]
+        if target == "data" or target.startswith("data."):
+            target = target[5:]
+    elif primary.endswith("{}"):
+        target = primary[:-2]
+        if mode not in ("2", "3"):
+            mode = "2" if None in paths else "3"
+    else:
+        raise ValueError(f"unsupported primaryPath {primary!r}")
+
+    if mode != "2":
+        # only numeric-key tables have an id column
+        paths = [p if p is not None else (c.get("columnName"),) for p, c in zip(paths, columns)]
+
+    names = [c.get("columnName") or c["path"] for c in columns]
+    field_names = []
+    for name, keys in zip(names, paths):
+        if names.count(name) > 1 and keys:
+            # "./markets/id" next to "./id" becomes "markets_id"
+            name = "_".join(keys)
+        while name in field_names:
+            name = f"{name}_"
+        field_names.append(name)
+
+    return CompiledMapping(
+        mode=mode,
+        primary_path=primary,
+        columns=names,
+        field_names=field_names,
+        data_types=[c.get("dataType") or "string" for c in columns],
+        key_column=paths.index(None) if None in paths else None,
+        keys=[k for k in target.split(".") if k],
+        row=_row_builder(paths),
+    )
+
+
+_cache: "OrderedDict[int, Tuple[str, str, CompiledMapping]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def compiled_mapping(data_id: int, mode: Any, mapping_text: str) -> CompiledMapping:
+    """The compiled form of a ``Data`` row, cached by ``Data.id``.
+
+    The mode and mapping text are compared on every hit so a reused id
+    never runs a stale mapping.
+    """
+    mode = str(mode)
+    with _cache_lock:
+        hit = _cache.get(data_id)
+        if hit is not None and hit[0] == mode and hit[1] == mapping_text:
+            _cache.move_to_end(data_id)
+            return hit[2]
+
+    compiled = compile_mapping(mode, mapping_text)
+    with _cache_lock:
+        _cache[data_id] = (mode, mapping_text, compiled)
+        _cache.move_to_end(data_id)
+        while len(_cache) > MAPPING_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
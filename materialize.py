@@ -0,0 +1,198 @@
+import io
+import os
+import re
+import time
+import itertools
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import (
+    BigInteger, Boolean, Column as SQLColumn, Float, Integer, MetaData, Numeric, Table, Text, inspect
+)
+
+from columnar import Column, ColumnarTable, columnar_batches
+from schema import merge_types
+
+# rows per transaction; each one is a single executemany or COPY
+MATERIALIZE_BATCH_ROWS = int(os.getenv("MATERIALIZE_BATCH_ROWS", "50000"))
+
+_SQL_TYPES = {"int": BigInteger, "float": Float, "bool": Boolean, "string": Text}
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_COPY_FLOATS = {"nan": "NaN", "inf": "Infinity", "-inf": "-Infinity"}
+
+
+def sql_identifier(name: str) -> str:
+    name = re.sub(r"\W+", "_", str(name)).strip("_").lower()
+    if not name or name[0].isdigit():
+        name = f"c_{name}"
+    return name[:63]
+
+
+def table_name_for(data_id: int) -> str:
+    return f"mapping_{data_id}"
+
+
+def _column_names(compiled) -> List[str]:
+    names = []
+    for field in compiled.field_names:
+        name = sql_identifier(field)
+        while name in names:
+            name = f"{name}_"
+        names.append(name)
+    return names
+
+
+def _copy_text(column: Column) -> List[str]:
+    """Cells in Postgres COPY text format, ``\\N`` for nulls."""
+    if column.data_type == "string":
+        texts = [v.translate(_COPY_ESCAPES) for v in column.values]
+    elif column.data_type == "bool":
+        texts = ["true" if v else "false" for v in column.values]
+    elif column.data_type == "int":
+        texts = list(map(str, column.values))
+    else:
+        texts = [_COPY_FLOATS.get(t, t) for t in map(repr, column.values)]
+    if column.null_count:
+        texts = ["\\N" if null else t for t, null in zip(texts, column.nulls)]
+    return texts
+
+
+def _data_type(sql_type) -> str:
+    if isinstance(sql_type, Boolean):
+        return "bool"
+    if isinstance(sql_type, Integer):
+        return "int"
+    if isinstance(sql_type, (Float, Numeric)):
+        return "float"
+    return "string"
+
+
+def ensure_table(engine, table_name: str, names: List[str], data_types: List[str],
+                 key: Optional[str]) -> Dict[str, Any]:
+    """Create ``table_name`` for the columns, or add the ones it is missing.
+    ``types`` in the result is the data type of every table column."""
+    columns = [
+        SQLColumn(name, Text if name == key else _SQL_TYPES.get(data_type, Text), primary_key=name == key)
+        for name, data_type in zip(names, data_types)
+    ]
+    existing = inspect(engine)
+    if not existing.has_table(table_name):
+        Table(table_name, MetaData(), *columns).create(engine)
+        return {"created": True, "added_columns": [], "types": {c.name: _data_type(c.type) for c in columns}}
+
+    have = {c["name"]: _data_type(c["type"]) for c in existing.get_columns(table_name)}
+    added = [c for c in columns if c.name not in have]
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for column in added:
+            conn.exec_driver_sql(
+                f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN "
+                f"{preparer.quote(column.name)} {column.type.compile(engine.dialect)}"
+            )
+            have[column.name] = _data_type(column.type)
+    return {"created": False, "added_columns": [c.name for c in added], "types": have}
+
+
+def _widen_columns(cursor, engine, target: str, table: ColumnarTable, names: List[str],
+                   types: Dict[str, str]) -> List[str]:
+    """On Postgres, widen table columns a batch no longer fits in (SQLite
+    stores whatever it is given)."""
+    widened = []
+    for name, column in zip(names, table.columns):
+        have = types[name]
+        if column.data_type == have or have == "string" or (have, column.data_type) == ("float", "int"):
+            continue
+        wider = merge_types([have, column.data_type])
+        sql_type = _SQL_TYPES[wider]().compile(engine.dialect)
+        quoted = engine.dialect.identifier_preparer.quote(name)
+        cursor.execute(f"ALTER TABLE {target} ALTER COLUMN {quoted} TYPE {sql_type} USING {quoted}::{sql_type}")
+        types[name] = wider
+        widened.append(name)
+    return widened
+
+
+def _upsert_clause(quoted: List[str], key: Optional[str], quote) -> str:
+    if key is None:
+        return ""
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in quoted if c != quote(key))
+    if not updates:
+        return f" ON CONFLICT ({quote(key)}) DO NOTHING"
+    return f" ON CONFLICT ({quote(key)}) DO UPDATE SET {updates}"
+
+
+def _load_sqlite(cursor, table: ColumnarTable, target: str, quoted: List[str], upsert: str) -> None:
+    # no faster than one INSERT per row inside a transaction, which sqlite3
+    # also runs as one prepared statement; the bulk gain is COPY on Postgres
+    placeholders = ", ".join("?" * len(quoted))
+    cursor.executemany(
+        f"INSERT INTO {target} ({', '.join(quoted)}) VALUES ({placeholders}){upsert}",
+        table.rows(),
+    )
+
+
+def _load_postgres(cursor, table: ColumnarTable, target: str, quoted: List[str], upsert: str) -> None:
+    columns = ", ".join(quoted)
+    lines = "".join(["\t".join(cells) + "\n" for cells in zip(*[_copy_text(c) for c in table.columns])])
+    if not upsert:
+        cursor.copy_expert(f"COPY {target} ({columns}) FROM STDIN", io.StringIO(lines))
+        return
+    # COPY cannot resolve conflicts; stage the batch and upsert from it
+    cursor.execute(f"CREATE TEMP TABLE _materialize_stage (LIKE {target}) ON COMMIT DROP")
+    cursor.copy_expert(f"COPY _materialize_stage ({columns}) FROM STDIN", io.StringIO(lines))
+    cursor.execute(f"INSERT INTO {target} ({columns}) SELECT {columns} FROM _materialize_stage{upsert}")
+
+
+def materialize(engine, compiled, data: Any, table_name: str, append: bool = False,
+                batch_rows: Optional[int] = None) -> Dict[str, Any]:
+    """Load the rows a compiled mapping reads from ``data`` into ``table_name``.
+
+    Numeric-key mappings upsert on their ``$x_id`` column, so a newer
+    response updates and adds rows without dropping older ones. Other
+    mappings have no row key and replace the table's rows unless ``append``.
+    """
+    start = time.perf_counter()
+    names = _column_names(compiled)
+    key = names[compiled.key_column] if compiled.key_column is not None else None
+    tables = columnar_batches(compiled, data, batch_rows=batch_rows or MATERIALIZE_BATCH_ROWS)
+    # the first batch may already have widened some of the mapping's types
+    first = next(tables)
+    schema = ensure_table(engine, table_name, names, first.data_types, key)
+    types = schema.pop("types")
+
+    quote = engine.dialect.identifier_preparer.quote
+    target = quote(table_name)
+    quoted = [quote(n) for n in names]
+    upsert = _upsert_clause(quoted, key, quote)
+    postgres = engine.dialect.name == "postgresql"
+    load = _load_postgres if postgres else _load_sqlite
+
+    rows = 0
+    widened = []
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        if key is None and not append:
+            cursor.execute(f"DELETE FROM {target}")
+        for table in itertools.chain([first], tables):
+            if postgres:
+                widened += _widen_columns(cursor, engine, target, table, names, types)
+            if table.num_rows:
+                load(cursor, table, target, quoted, upsert)
+                rows += table.num_rows
+            conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    return dict(
+        schema,
+        widened_columns=widened,
+        table=table_name,
+        rows=rows,
+        load="upsert" if key else "append" if append else "replace",
+        seconds=round(elapsed, 3),
+        rows_per_s=round(rows / elapsed) if elapsed else 0,
+    )
@@ -0,0 +1,100 @@
+import hashlib
+
+from sqlalchemy import bindparam, inspect, text
+
+from compression import compress
+from database import Base, url_hash
+from search import ensure_search
+
+# legacy inline bodies read into memory at a time while moving them
+_BLOB_BATCH = 500
+_SELECT_RESPONSES = text("SELECT id, response FROM api WHERE id IN :ids").bindparams(
+    bindparam("ids", expanding=True)
+)
+
+
+def _dedupe_api_urls(conn) -> None:
+    """Fill ``api.url_hash`` and fold rows whose URLs normalize alike into
+    the oldest one, keeping their mappings and tags, so the unique index
+    can be built."""
+    kept = {}
+    hashes, duplicates = [], []
+    for api_id, api_url, current in conn.execute(text("SELECT id, api, url_hash FROM api ORDER BY id")):
+        h = url_hash(api_url)
+        if h in kept:
+            duplicates.append({"dup": api_id, "keep": kept[h]})
+            continue
+        kept[h] = api_id
+        if current != h:
+            hashes.append({"id": api_id, "h": h})
+
+    for link, column in (("mapper", "data_id"), ("api_tags", "tag_id")):
+        for pair in duplicates:
+            conn.execute(text(
+                f"INSERT INTO {link} (api_id, {column}) SELECT :keep, {column} FROM {link} "
+                f"WHERE api_id = :dup AND {column} NOT IN (SELECT {column} FROM {link} WHERE api_id = :keep)"
+            ), pair)
+        if duplicates:
+            conn.execute(text(f"DELETE FROM {link} WHERE api_id = :dup"), duplicates)
+    if duplicates:
+        conn.execute(text("DELETE FROM key_paths WHERE api_id = :dup"), duplicates)
+        conn.execute(text("DELETE FROM api WHERE id = :dup"), duplicates)
+    if hashes:
+        conn.execute(text("UPDATE api SET url_hash = :h WHERE id = :id"), hashes)
+
+
+def _move_responses_to_blobs(conn) -> None:
+    """Move inline ``api.response`` bodies into ``response_blobs``. SQLite
+    only gives the space back to the OS after a ``VACUUM``."""
+    ids = [row[0] for row in conn.execute(text("SELECT id FROM api WHERE response_hash IS NULL ORDER BY id"))]
+    for start in range(0, len(ids), _BLOB_BATCH):
+        batch = ids[start:start + _BLOB_BATCH]
+        rows = conn.execute(_SELECT_RESPONSES, {"ids": batch}).all()
+        have = set()
+        blobs, updates = [], []
+        for api_id, response in rows:
+            raw = (response or "").encode()
+            h = hashlib.sha256(raw).hexdigest()
+            if h not in have and conn.execute(
+                text("SELECT 1 FROM response_blobs WHERE hash = :h"), {"h": h}
+            ).first() is None:
+                codec, blob = compress(raw)
+                blobs.append({"h": h, "codec": codec, "size": len(raw), "body": blob})
+            have.add(h)
+            updates.append({"id": api_id, "h": h})
+        if blobs:
+            conn.execute(text("INSERT INTO response_blobs (hash, codec, size, body) VALUES (:h, :codec, :size, :body)"), blobs)
+        conn.execute(text("UPDATE api SET response_hash = :h, response = '' WHERE id = :id"), updates)
+
+
+# data fixes that must run before an index on existing rows can be created
+_BEFORE_INDEX = {
+    "ux_api_url_hash": _dedupe_api_urls,
+    "ix_api_response_hash": _move_responses_to_blobs,
+}
+
+
+def ensure_schema(engine) -> None:
+    """Create missing tables, then add the columns and indexes that
+    ``create_all`` leaves out of tables that already exist, and set up URL
+    search."""
+    Base.metadata.create_all(bind=engine)
+
+    existing = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        have = {c["name"] for c in existing.get_columns(table.name)}
+        indexes = {ix["name"] for ix in existing.get_indexes(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in have:
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN "
+                        f"{preparer.quote(column.name)} {column.type.compile(engine.dialect)}"
+                    )
+            for index in table.indexes:
+                if index.name not in indexes:
+                    if index.name in _BEFORE_INDEX:
+                        _BEFORE_INDEX[index.name](conn)
+                    index.create(conn)
+    ensure_search(engine)
@@ -1,7 +1,46 @@
 
 import re
+import json
 from typing import Any, Dict, List, Optional, Set, Tuple
 
+from sampling import sample
+
+
+class LazyBody:
+    """Raw JSON bytes of a captured response, parsed on first use.
+
+    Truthiness mirrors the parsed document closely enough for listing
+    filters without paying for the parse.
+    """
+
+    __slots__ = ("raw",)
+
+    _EMPTY = (b"", b"{}", b"[]", b"null", b"false", b"0", b'""')
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+    def __bool__(self) -> bool:
+        return self.raw.strip() not in self._EMPTY
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def parse(self) -> Any:
+        try:
+            return json.loads(self.raw)
+        except Exception:
+            return None
+
+
+def resolve_data(api: Dict[str, Any]) -> Any:
+    
+    data = api.get("data")
+    if isinstance(data, LazyBody):
+        data = data.parse()
+        api["data"] = data
+    return data
+
 
 def extract_api_urls(api_list: List[Dict[str, Any]]) -> List[str]:
     
@@ -12,30 +51,134 @@ def extract_json_response(api_list: List[Dict[str, Any]], url: str) -> Optional[
    
     for api in api_list:
         if api.get("url") == url:
-            return api.get("data")
+            return resolve_data(api)
     return None
 
 
+# Paths are linked cells ``(parent_cell, key)`` so a step costs one small
+# tuple; they are only turned into segments or strings when emitted.
+Path = Optional[Tuple[Any, Any]]
+
+_NUMERIC_KEY = re.compile(r"\d+")
+
+
+def path_segments(path: Path) -> Tuple[Any, ...]:
+    
+    segments = []
+    while path is not None:
+        path, key = path
+        segments.append(key)
+    segments.reverse()
+    return tuple(segments)
+
+
+def join_path(path: Path, sep: str = ".", prefix: str = "") -> str:
+    """Join like the old ``f"{path}{sep}{k}" if path else k`` accumulation:
+    segments only start counting once the accumulated string is non-empty."""
+    out = prefix
+    for key in path_segments(path):
+        out = f"{out}{sep}{key}" if out else key
+    return out
+
+
+_PRUNE = 1
+_SKIP_SIBLINGS = 2
+
+
+class Walk:
+    """Preorder traversal over dicts and lists with an explicit stack.
+
+    Iterating yields ``(value, path, depth, in_array)`` for the root and every
+    descendant (only dicts and lists with ``containers_only``). Dict children
+    extend ``path`` with their key; list items keep their list's path, as all
+    the walkers in this module always have. Calling :meth:`prune` skips the
+    children of the node just yielded and :meth:`skip_siblings` also skips
+    the rest of its parent's children; breaking out of the loop stops the
+    walk. ``max_depth`` bounds how deep the walk descends and
+    ``first_item_only`` visits only ``list[0]``.
+    """
+
+    __slots__ = ("data", "max_depth", "first_item_only", "containers_only", "_control")
+
+    def __init__(self, data: Any, max_depth: Optional[int] = None,
+                 first_item_only: bool = False, containers_only: bool = False):
+        self.data = data
+        self.max_depth = max_depth
+        self.first_item_only = first_item_only
+        self.containers_only = containers_only
+        self._control = 0
+
+    def prune(self) -> None:
+        self._control = _PRUNE
+
+    def skip_siblings(self) -> None:
+        self._control = _SKIP_SIBLINGS
+
+    def _children(self, value: Any, path: Path, depth: int):
+        if isinstance(value, dict):
+            return (iter(value.items()), path, depth + 1, False)
+        if self.first_item_only:
+            return (iter(value[:1]), path, depth + 1, True)
+        return (iter(value), path, depth + 1, True)
+
+    def __iter__(self):
+        data = self.data
+        max_depth = self.max_depth
+        leaves = not self.containers_only
+        children = self._children
+
+        self._control = 0
+        yield data, None, 0, False
+        if self._control or not isinstance(data, (dict, list)) or max_depth == 0:
+            return
+
+        stack = [children(data, None, 0)]
+        while stack:
+            items, parent, depth, in_array = stack[-1]
+            # stay in this container until a child needs descending into
+            for child in items:
+                if in_array:
+                    value, path = child, parent
+                else:
+                    key, value = child
+                    path = (parent, key)
+                container = isinstance(value, (dict, list))
+                if not container and not leaves:
+                    continue
+
+                self._control = 0
+                yield value, path, depth, in_array
+
+                control = self._control
+                if control == _SKIP_SIBLINGS:
+                    stack.pop()
+                    break
+                if container and not control and depth != max_depth:
+                    stack.append(children(value, path, depth))
+                    break
+            else:
+                stack.pop()
+
+
+def walk(data: Any, max_depth: Optional[int] = None, first_item_only: bool = False,
+         containers_only: bool = False) -> Walk:
+    
+    return Walk(data, max_depth=max_depth, first_item_only=first_item_only,
+                containers_only=containers_only)
+
+
+def _numeric_keys(obj: Dict[str, Any]) -> List[str]:
+    return [k for k in obj.keys() if isinstance(k, str) and _NUMERIC_KEY.fullmatch(k)]
+
+
 def find_arrays(data: Any) -> Dict[str, List[str]]:
     
     arrays: Dict[str, List[str]] = {}
 
-    def walk(obj: Any, path: str = ""):
-        if isinstance(obj, list):
-            if len(obj) > 0 and isinstance(obj[0], dict):
-               
-                arrays[path] = list(obj[0].keys())
-           
-            for item in obj:
-                walk(item, path)
-        elif isinstance(obj, dict):
-            for k, v in obj.items():
-                new_path = f"{path}.{k}" if path else k
-                walk(v, new_path)
-        
-    walk(data)
+    for value, path, _, _ in walk(data, containers_only=True):
+        if isinstance(value, list) and len(value) > 0 and isinstance(value[0], dict):
+            arrays[join_path(path)] = list(value[0].keys())
 
-    
     clean: Dict[str, List[str]] = {}
     for full_path, keys in arrays.items():
         name = full_path.split(".")[-1] if full_path else "root"
@@ -47,28 +190,20 @@ def extract_id_objects(data: Any) -> List[Dict[str, Any]]:
    
     found: Dict[str, Set[str]] = {}
 
-    def scan(obj: Any, path: str = ""):
-        if isinstance(obj, dict):
-           
-            numeric_keys = [k for k in obj.keys() if isinstance(k, str) and re.fullmatch(r"\d+", k)]
-            if numeric_keys:
-                object_name = path.split(".")[-1] if path else "root"
-                object_name = object_name.strip() or "root"
-                if object_name not in found:
-                    found[object_name] = set()
-                for nk in numeric_keys:
-                    val = obj.get(nk)
-                    if isinstance(val, dict):
-                        found[object_name].update(val.keys())
-          
-            for k, v in obj.items():
-                new_path = f"{path}.{k}" if path else k
-                scan(v, new_path)
-        elif isinstance(obj, list):
-            for item in obj:
-                scan(item, path)
-
-    scan(data)
+    for value, path, _, _ in walk(data, containers_only=True):
+        if not isinstance(value, dict):
+            continue
+        numeric_keys = _numeric_keys(value)
+        if numeric_keys:
+            full_path = join_path(path)
+            object_name = full_path.split(".")[-1] if full_path else "root"
+            object_name = object_name.strip() or "root"
+            keys_set = found.setdefault(object_name, set())
+            # a budgeted sample of the entries, not all of them
+            for nk in sample(numeric_keys):
+                val = value.get(nk)
+                if isinstance(val, dict):
+                    keys_set.update(val.keys())
 
     results: List[Dict[str, Any]] = []
     for obj_name, keys_set in found.items():
@@ -84,86 +219,57 @@ def extract_objects_model3(data):
     results = []
     seen = set()
 
-    def scan(obj, path="root", inside_array=False):
-
-       
-        if inside_array:
-            return
-
-        if isinstance(obj, dict):
-
-            object_name = path.split(".")[-1]
-            keys_list = list(obj.keys())
-
-            signature = (object_name, tuple(keys_list))
-
-            if signature not in seen:
-                seen.add(signature)
-                results.append({
-                    "object_name": object_name,
-                    "keys_list": keys_list
-                })
-
-           
-            for k, v in obj.items():
-                new_path = f"{path}.{k}" if path else k
-                scan(v, new_path, inside_array=False)
-
-        elif isinstance(obj, list):
-
-           
-            for item in obj:
-                scan(item, path, inside_array=True)
+    walker = walk(data, containers_only=True)
+    for value, path, _, _ in walker:
+        # objects inside arrays are rows, not model-3 objects
+        if isinstance(value, list):
+            walker.prune()
+            continue
+        if not isinstance(value, dict):
+            continue
+
+        object_name = join_path(path, prefix="root").split(".")[-1]
+        keys_list = list(value.keys())
+
+        signature = (object_name, tuple(keys_list))
+
+        if signature not in seen:
+            seen.add(signature)
+            results.append({
+                "object_name": object_name,
+                "keys_list": keys_list
+            })
 
-    scan(data, "root", inside_array=False)
     return results
 
 
 def find_path_of_key(data: Any, target_key: str) -> Optional[str]:
     
-    def scan(obj: Any, path: str = "") -> Optional[str]:
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                new_path = f"{path}.{k}" if path else k
-                if k == target_key and isinstance(v, list):
-                    return new_path
-                r = scan(v, new_path)
-                if r:
-                    return r
-        elif isinstance(obj, list):
-            for item in obj:
-                r = scan(item, path)
-                if r:
-                    return r
-        return None
-
-    return scan(data, "")
+    walker = walk(data, containers_only=True)
+    for value, path, depth, in_array in walker:
+        if in_array or path is None or path[1] != target_key or not isinstance(value, list):
+            continue
+        found = join_path(path)
+        # an empty path below the top level never made it out of the old recursion
+        if found or depth == 1:
+            return found
+        walker.skip_siblings()
+    return None
 
 
 def find_numeric_object_path(data: Any, object_name: str) -> Optional[str]:
    
-    def scan(obj: Any, path: str = "") -> Optional[str]:
-        if isinstance(obj, dict):
-            
-            numeric_keys = [k for k in obj.keys() if isinstance(k, str) and re.fullmatch(r"\d+", k)]
-            if numeric_keys:
-               
-                candidate_name = path.split(".")[-1] if path else ""
-                if not object_name or candidate_name == object_name:
-                    return path or candidate_name or ""
-            for k, v in obj.items():
-                new_path = f"{path}.{k}" if path else k
-                r = scan(v, new_path)
-                if r:
-                    return r
-        elif isinstance(obj, list):
-            for item in obj:
-                r = scan(item, path)
-                if r:
-                    return r
-        return None
-
-    return scan(data, "")
+    walker = walk(data, containers_only=True)
+    for value, path, depth, _ in walker:
+        if not isinstance(value, dict) or not _numeric_keys(value):
+            continue
+        full_path = join_path(path)
+        candidate_name = full_path.split(".")[-1] if full_path else ""
+        if not object_name or candidate_name == object_name:
+            if full_path or depth == 0:
+                return full_path or candidate_name or ""
+            walker.prune()
+    return None
 
 
 def get_by_dotpath(data: Any, dotpath: str) -> Any:
@@ -175,6 +281,9 @@ def get_by_dotpath(data: Any, dotpath: str) -> Any:
     for p in parts:
         if isinstance(cur, dict) and p in cur:
             cur = cur[p]
+        elif isinstance(cur, list) and re.fullmatch(r"-?\d+", p) and -len(cur) <= int(p) < len(cur):
+            # list positions, negative ones counting from the end
+            cur = cur[int(p)]
         else:
             return None
     return cur
@@ -183,27 +292,25 @@ def get_by_dotpath(data: Any, dotpath: str) -> Any:
 def build_columns_for_object(obj: Dict[str, Any], prefix: str = "") -> List[Dict[str, str]]:
    
     cols: List[Dict[str, str]] = []
+    if not isinstance(obj, dict):
+        return cols
+
+    walker = walk(obj, first_item_only=True)
+    for value, path, depth, in_array in walker:
+        if depth == 0 or in_array and not isinstance(value, dict):
+            continue
+        if isinstance(value, list):
+            # only arrays of objects contribute columns, taken from their first item
+            if not (len(value) > 0 and isinstance(value[0], dict)):
+                walker.prune()
+            continue
+        if isinstance(value, dict):
+            continue
+
+        cols.append({
+            "path": f"./{join_path(path, sep='/', prefix=prefix)}",
+            "dataType": "string",
+            "columnName": path[1]
+        })
 
-    def add(local: Any, cur_prefix: str):
-        if not isinstance(local, dict):
-            return
-        for k, v in local.items():
-            new_prefix = f"{cur_prefix}/{k}" if cur_prefix else k
-            
-            if isinstance(v, list):
-                if len(v) > 0 and isinstance(v[0], dict):
-                    add(v[0], new_prefix)
-                
-                continue
-            if isinstance(v, dict):
-                add(v, new_prefix)
-                continue
-         
-            cols.append({
-                "path": f"./{new_prefix}",
-                "dataType": "string",
-                "columnName": k
-            })
-
-    add(obj, prefix)
     return cols
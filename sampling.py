@@ -0,0 +1,92 @@
+import os
+import math
+import random
+from typing import Any, List, Optional, Sequence
+
+SCHEMA_SAMPLE_FIRST = int(os.getenv("SCHEMA_SAMPLE_FIRST", "100"))
+SCHEMA_SAMPLE_RANDOM = int(os.getenv("SCHEMA_SAMPLE_RANDOM", "400"))
+SCHEMA_SAMPLE_SEED = int(os.getenv("SCHEMA_SAMPLE_SEED", "0"))
+
+
+class Sampler:
+    """The first ``first`` items of a collection plus a uniform random
+    sample of ``random_k`` of the rest (reservoir sampling, Algorithm L).
+
+    Decisions depend only on item positions and the seed, so feeding items
+    one at a time with :meth:`offer` (while streaming) and picking from a
+    list with :meth:`positions` choose exactly the same items. Only the
+    accepted items cost a random draw, so :meth:`positions` is bounded by
+    the budget rather than the collection size.
+    """
+
+    __slots__ = ("first", "random_k", "rng", "seen", "w", "next_pick")
+
+    def __init__(self, first: Optional[int] = None, random_k: Optional[int] = None,
+                 seed: Optional[int] = None):
+        self.first = SCHEMA_SAMPLE_FIRST if first is None else first
+        self.random_k = SCHEMA_SAMPLE_RANDOM if random_k is None else random_k
+        self.rng = random.Random(SCHEMA_SAMPLE_SEED if seed is None else seed)
+        self.seen = 0
+        self.w = 1.0
+        # position (past the first items) of the next reservoir replacement
+        self.next_pick = None
+
+    @property
+    def size(self) -> int:
+        return self.first + self.random_k
+
+    def _uniform(self) -> float:
+        return self.rng.random() or 0.5
+
+    def _skip(self) -> int:
+        return int(math.log(self._uniform()) / math.log(1.0 - self.w)) + 1
+
+    def _accept(self, rest: int) -> Optional[int]:
+        """Slot for the item ``rest`` positions past the first items, or None."""
+        k = self.random_k
+        if k <= 0:
+            return None
+        if rest < k:
+            if rest == k - 1:
+                # reservoir full: draw where the first replacement lands
+                self.w = math.exp(math.log(self._uniform()) / k)
+                self.next_pick = rest + self._skip()
+            return self.first + rest
+        if rest != self.next_pick:
+            return None
+        slot = self.first + self.rng.randrange(k)
+        self.w *= math.exp(math.log(self._uniform()) / k)
+        self.next_pick += self._skip()
+        return slot
+
+    def offer(self) -> Optional[int]:
+        """Slot in the sample for the next item, or None to leave it out.
+        A slot that is already taken is replaced."""
+        position = self.seen
+        self.seen += 1
+        if position < self.first:
+            return position
+        return self._accept(position - self.first)
+
+    def positions(self, n: int) -> List[int]:
+        """Sorted positions of the items picked from a collection of ``n``."""
+        picked = list(range(min(n, self.first)))
+        rest = n - self.first
+        slots = [self.first + r for r in range(min(rest, self.random_k))]
+        for r in range(len(slots)):
+            self._accept(r)
+        if rest > self.random_k > 0:
+            while self.next_pick < rest:
+                r = self.next_pick
+                slots[self._accept(r) - self.first] = self.first + r
+        self.seen = n
+        return picked + sorted(slots)
+
+
+def sample(items: Sequence[Any], first: Optional[int] = None, random_k: Optional[int] = None,
+           seed: Optional[int] = None) -> List[Any]:
+    """The items :class:`Sampler` picks from ``items``, in their original order."""
+    sampler = Sampler(first, random_k, seed)
+    if len(items) <= sampler.size:
+        return list(items)
+    return [items[p] for p in sampler.positions(len(items))]
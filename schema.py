@@ -0,0 +1,76 @@
+from typing import Any, Dict, Iterable, List
+
+from parser import join_path, walk
+
+_NUMBER_TYPES = {"int", "float"}
+
+
+def value_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "string"
+
+
+def merge_types(types: Iterable[str]) -> str:
+    """One column type for every non-null type seen in a field."""
+    types = set(types) - {"null"}
+    if not types:
+        return "string"
+    if len(types) == 1:
+        return types.pop()
+    if types <= _NUMBER_TYPES:
+        return "float"
+    return "string"
+
+
+def infer_columns(items: Iterable[Any], prefix: str = "") -> List[Dict[str, Any]]:
+    """Mapping columns for a sample of objects.
+
+    Fields are walked like ``build_columns_for_object`` (nested objects, and
+    arrays of objects through their first item), keys are unioned over the
+    sample in first-seen order, and each column gets its inferred
+    ``dataType``, whether it can be null (a null or a missing value) and
+    the share of sampled objects it is present in.
+    """
+    fields: Dict[str, list] = {}
+    total = 0
+
+    for obj in items:
+        if not isinstance(obj, dict):
+            continue
+        total += 1
+        walker = walk(obj, first_item_only=True)
+        for value, path, depth, in_array in walker:
+            if depth == 0 or in_array and not isinstance(value, dict):
+                continue
+            if isinstance(value, list):
+                if not (len(value) > 0 and isinstance(value[0], dict)):
+                    walker.prune()
+                continue
+            if isinstance(value, dict):
+                continue
+
+            col_path = f"./{join_path(path, sep='/', prefix=prefix)}"
+            field = fields.get(col_path)
+            if field is None:
+                # column name, objects present in, types seen
+                field = fields[col_path] = [path[1], 0, set()]
+            field[1] += 1
+            field[2].add(value_type(value))
+
+    return [
+        {
+            "path": col_path,
+            "dataType": merge_types(types),
+            "columnName": name,
+            "nullable": "null" in types or present < total,
+            "presence": round(present / total, 3),
+        }
+        for col_path, (name, present, types) in fields.items()
+    ]
@@ -1,56 +1,438 @@
 
-from playwright.sync_api import sync_playwright
+import os
+import re
 import json
+import time
+import asyncio
+import fnmatch
+from collections import Counter
+from functools import partial
+
+from browser_pool import get_pool
+from capture_cache import get_capture_cache
+from parser import LazyBody, resolve_data
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_TIMEOUT_S = float(os.getenv("BATCH_TIMEOUT_S", "60"))
+# longest per-site timeout a /fetch-batch request may ask for
+BATCH_TIMEOUT_S_MAX = float(os.getenv("BATCH_TIMEOUT_S_MAX", "120"))
+# most URLs one /fetch-batch request may ask for
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "100"))
+
+# Resource types and URL globs we never inspect; both lists can be replaced
+# with comma-separated values in the environment (an empty value disables).
+DEFAULT_BLOCK_RESOURCE_TYPES = ("image", "media", "font", "stylesheet")
+DEFAULT_BLOCK_URL_PATTERNS = (
+    "*google-analytics.com/*",
+    "*googletagmanager.com/*",
+    "*googlesyndication.com/*",
+    "*doubleclick.net/*",
+    "*adservice.google.*",
+    "*amazon-adsystem.com/*",
+    "*connect.facebook.net/*",
+    "*hotjar.com/*",
+    "*scorecardresearch.com/*",
+    "*criteo.com/*",
+    "*criteo.net/*",
+    "*taboola.com/*",
+    "*outbrain.com/*",
+    "*.mp4",
+    "*.webm",
+)
+
+
+# "fixed" waits for networkidle plus wait_ms; "adaptive" returns once no JSON
+# response has arrived for CAPTURE_QUIET_MS, capped at CAPTURE_MAX_WAIT_MS.
+CAPTURE_WAIT_MODE = os.getenv("CAPTURE_WAIT_MODE", "fixed")
+CAPTURE_QUIET_MS = int(os.getenv("CAPTURE_QUIET_MS", "1000"))
+CAPTURE_MAX_WAIT_MS = int(os.getenv("CAPTURE_MAX_WAIT_MS", "10000"))
+
+_API_RESOURCE_TYPES = ("xhr", "fetch")
+
+# Which JSON responses are kept and how much of them: URL globs (an empty
+# include list keeps everything), a per-body cap, a per-capture cap, and
+# whether bodies are kept raw and parsed only when first requested.
+CAPTURE_MAX_BODY_BYTES = int(os.getenv("CAPTURE_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+CAPTURE_MAX_TOTAL_BYTES = int(os.getenv("CAPTURE_MAX_TOTAL_BYTES", str(100 * 1024 * 1024)))
+CAPTURE_LAZY_PARSE = os.getenv("CAPTURE_LAZY_PARSE", "false").lower() in ("1", "true", "yes")
+
+
+def _env_list(name, default):
+    raw = os.getenv(name)
+    if raw is None:
+        return tuple(default)
+    return tuple(v.strip() for v in raw.split(",") if v.strip())
+
+
+def _glob_regex(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns), re.IGNORECASE)
+
+
+def site_url(url):
+
+    url = (url or "").strip()
+    if url and not url.startswith("http"):
+        url = "https://" + url
+    return url
+
+
+class RequestBlocker:
+    """``page.route`` handler that aborts requests by resource type or URL
+    glob and counts what it blocked."""
+
+    def __init__(self, resource_types=None, url_patterns=None):
+        if resource_types is None:
+            resource_types = _env_list("CAPTURE_BLOCK_RESOURCE_TYPES", DEFAULT_BLOCK_RESOURCE_TYPES)
+        if url_patterns is None:
+            url_patterns = _env_list("CAPTURE_BLOCK_URL_PATTERNS", DEFAULT_BLOCK_URL_PATTERNS)
+
+        self.resource_types = frozenset(resource_types)
+        self.url_patterns = tuple(url_patterns)
+        self._url_re = _glob_regex(self.url_patterns)
+        self.blocked = Counter()
+        self.allowed = 0
+
+    def should_block(self, resource_type, url):
+        if resource_type in self.resource_types:
+            return resource_type
+        if self._url_re is not None and self._url_re.match(url):
+            return "url"
+        return None
+
+    async def handle(self, route):
+        request = route.request
+        reason = self.should_block(request.resource_type, request.url)
+        if reason:
+            self.blocked[reason] += 1
+            await route.abort("blockedbyclient")
+        else:
+            self.allowed += 1
+            await route.continue_()
+
+    async def install(self, page):
+        await page.route("**/*", self.handle)
+
+    def stats(self):
+        return {
+            "blocked": sum(self.blocked.values()),
+            "blocked_by": dict(self.blocked),
+            "allowed": self.allowed,
+        }
+
+
+class CapturePolicy:
+    """Decides which JSON responses a capture keeps and bounds its memory.
+
+    Each URL is read at most once; bodies over ``max_body_bytes`` or past the
+    capture's ``max_total_bytes`` budget are recorded without data.
+    """
+
+    def __init__(self, include=None, exclude=None, max_body_bytes=None,
+                 max_total_bytes=None, lazy=None):
+        if include is None:
+            include = _env_list("CAPTURE_INCLUDE_URLS", ())
+        if exclude is None:
+            exclude = _env_list("CAPTURE_EXCLUDE_URLS", ())
+        self._include_re = _glob_regex(include)
+        self._exclude_re = _glob_regex(exclude)
+        self.max_body_bytes = CAPTURE_MAX_BODY_BYTES if max_body_bytes is None else max_body_bytes
+        self.max_total_bytes = CAPTURE_MAX_TOTAL_BYTES if max_total_bytes is None else max_total_bytes
+        self.lazy = CAPTURE_LAZY_PARSE if lazy is None else lazy
+
+        self.seen = set()
+        self.reserved = 0
+        self.counts = Counter()
+
+    def admit(self, url):
+        """Claim ``url`` for this capture; False if it should be ignored."""
+        if url in self.seen:
+            self.counts["duplicate"] += 1
+            return False
+        self.seen.add(url)
+        if self._include_re is not None and not self._include_re.match(url):
+            self.counts["excluded"] += 1
+            return False
+        if self._exclude_re is not None and self._exclude_re.match(url):
+            self.counts["excluded"] += 1
+            return False
+        return True
+
+    def reserve(self, size):
+        """Account for ``size`` body bytes; returns the reason to drop them, if any."""
+        if self.max_body_bytes and size > self.max_body_bytes:
+            self.counts["too_large"] += 1
+            return "too_large"
+        if self.max_total_bytes and self.reserved + size > self.max_total_bytes:
+            self.counts["over_budget"] += 1
+            return "over_budget"
+        self.reserved += size
+        return None
+
+    def release(self, size):
+        self.reserved -= size
+
+    def body(self, raw):
+        if self.lazy:
+            return LazyBody(raw)
+        try:
+            return json.loads(raw)
+        except Exception:
+            return None
+
+    def stats(self):
+        return dict(self.counts, bytes=self.reserved, lazy=self.lazy)
+
+
+class QuiescenceTracker:
+    """Follows in-flight XHR/fetch requests and JSON response arrivals so a
+    capture can stop as soon as the page's API traffic has settled."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.inflight = set()
+        self.json_responses = 0
+        self.first_json = None
+        self.last_json = None
+
+    def attach(self, page):
+        page.on("request", self.on_request)
+        page.on("requestfinished", self.on_request_done)
+        page.on("requestfailed", self.on_request_done)
+
+    def on_request(self, request):
+        if request.resource_type in _API_RESOURCE_TYPES:
+            self.inflight.add(request)
+
+    def on_request_done(self, request):
+        self.inflight.discard(request)
+
+    def on_json(self):
+        now = time.monotonic()
+        self.json_responses += 1
+        if self.first_json is None:
+            self.first_json = now
+        self.last_json = now
+
+    async def wait(self, quiet_ms: int, max_ms: int, poll_ms: int = 50):
+        """Return ``"quiet"`` once nothing is in flight and no JSON response has
+        arrived for ``quiet_ms``, or ``"max"`` after ``max_ms``."""
+        began = time.monotonic()
+        deadline = began + max_ms / 1000
+        while True:
+            now = time.monotonic()
+            last = max(self.last_json or began, began)
+            if not self.inflight and (now - last) * 1000 >= quiet_ms:
+                return "quiet"
+            if now >= deadline:
+                return "max"
+            await asyncio.sleep(min(poll_ms / 1000, max(deadline - now, 0)))
+
+    def ms_since_start(self, t):
+        return None if t is None else round((t - self.start) * 1000, 1)
+
+
+async def capture_page(context, url, wait_ms: int = 5000, block: bool = True,
+                       wait_mode: str = None, quiet_ms: int = None, max_wait_ms: int = None,
+                       policy: CapturePolicy = None):
+
+    wait_mode = wait_mode or CAPTURE_WAIT_MODE
+    quiet_ms = CAPTURE_QUIET_MS if quiet_ms is None else quiet_ms
+    max_wait_ms = CAPTURE_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
 
-def fetch_webpage(url, wait_ms: int = 5000):
-  
     api_calls = []
+    pending = set()
+    tracker = QuiescenceTracker()
+    policy = policy or CapturePolicy()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
+    page = await context.new_page()
+    tracker.attach(page)
 
-        def handle_response(response):
-            try:
-                content_type = (response.headers.get("content-type") or "").lower()
-                if "application/json" in content_type or response.url.lower().endswith(".json"):
-
-                    text = ""
-                    try:
-                        text = response.text()
-                    except Exception:
-                        text = ""
-
-                    try:
-                        data = json.loads(text)
-                    except Exception:
-                        data = None
-
-                    api_calls.append({
-                        "url": response.url,
-                        "status": response.status,
-                        "method": response.request.method,
-                        "data": data
-                    })
-            except Exception:
-                pass
-
-        page.on("response", handle_response)
+    blocker = RequestBlocker() if block else None
+    if blocker is not None:
+        await blocker.install(page)
 
+    async def read_response(response, record):
+        # refuse oversized bodies up front when the server declares a length
         try:
-            page.goto(url, wait_until="networkidle", timeout=30000)
-            page.wait_for_timeout(wait_ms)
+            declared = int(response.headers.get("content-length") or 0)
+        except ValueError:
+            declared = 0
+        reason = policy.reserve(declared) if declared else None
+        if reason:
+            record["skipped"] = reason
+            return
+
+        try:
+            raw = await response.body()
+        except Exception:
+            raw = b""
+        if declared:
+            policy.release(declared)
+
+        reason = policy.reserve(len(raw))
+        if reason:
+            record["skipped"] = reason
+            return
+        record["size"] = len(raw)
+        record["data"] = policy.body(raw)
+
+    def handle_response(response):
+        try:
+            content_type = (response.headers.get("content-type") or "").lower()
+            if "application/json" in content_type or response.url.lower().endswith(".json"):
+                tracker.on_json()
+                if not policy.admit(response.url):
+                    return
+                # keep arrival order; the body is filled in once it is read
+                record = {
+                    "url": response.url,
+                    "status": response.status,
+                    "method": response.request.method,
+                    "data": None
+                }
+                api_calls.append(record)
+                task = asyncio.ensure_future(read_response(response, record))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
         except Exception:
             pass
 
-        browser.close()
+    page.on("response", handle_response)
+
+    settled_by = "fixed"
+    goto_done = None
+    try:
+        if wait_mode == "adaptive":
+            await page.goto(url, wait_until="load", timeout=30000)
+            goto_done = time.monotonic()
+            settled_by = await tracker.wait(quiet_ms, max_wait_ms)
+        else:
+            await page.goto(url, wait_until="networkidle", timeout=30000)
+            goto_done = time.monotonic()
+            await page.wait_for_timeout(wait_ms)
+    except Exception:
+        settled_by = "error"
+
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    done = time.monotonic()
+
+    timings = {
+        "wait_mode": wait_mode,
+        "settled_by": settled_by,
+        "goto_ms": tracker.ms_since_start(goto_done),
+        "settle_ms": None if goto_done is None else round((done - goto_done) * 1000, 1),
+        "total_ms": tracker.ms_since_start(done),
+        "first_json_ms": tracker.ms_since_start(tracker.first_json),
+        "last_json_ms": tracker.ms_since_start(tracker.last_json),
+        "json_responses": tracker.json_responses,
+    }
+    stats = {
+        "blocking": blocker.stats() if blocker is not None else None,
+        "timings": timings,
+        "policy": policy.stats(),
+    }
+    return {"apis": api_calls, "stats": stats}
+
+
+def _cache_variant(block: bool, wait_mode: str = None, **_) -> str:
+    # captures differ by wait mode and blocking, so each pair is cached apart
+    return f"{wait_mode or CAPTURE_WAIT_MODE}:{'block' if block else 'noblock'}"
+
+
+def _cacheable(capture) -> bool:
+    """A capture that failed to load, or found no JSON at all, is not
+    cached: a timeout or a bot wall would otherwise be served as a hit."""
+    return capture["stats"]["timings"]["settled_by"] != "error" and bool(capture["apis"])
+
+
+def capture_webpage(url, wait_ms: int = 5000, block: bool = True, pool=None,
+                    refresh: bool = False, **wait_options):
+    """Like :func:`fetch_webpage` but also returns the capture ``stats``.
+    ``wait_options`` are ``wait_mode``, ``quiet_ms`` and ``max_wait_ms``.
+
+    Recent captures of the same page, taken with the same wait mode and
+    blocking, are served from the capture cache unless ``refresh`` is set.
+    """
+
+    cache = get_capture_cache()
+    variant = _cache_variant(block, **wait_options)
+    if cache is not None and not refresh:
+        hit = cache.get(url, lazy=CAPTURE_LAZY_PARSE, variant=variant)
+        if hit is not None:
+            stats = {"cache": dict(cache.stats(), hit=True, age_s=hit["age_s"])}
+            return {"apis": hit["apis"], "stats": stats}
+
+    pool = pool or get_pool()
+    capture = pool.run(capture_page, url, wait_ms=wait_ms, block=block, **wait_options)
+    if cache is not None:
+        if _cacheable(capture):
+            cache.put(url, capture["apis"], variant=variant)
+        capture["stats"]["cache"] = dict(cache.stats(), hit=False, age_s=0)
+    return capture
+
+
+def fetch_webpage(url, wait_ms: int = 5000, pool=None, refresh: bool = False):
+
+    return capture_webpage(url, wait_ms=wait_ms, pool=pool, refresh=refresh)["apis"]
+
+
+def fetch_webpages(urls, concurrency: int = BATCH_CONCURRENCY, timeout_s: float = BATCH_TIMEOUT_S,
+                   wait_ms: int = 5000, block: bool = True, pool=None, on_result=None,
+                   refresh: bool = False, **wait_options):
+    """Capture many sites concurrently on the pool's event loop.
+
+    At most ``concurrency`` captures are in flight at once, and each is
+    cancelled after ``timeout_s``. The pool's capacity, ``BROWSER_POOL_SIZE``
+    browsers times ``BROWSER_POOL_CONTEXTS`` contexts for the shared pool,
+    bounds it further: captures beyond that wait for a free context.
+    Returns one ``{"site", "apis", "stats", "error", "elapsed_ms"}`` dict per URL, in
+    input order; ``on_result`` is called with each one as it completes.
+    Sites found in the capture cache (for the same wait mode and blocking)
+    are not recaptured unless ``refresh``.
+    """
+
+    pool = pool or get_pool()
+    cache = get_capture_cache()
+    variant = _cache_variant(block, **wait_options)
+
+    async def capture_one(sem, site):
+        async with sem:
+            start = time.perf_counter()
+            result = {"site": site, "apis": [], "stats": None, "error": None}
+            loop = asyncio.get_running_loop()
+            hit = None
+            if cache is not None and not refresh:
+                hit = await loop.run_in_executor(None, partial(cache.get, site, variant=variant))
+            try:
+                if hit is not None:
+                    capture = {"apis": hit["apis"], "stats": {"cache": {"hit": True, "age_s": hit["age_s"]}}}
+                else:
+                    capture = await asyncio.wait_for(
+                        pool.run_async(capture_page, site, wait_ms=wait_ms, block=block, **wait_options),
+                        timeout_s
+                    )
+                    if cache is not None and _cacheable(capture):
+                        await loop.run_in_executor(None, partial(cache.put, site, capture["apis"], variant=variant))
+                # batch results are serialized right away, so parse lazy bodies
+                for api in capture["apis"]:
+                    resolve_data(api)
+                result["apis"] = capture["apis"]
+                result["stats"] = capture["stats"]
+            except asyncio.TimeoutError:
+                result["error"] = f"timed out after {timeout_s:g}s"
+            except Exception as e:
+                result["error"] = str(e)
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if on_result is not None:
+                on_result(result)
+            return result
 
-  
-    seen = set()
-    filtered = []
-    for item in api_calls:
-        if item["url"] not in seen:
-            seen.add(item["url"])
-            filtered.append(item)
+    async def capture_all():
+        sem = asyncio.Semaphore(max(1, concurrency))
+        return await asyncio.gather(*(capture_one(sem, site) for site in sites))
 
-    return filtered
+    sites = [site_url(u) for u in urls if u and u.strip()]
+    return pool.run_coroutine(capture_all())
@@ -0,0 +1,116 @@
+import os
+from typing import Any, Dict, List
+
+from sqlalchemy import Integer, column, table
+from sqlalchemy.exc import DBAPIError
+
+from database import API
+
+SEARCH_TYPEAHEAD_LIMIT = int(os.getenv("SEARCH_TYPEAHEAD_LIMIT", "10"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "50"))
+# trigram indexes cannot serve shorter terms; those scan the table
+SEARCH_MIN_INDEXED = 3
+
+# per engine URL: "fts5" (SQLite trigram table), "trgm" (Postgres GIN
+# index) or "like" (no index, plain ILIKE)
+_backends: Dict[str, str] = {}
+
+_api_search = table("api_search", column("rowid", Integer), column("api_search"))
+
+_SQLITE_SETUP = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_search USING fts5("
+    "api, content='api', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS api_search_ai AFTER INSERT ON api BEGIN "
+    "INSERT INTO api_search (rowid, api) VALUES (new.id, new.api); END",
+    "CREATE TRIGGER IF NOT EXISTS api_search_ad AFTER DELETE ON api BEGIN "
+    "INSERT INTO api_search (api_search, rowid, api) VALUES ('delete', old.id, old.api); END",
+    "CREATE TRIGGER IF NOT EXISTS api_search_au AFTER UPDATE OF api ON api BEGIN "
+    "INSERT INTO api_search (api_search, rowid, api) VALUES ('delete', old.id, old.api); "
+    "INSERT INTO api_search (rowid, api) VALUES (new.id, new.api); END",
+]
+
+
+def _setup_sqlite(engine) -> str:
+    with engine.connect() as conn:
+        triggers = conn.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'api_search_%'"
+        ).scalar()
+    try:
+        with engine.begin() as conn:
+            for statement in _SQLITE_SETUP:
+                conn.exec_driver_sql(statement)
+            if triggers < 3:
+                # new, or api was recreated without its triggers: reindex every URL
+                conn.exec_driver_sql("INSERT INTO api_search (api_search) VALUES ('rebuild')")
+    except DBAPIError:
+        # SQLite built without FTS5, or older than 3.34 (no trigram tokenizer)
+        return "like"
+    return "fts5"
+
+
+def _setup_postgres(engine) -> str:
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_api_api_trgm ON api USING gin (api gin_trgm_ops)")
+    except DBAPIError:
+        # pg_trgm not installed, or no permission to create it
+        return "like"
+    return "trgm"
+
+
+def ensure_search(engine) -> str:
+    """Set up the URL search index for ``engine`` and return its backend.
+
+    SQLite gets an FTS5 trigram table over ``api.api`` kept in step by
+    triggers; Postgres a ``pg_trgm`` GIN index, which ``ILIKE`` uses
+    directly. Anything else, or either without the feature, searches
+    with a plain ``ILIKE``.
+    """
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        backend = _setup_sqlite(engine)
+    elif dialect == "postgresql":
+        backend = _setup_postgres(engine)
+    else:
+        backend = "like"
+    _backends[str(engine.url)] = backend
+    return backend
+
+
+def _backend(session) -> str:
+    return _backends.get(str(session.get_bind().url), "like")
+
+
+def _fts_phrase(term: str) -> str:
+    # one quoted phrase: trigram tokens must appear together, i.e. a substring
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like(term: str):
+    # ILIKE on the column itself, which is what a pg_trgm index serves
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return API.api.ilike(f"%{escaped}%", escape="\\")
+
+
+def filter_by_url(session, query, term: str):
+    """``query`` over ``API`` narrowed to URLs containing ``term``,
+    case-insensitively, and the column to order and page it by.
+
+    With FTS5 that is the search table's rowid, i.e. ``API.id``: FTS5
+    yields matches in rowid order, so a page stops at its ``LIMIT``
+    instead of collecting and sorting every match of a common term.
+    """
+    if _backend(session) == "fts5" and len(term) >= SEARCH_MIN_INDEXED:
+        query = query.join(_api_search, _api_search.c.rowid == API.id)
+        return query.filter(_api_search.c.api_search.op("MATCH")(_fts_phrase(term))), _api_search.c.rowid
+    return query.filter(_like(term)), API.id
+
+
+def search_urls(session, term: str, limit: int = SEARCH_TYPEAHEAD_LIMIT) -> List[Dict[str, Any]]:
+    """Up to ``limit`` saved APIs whose URL contains ``term``, oldest first."""
+    limit = min(max(limit, 1), SEARCH_MAX_LIMIT)
+    query, key = filter_by_url(session, session.query(API.id, API.api), term)
+    rows = query.order_by(key).limit(limit)
+    return [{"id": api_id, "api": api_url} for api_id, api_url in rows]
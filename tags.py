@@ -1,5 +1,31 @@
+from collections import namedtuple
+
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from database import SessionLocal, Tag, API
+from counts import count_cache
+from database import SessionLocal, Tag, API, api_tags
+
+# detached copy of a tag, safe to keep in the count cache
+TagInfo = namedtuple("TagInfo", ["id", "name"])
+
+
+def tag_counts(db: Session, used_only: bool = False) -> list[tuple[TagInfo, int]]:
+    """Every tag, by name, with the number of APIs it is on, or with
+    ``used_only`` just the tags on at least one API; cached until a tag
+    change invalidates it."""
+    def compute():
+        rows = db.query(Tag.id, Tag.name, func.count(api_tags.c.api_id)).outerjoin(
+            api_tags, api_tags.c.tag_id == Tag.id
+        ).group_by(Tag.id).order_by(Tag.name).all()
+        return [(TagInfo(tag_id, name), count) for tag_id, name, count in rows]
+    counts = count_cache.get("tags", compute)
+    # what an inner join with api_tags would return
+    return [(tag, count) for tag, count in counts if count] if used_only else counts
+
+
+def invalidate_tag_counts() -> None:
+    count_cache.invalidate("tags")
+
 
 def get_or_create_tag(db: Session, name: str) -> Tag:
     tag = db.query(Tag).filter(Tag.name == name).first()
@@ -8,6 +34,7 @@ def get_or_create_tag(db: Session, name: str) -> Tag:
         db.add(tag)
         db.commit()
         db.refresh(tag)
+        invalidate_tag_counts()
     return tag
 
 def add_tags_to_api(db: Session, api_id: int, tag_names: list[str]) -> None:
@@ -21,6 +48,7 @@ def add_tags_to_api(db: Session, api_id: int, tag_names: list[str]) -> None:
             api.tags.append(tag)
     
     db.commit()
+    invalidate_tag_counts()
 
 def remove_tag_from_api(db: Session, api_id: int, tag_name: str) -> None:
     api = db.query(API).filter(API.id == api_id).first()
@@ -31,6 +59,7 @@ def remove_tag_from_api(db: Session, api_id: int, tag_name: str) -> None:
     if tag and tag in api.tags:
         api.tags.remove(tag)
         db.commit()
+        invalidate_tag_counts()
 
 def get_apis_by_tag(db: Session, tag_name: str) -> list[API]:
     return db.query(API).join(API.tags).filter(Tag.name == tag_name).all()
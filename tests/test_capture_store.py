@@ -0,0 +1,79 @@
+import multiprocessing
+
+from capture_store import CaptureStore, SharedCaptureBackend
+from parser import LazyBody
+
+PAYLOAD = {"data": {"items": [{"id": i, "name": f"item {i}"} for i in range(50)]}}
+
+
+def _worker(path):
+    return CaptureStore(backend=SharedCaptureBackend(path))
+
+
+def _put(store):
+    apis = [
+        {"url": "https://api.example/items", "status": 200, "data": PAYLOAD},
+        {"url": "https://api.example/empty", "status": 204, "data": None},
+    ]
+    return store.put("https://example.com", apis, {"requests": 2})
+
+
+def _read_in_child(path, capture_id, conn):
+    capture = _worker(path).get(capture_id)
+    conn.send(None if capture is None else capture.data("https://api.example/items"))
+
+
+def test_capture_made_on_one_worker_is_read_on_another(tmp_path):
+    path = str(tmp_path / "captures.db")
+    worker_a, worker_b = _worker(path), _worker(path)
+    capture = _put(worker_a)
+
+    seen = worker_b.get(capture.id)
+    assert seen is not None and seen is not capture
+    assert seen.site == "https://example.com"
+    assert seen.stats == {"requests": 2}
+    # bodies stay in the shared file until asked for
+    assert isinstance(seen.get("https://api.example/items")["data"], LazyBody)
+    assert seen.data("https://api.example/items") == PAYLOAD
+    assert seen.data("https://api.example/empty") is None
+    assert [a["url"] for a in seen.listing()] == ["https://api.example/items"]
+    assert seen.index("https://api.example/items").arrays == {"items": ["id", "name"]}
+    # the loaded copy is cached on worker B from then on
+    assert worker_b.get(capture.id) is seen
+
+
+def test_capture_is_read_from_another_process(tmp_path):
+    path = str(tmp_path / "captures.db")
+    capture = _put(_worker(path))
+
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=_read_in_child, args=(path, capture.id, child))
+    proc.start()
+    try:
+        assert parent.poll(60), "worker process did not answer"
+        assert parent.recv() == PAYLOAD
+    finally:
+        proc.join(timeout=10)
+
+
+def test_streamed_index_survives_the_shared_store(tmp_path):
+    path = str(tmp_path / "captures.db")
+    index = {"arrays": {"rows": ["a"]}, "id_objects": [], "model3": [], "paths": {"rows": ["array"]},
+             "numeric_paths": [], "array_steps": {}, "object_steps": {}, "root_type": "object"}
+    capture = _worker(path).put(None, [{"url": "upload", "data": {"rows": [{"a": 1}]}, "index": index}])
+
+    seen = _worker(path).get(capture.id)
+    assert seen.index("upload").arrays == {"rows": ["a"]}
+
+
+def test_unknown_and_expired_captures(tmp_path):
+    path = str(tmp_path / "captures.db")
+    assert _worker(path).get("missing") is None
+    assert _worker(path).get(None) is None
+
+    capture = _put(CaptureStore(backend=SharedCaptureBackend(path)))
+    expired = CaptureStore(backend=SharedCaptureBackend(path, ttl_s=-1))
+    assert expired.get(capture.id) is None
+    # the expired capture was deleted from the shared file
+    assert _worker(path).get(capture.id) is None
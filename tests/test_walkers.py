@@ -0,0 +1,133 @@
+import sys
+
+import pytest
+
+import parser
+
+SPORTS = {
+    "meta": {"source": "bench", "count": 1},
+    "data": {
+        "events": [{"id": 0, "name": "event 0", "live": True, "score": {"home": 0, "away": 2},
+                    "markets": [{"id": 0, "price": 1.5}, {"id": 1, "price": 1.6}]}],
+        "odds": {"100000": {"home": 1.9, "away": 4.1, "book": {"name": "b", "id": 0}}},
+    },
+}
+MIXED = {"a": {"b": [{"c": 1, "d": {"e": [1, 2]}}], "123": {"x": 1}}, "odds": {"1": {"p": 2}, "2": {"p": 3}}}
+TOP_LEVEL_LIST = [{"id": 1, "items": [{"k": "v"}]}, {"id": 2}]
+NESTED_IDS = {"root": {"10": {"name": "a", "markets": {"7": {"price": 1}}}}}
+NESTED_LISTS = {"empty": [], "nested": {"list": [[{"a": 1}]]}}
+
+
+def _ids(*objects):
+    return [{"object_name": name, "key_id": f"{name}_id", "keys_list": keys} for name, keys in objects]
+
+
+def _model3(*objects):
+    return [{"object_name": name, "keys_list": keys} for name, keys in objects]
+
+
+def _columns(*paths):
+    return [{"path": path, "dataType": "string", "columnName": path.rsplit("/", 1)[-1]} for path in paths]
+
+
+# what the original recursive walkers returned for each document
+CASES = [
+    (SPORTS, {
+        "find_arrays": {"events": ["id", "name", "live", "score", "markets"], "markets": ["id", "price"]},
+        "extract_id_objects": _ids(("odds", ["away", "book", "home"])),
+        "extract_objects_model3": _model3(
+            ("root", ["meta", "data"]), ("meta", ["source", "count"]), ("data", ["events", "odds"]),
+            ("odds", ["100000"]), ("100000", ["home", "away", "book"]), ("book", ["name", "id"]),
+        ),
+        "find_path_of_key": {"odds": None, "markets": "data.events.markets", "items": None},
+        "find_numeric_object_path": {"odds": "data.odds", "root": None, "markets": None, "": "data.odds"},
+        "build_columns_for_object": _columns(
+            "./meta/source", "./meta/count", "./data/events/id", "./data/events/name", "./data/events/live",
+            "./data/events/score/home", "./data/events/score/away", "./data/events/markets/id",
+            "./data/events/markets/price", "./data/odds/100000/home", "./data/odds/100000/away",
+            "./data/odds/100000/book/name", "./data/odds/100000/book/id",
+        ),
+    }),
+    (MIXED, {
+        "find_arrays": {"b": ["c", "d"]},
+        "extract_id_objects": _ids(("a", ["x"]), ("odds", ["p"])),
+        "extract_objects_model3": _model3(
+            ("root", ["a", "odds"]), ("a", ["b", "123"]), ("123", ["x"]),
+            ("odds", ["1", "2"]), ("1", ["p"]), ("2", ["p"]),
+        ),
+        "find_path_of_key": {"odds": None, "markets": None, "items": None},
+        "find_numeric_object_path": {"odds": "odds", "root": None, "markets": None, "": "a"},
+        "build_columns_for_object": _columns("./a/b/c", "./a/123/x", "./odds/1/p", "./odds/2/p"),
+    }),
+    (TOP_LEVEL_LIST, {
+        "find_arrays": {"root": ["id", "items"], "items": ["k"]},
+        "extract_id_objects": [],
+        "extract_objects_model3": [],
+        "find_path_of_key": {"odds": None, "markets": None, "items": "items"},
+        "find_numeric_object_path": {"odds": None, "root": None, "markets": None, "": None},
+    }),
+    (NESTED_IDS, {
+        "find_arrays": {},
+        "extract_id_objects": _ids(("root", ["markets", "name"]), ("markets", ["price"])),
+        "extract_objects_model3": _model3(
+            ("root", ["root"]), ("root", ["10"]), ("10", ["name", "markets"]),
+            ("markets", ["7"]), ("7", ["price"]),
+        ),
+        "find_path_of_key": {"odds": None, "markets": None, "items": None},
+        "find_numeric_object_path": {"odds": None, "root": "root", "markets": "root.10.markets", "": "root"},
+        "build_columns_for_object": _columns("./root/10/name", "./root/10/markets/7/price"),
+    }),
+    (NESTED_LISTS, {
+        "find_arrays": {"list": ["a"]},
+        "extract_id_objects": [],
+        "extract_objects_model3": _model3(("root", ["empty", "nested"]), ("nested", ["list"])),
+        "find_path_of_key": {"odds": None, "markets": None, "items": None},
+        "find_numeric_object_path": {"odds": None, "root": None, "markets": None, "": None},
+        "build_columns_for_object": [],
+    }),
+    ({}, {
+        "find_arrays": {},
+        "extract_id_objects": [],
+        "extract_objects_model3": _model3(("root", [])),
+        "find_path_of_key": {"odds": None, "markets": None, "items": None},
+        "find_numeric_object_path": {"odds": None, "root": None, "markets": None, "": None},
+        "build_columns_for_object": [],
+    }),
+    ([], {
+        "find_arrays": {},
+        "extract_id_objects": [],
+        "extract_objects_model3": [],
+        "find_path_of_key": {"odds": None, "markets": None, "items": None},
+        "find_numeric_object_path": {"odds": None, "root": None, "markets": None, "": None},
+    }),
+]
+
+
+@pytest.mark.parametrize("data, expected", CASES)
+def test_walkers_match_the_recursive_originals(data, expected):
+    assert parser.find_arrays(data) == expected["find_arrays"]
+    assert parser.extract_id_objects(data) == expected["extract_id_objects"]
+    assert parser.extract_objects_model3(data) == expected["extract_objects_model3"]
+    for key, path in expected["find_path_of_key"].items():
+        assert parser.find_path_of_key(data, key) == path
+    for name, path in expected["find_numeric_object_path"].items():
+        assert parser.find_numeric_object_path(data, name) == path
+    if "build_columns_for_object" in expected:
+        assert parser.build_columns_for_object(data) == expected["build_columns_for_object"]
+
+
+def test_deep_nesting_walks_past_the_recursion_limit():
+    levels = sys.getrecursionlimit() * 2
+    deep = {}
+    cur = deep
+    for _ in range(levels):
+        cur["next"] = {"1": {"v": 1}}
+        cur = cur["next"]
+
+    assert parser.extract_id_objects(deep) == _ids(("next", ["v"]))
+    assert parser.find_path_of_key(deep, "missing") is None
+    assert parser.find_arrays(deep) == {}
+    assert parser.find_numeric_object_path(deep, "next") == "next"
+    assert parser.extract_objects_model3(deep) == _model3(
+        ("root", ["next"]), ("next", ["1", "next"]), ("1", ["v"]), ("next", ["1"]),
+    )
@@ -0,0 +1,187 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Dict, List, Optional
+
+TREE_PAGE_SIZE = int(os.getenv("TREE_PAGE_SIZE", "200"))
+# longer strings are cut in node listings
+TREE_STRING_PREVIEW = int(os.getenv("TREE_STRING_PREVIEW", "200"))
+# parsed stored responses kept for paging through them
+TREE_DOCUMENT_CACHE = int(os.getenv("TREE_DOCUMENT_CACHE", "8"))
+
+# content hash, or a captured response's key -> [document, container sizes
+# by id, None until a viewer asks]; holding the document keeps every node
+# alive and so its id valid
+_documents: "OrderedDict[str, list]" = OrderedDict()
+_documents_lock = threading.Lock()
+_compact = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def _remember(key: str, data: Any) -> list:
+    # with _documents_lock held
+    entry = _documents.get(key)
+    if entry is None or entry[0] is not data:
+        entry = _documents[key] = [data, None]
+    _documents.move_to_end(key)
+    while len(_documents) > max(TREE_DOCUMENT_CACHE, 1):
+        _documents.popitem(last=False)
+    return entry
+
+
+def parse_stored(key: Optional[str], load: Callable[[], str]) -> Any:
+    """A stored response parsed, memoized by its content hash ``key`` so
+    paging through a large one reads, decompresses and parses it once.
+    ``load`` returns the body; without a key it is hashed to make one."""
+    text = None
+    if key is None:
+        text = load()
+        key = hashlib.sha1(text.encode()).hexdigest()
+    with _documents_lock:
+        if key in _documents:
+            _documents.move_to_end(key)
+            return _documents[key][0]
+    data = json.loads(text if text is not None else load())
+    with _documents_lock:
+        return _remember(key, data)[0]
+
+
+def resolve_node(data: Any, path: List[Any]) -> Any:
+    """The value at a list of keys and positions; ``KeyError`` if there is none."""
+    cur = data
+    for step in path:
+        if isinstance(cur, dict) and isinstance(step, str) and step in cur:
+            cur = cur[step]
+        elif isinstance(cur, list) and isinstance(step, int) and -len(cur) <= step < len(cur):
+            cur = cur[step]
+        else:
+            raise KeyError(step)
+    return cur
+
+
+def _kind(value: Any) -> str:
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return "null"
+
+
+def subtree_sizes(data: Any) -> Dict[int, int]:
+    """The compact JSON size of every container in ``data``, by id, from one
+    post-order pass: a container is its brackets, commas and keys plus its
+    members, and a nested container adds its own total to its parent's, so
+    nothing is measured twice."""
+    sizes: Dict[int, int] = {}
+    if not isinstance(data, (dict, list)):
+        return sizes
+
+    def open_frame(node):
+        if not node:
+            return [node, iter(()), 2]
+        if isinstance(node, dict):
+            # each key is quoted and followed by a colon
+            return [node, iter(node.values()), 1 + 2 * len(node) + sum(map(len, map(encode_basestring_ascii, node)))]
+        return [node, iter(node), 1 + len(node)]
+
+    stack = [open_frame(data)]
+    while stack:
+        frame = stack[-1]
+        size = 0
+        for value in frame[1]:
+            # what json.dumps writes, measured without serializing
+            kind = type(value)
+            if kind is str:
+                size += len(encode_basestring_ascii(value))
+            elif kind is dict or kind is list:
+                frame[2] += size
+                stack.append(open_frame(value))
+                break
+            elif kind is int:
+                size += len(int.__repr__(value))
+            elif kind is float and value - value == 0:
+                size += len(float.__repr__(value))
+            elif kind is bool:
+                size += 4 if value else 5
+            elif value is None:
+                size += 4
+            else:
+                # NaN and the infinities, or a subclass
+                size += len(_compact(value))
+        else:
+            stack.pop()
+            total = sizes[id(frame[0])] = frame[2] + size
+            if stack:
+                stack[-1][2] += total
+    return sizes
+
+
+def _document_sizes(data: Any, node: Any, key: Optional[str]) -> Dict[int, int]:
+    """Container sizes for ``node``, a node of ``data``: computed once per
+    document in the document cache (found by ``key``, or by identity for
+    one parsed by :func:`parse_stored`), else just for ``node``'s subtree."""
+    with _documents_lock:
+        if key is not None:
+            entry = _remember(key, data)
+        else:
+            entry = next((e for e in _documents.values() if e[0] is data), None)
+        sizes = entry[1] if entry is not None else None
+    if entry is None:
+        return subtree_sizes(node)
+    if sizes is None:
+        # outside the lock; a concurrent first expand just does it twice
+        sizes = entry[1] = subtree_sizes(data)
+    return sizes
+
+
+def _child(key: Any, value: Any, sizes: Dict[int, int]) -> Dict[str, Any]:
+    child = {"key": key, "type": _kind(value)}
+    if isinstance(value, (dict, list)):
+        child["count"] = len(value)
+        child["bytes"] = sizes[id(value)]
+    elif isinstance(value, str) and len(value) > TREE_STRING_PREVIEW:
+        child["value"] = value[:TREE_STRING_PREVIEW]
+        child["truncated"] = True
+        child["bytes"] = len(value)
+    else:
+        child["value"] = value
+    return child
+
+
+def node_page(data: Any, path: List[Any], offset: int = 0, limit: Optional[int] = None,
+              key: Optional[str] = None) -> Dict[str, Any]:
+    """One page of a node's children, each with its type and either its
+    (scalar) value or its child count and compact JSON size, so a viewer
+    can expand the tree one node at a time. ``key`` names a document that
+    did not come from :func:`parse_stored` (a capture's response), so its
+    sizes are cached alongside the stored ones."""
+    limit = limit or TREE_PAGE_SIZE
+    node = resolve_node(data, path)
+    if isinstance(node, dict):
+        items = list(islice(node.items(), offset, offset + limit))
+        count = len(node)
+    elif isinstance(node, list):
+        items = list(enumerate(node[offset:offset + limit], offset))
+        count = len(node)
+    else:
+        return {"path": path, "type": _kind(node), "count": 0, "offset": 0, "children": [],
+                "value": node, "next_offset": None}
+    end = offset + len(items)
+    sizes = _document_sizes(data, node, key)
+    return {
+        "path": path,
+        "type": _kind(node),
+        "count": count,
+        "offset": offset,
+        "children": [_child(k, v, sizes) for k, v in items],
+        "next_offset": end if end < count else None,
+    }